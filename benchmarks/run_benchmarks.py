@@ -0,0 +1,324 @@
+# ==========================================
+# OFFLINE BENCHMARK SUITE
+# Times every stage of the PDF RAG pipeline on synthetic corpora (1k to 1M chunks) with stub models:
+# throughput, p50/p99 latency and peak memory per stage, saved as JSON to compare commits.
+# CPU only, no network: python benchmarks/run_benchmarks.py --sizes 1000 10000 --output results/HEAD.json
+# ==========================================
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path[:0] = [BENCHMARKS_DIR, os.path.join(REPO_DIR, "pdf"), REPO_DIR]
+
+import synthetic
+from stubs import StubEmbedder, StubChatClient, install_tokenizer
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_QUERIES = 1000
+MAX_PDF_PAGES = 2000    # Extraction is timed on at most this many pages (PDF writing dominates above)
+CONTEXT_CHUNKS = 40     # Ranked chunks handed to trim_context: more than the 4000-token budget holds
+LESSON_PAGES = 20       # Pages per PDFProcessor.process_documents call
+REGRESSION_RATIO = 0.9  # --compare flags a throughput below 90% of the baseline
+CORPUS_FILE = "corpus.json"  # Chunks of the current size, written to the scratch directory for the stage workers
+
+STAGES = ["extract_text_from_pdf", "build_faiss_index", "build_faiss_index_warm", "retrieve_relevant_chunks",
+          "retrieve_relevant_chunks_hybrid", "trim_context", "generate_answer", "process_documents"]
+
+# Set in each stage worker by _run_stage, from the corpus file and settings it is given
+_corpus = {}
+_settings = {}
+
+# ==========================================
+# MEMORY AND TIMING
+# ==========================================
+def _status_kb(field):
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_memory():
+    """Resets the process peak RSS to the current RSS (Linux); returns the baseline in KB."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return _status_kb("VmRSS")
+    except OSError:
+        return None
+
+def _peak_memory_mb(baseline_kb):
+    """Memory added at the peak since the reset (process peak RSS when the kernel cannot reset it)."""
+    peak_kb = _status_kb("VmHWM")
+    if baseline_kb is None or peak_kb is None:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return max(0, peak_kb - baseline_kb) / 1024
+
+class Timer:
+    """Per-call latencies of a stage, plus the peak memory it added."""
+    def __init__(self):
+        self.latencies = []
+        self.items = 0
+        self.baseline_kb = _reset_peak_memory()
+        self.start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def call(self, items=1):
+        start_time = time.perf_counter()
+        yield
+        self.latencies.append(time.perf_counter() - start_time)
+        self.items += items
+
+    def result(self, **extra):
+        seconds = sum(self.latencies)
+        latencies_ms = np.array(self.latencies) * 1000
+        return {"items": self.items, "calls": len(self.latencies), "seconds": round(seconds, 4),
+                "throughput": round(self.items / seconds, 1) if seconds else None,
+                "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+                "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+                "peak_mb": round(_peak_memory_mb(self.baseline_kb), 1), **extra}
+
+# ==========================================
+# PIPELINE SETUP (IN THE STAGE WORKER)
+# ==========================================
+def _import_pipeline():
+    """Imports pdf.py with the stub embedder, a fresh embedding cache (per worker) and the stub GPT-4 client."""
+    import context
+    tokenizer = install_tokenizer(context)  # Before pdf.py: its ContextPacker counts tokens on import
+    import pdf as rag
+    rag.embedding_model = StubEmbedder()
+    rag.EMBEDDING_CACHE_PATH = os.path.join(os.getcwd(), f"embedding_cache_{os.getpid()}.sqlite")  # Opened on first use
+    rag.openai_client = StubChatClient(_settings["llm_latency_ms"])
+    return rag, tokenizer
+
+def _questions(chunks):
+    return synthetic.make_questions(chunks, _settings["queries"], seed=_settings["seed"] + 1)
+
+def _ranked_chunk_lists(chunks, count):
+    rng = np.random.default_rng(_settings["seed"] + 2)
+    return [[chunks[i] for i in rng.integers(0, len(chunks), size=CONTEXT_CHUNKS)] for _ in range(count)]
+
+# ==========================================
+# STAGES (ONE WORKER PROCESS EACH)
+# ==========================================
+def bench_extract_text_from_pdf(size):
+    rag, _ = _import_pipeline()
+    paths = sorted(os.path.join(_settings["pdf_dir"], name) for name in os.listdir(_settings["pdf_dir"]))
+    timer = Timer()
+    for path in paths:
+        with timer.call(items=synthetic.PAGES_PER_PDF):
+            rag.extract_text_from_pdf(path)
+    return timer.result(unit="pages")
+
+def bench_build_faiss_index(size, warm=False):
+    rag, _ = _import_pipeline()
+    chunks = _corpus["chunks"]
+    if warm:
+        rag.build_faiss_index(chunks)  # Fills the embedding cache: the timed build reads every vector back
+    timer = Timer()
+    with timer.call(items=len(chunks)):
+        rag.build_faiss_index(chunks)
+    return timer.result(unit="chunks")
+
+def bench_build_faiss_index_warm(size):
+    return bench_build_faiss_index(size, warm=True)
+
+def bench_retrieve_relevant_chunks(size, hybrid=False):
+    rag, _ = _import_pipeline()
+    from bm25 import BM25Index
+    chunks = _corpus["chunks"]
+    index, _ = rag.build_faiss_index(chunks)
+    keyword_index = BM25Index.build(chunks) if hybrid else None
+    questions = _questions(chunks)
+    timer = Timer()
+    for question in questions:
+        with timer.call():
+            rag.retrieve_relevant_chunks(question, index, chunks, min_score=0.0, keyword_index=keyword_index)
+    return timer.result(unit="queries")
+
+def bench_retrieve_relevant_chunks_hybrid(size):
+    return bench_retrieve_relevant_chunks(size, hybrid=True)
+
+def bench_trim_context(size):
+    rag, _ = _import_pipeline()
+    chunks = _corpus["chunks"]
+    rag.context_packer.register(chunks)
+    timer = Timer()
+    for ranked in _ranked_chunk_lists(chunks, _settings["queries"]):
+        with timer.call():
+            rag.trim_context(ranked)
+    return timer.result(unit="contexts")
+
+def bench_generate_answer(size):
+    rag, _ = _import_pipeline()
+    chunks = _corpus["chunks"]
+    rag.context_packer.register(chunks)
+    timer = Timer()
+    for question, ranked in zip(_questions(chunks), _ranked_chunk_lists(chunks, _settings["queries"])):
+        with timer.call():
+            rag.generate_answer(question, ranked)
+    return timer.result(unit="answers", llm_latency_ms=_settings["llm_latency_ms"])
+
+def bench_process_documents(size):
+    """PDFProcessor.process_documents of the teaching assistant, one lesson (LESSON_PAGES pages) per call."""
+    try:
+        sys.path.insert(0, os.path.join(REPO_DIR, "teaching_assistant"))
+        from teaching_assistant import PDFProcessor
+        from langchain_core.documents import Document
+    except ImportError as e:
+        return {"skipped": f"teaching_assistant cannot be imported ({e})"}
+    pages = synthetic.make_pages(_corpus["chunks"])
+    documents = [Document(page_content=text, metadata={"source": f"lesson_{i // LESSON_PAGES}.pdf", "page": i % LESSON_PAGES})
+                 for i, text in enumerate(pages)]
+    processor = PDFProcessor(os.getcwd())
+    timer = Timer()
+    for start in range(0, len(documents), LESSON_PAGES):
+        with timer.call(items=len(documents[start:start + LESSON_PAGES])):
+            processor.process_documents(documents[start:start + LESSON_PAGES])
+    return timer.result(unit="pages")
+
+def _run_stage(stage, size, corpus_path, settings):
+    """
+    Stage entry point in the worker: loads the corpus and settings it is given (nothing is inherited from the parent),
+    then runs quietly (the pipeline prints per call) in the scratch directory.
+    """
+    _settings.update(settings)
+    with open(corpus_path, "r", encoding="utf-8") as file:
+        _corpus["chunks"] = json.load(file)
+    os.chdir(_settings["workdir"])
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            return globals()[f"bench_{stage}"](size)
+        except ImportError as e:  # The PDF pipeline's own dependencies are required
+            return {"skipped": f"missing dependency ({e})"}
+
+# ==========================================
+# RUNNER
+# ==========================================
+def _git_commit():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _metadata(args):
+    import faiss
+    import context
+    return {
+        "commit": _git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", None),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "queries": args.queries,
+        "embedder": StubEmbedder.name,
+        "tokenizer": install_tokenizer(context),
+        "llm_latency_ms": args.llm_latency_ms,
+    }
+
+def _pool_context():
+    """Spawn: every stage starts from a fresh interpreter, with no module, cache or allocator state of the parent."""
+    return multiprocessing.get_context("spawn")
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    corpus_path = os.path.join(workdir, CORPUS_FILE)
+    settings = {"workdir": workdir, "pdf_dir": os.path.join(workdir, "pdfs"), "queries": args.queries,
+                "seed": args.seed, "llm_latency_ms": args.llm_latency_ms}
+    os.environ.setdefault("OPENAI_API_KEY", "stub")  # pdf.py asks for a key on import otherwise
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    report = {"metadata": _metadata(args), "results": []}
+    try:
+        for size in args.sizes:
+            start_time = time.perf_counter()
+            chunks = synthetic.make_chunks(size, seed=args.seed)
+            with open(corpus_path, "w", encoding="utf-8") as file:
+                json.dump(chunks, file)
+            shutil.rmtree(settings["pdf_dir"], ignore_errors=True)
+            synthetic.write_pdfs(settings["pdf_dir"], chunks[:args.max_pdf_pages * synthetic.CHUNKS_PER_PAGE])
+            print(f"\nCorpus of {size} chunks generated in {time.perf_counter() - start_time:.1f}s.")
+            for stage in args.stages:
+                # One fresh process per stage: no warm caches or allocator state carried over, and its own peak memory
+                with ProcessPoolExecutor(max_workers=1, mp_context=_pool_context()) as executor:
+                    result = executor.submit(_run_stage, stage, size, corpus_path, settings).result()
+                result = {"stage": stage, "size": size, **result}
+                report["results"].append(result)
+                print(format_result(result))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+def format_result(result):
+    if "skipped" in result:
+        return f"  {result['stage']:<32} {result['size']:>8}  skipped: {result['skipped']}"
+    return (f"  {result['stage']:<32} {result['size']:>8}  {result['throughput'] or 0:>11,.1f} {result['unit']}/s  "
+            f"p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms  peak {result['peak_mb']:>8.1f} MB")
+
+def compare(report, baseline):
+    """Prints the throughput and p99 of every stage relative to a baseline report."""
+    previous = {(result["stage"], result["size"]): result for result in baseline["results"] if "skipped" not in result}
+    print(f"\nCompared with {baseline['metadata'].get('commit')} ({baseline['metadata'].get('date')}):")
+    if baseline["metadata"].get("tokenizer") != report["metadata"]["tokenizer"]:
+        print("  Warning: different tokenizers, token-bound stages are not comparable.")
+    regressions = 0
+    for result in report["results"]:
+        old = previous.get((result["stage"], result["size"]))
+        if old is None or "skipped" in result or not old["throughput"] or not result["throughput"]:
+            continue
+        ratio = result["throughput"] / old["throughput"]
+        flag = "  <-- slower" if ratio < REGRESSION_RATIO else ""
+        regressions += bool(flag)
+        print(f"  {result['stage']:<32} {result['size']:>8}  throughput x{ratio:.2f}  "
+              f"p99 {old['p99_ms']:.3f} -> {result['p99_ms']:.3f} ms  "
+              f"peak {old['peak_mb']:.1f} -> {result['peak_mb']:.1f} MB{flag}")
+    return regressions
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the PDF RAG pipeline on synthetic corpora.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Corpus sizes in chunks (up to 1000000)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--queries", type=int, default=DEFAULT_QUERIES, help="Questions (and contexts) timed per stage")
+    parser.add_argument("--max-pdf-pages", type=int, default=MAX_PDF_PAGES, help="Pages written to PDF for extraction")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="Simulated latency of the stub GPT-4 client")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON report of an earlier run to compare with")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    report = run(args)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            regressions = compare(report, json.load(file))
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
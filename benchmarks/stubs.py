@@ -0,0 +1,84 @@
+# ==========================================
+# STUB MODELS
+# Deterministic, CPU-only stand-ins for the embedding model, the GPT-4 client and (when the
+# tiktoken files cannot be downloaded) the tokenizer: benchmarks measure the pipeline, not the models.
+# ==========================================
+import re
+import time
+import zlib
+from types import SimpleNamespace
+import numpy as np
+
+EMBEDDING_DIMENSION = 384  # Same as all-MiniLM-L6-v2, so index sizes and search costs match
+_WORD = re.compile(r"\w+")
+
+class StubEmbedder:
+    """
+    Hashing-trick embeddings: every word adds ±1 to a dimension picked by its crc32, so texts sharing words
+    are close and the same text always gets the same vector. Same `encode` signature as SentenceTransformer.
+    """
+    name = f"stub-hash-{EMBEDDING_DIMENSION}"
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION):
+        self.dimension = dimension
+
+    def encode(self, texts, convert_to_numpy=True, normalize_embeddings=False, show_progress_bar=False, batch_size=32):
+        if isinstance(texts, str):
+            texts = [texts]
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in _WORD.findall(text.lower())), dtype=np.uint32)
+            np.add.at(vectors[row], hashes % self.dimension, np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32))
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1.0, norms)
+        return vectors
+
+class StubChatClient:
+    """
+    Replaces openai.Client: `chat.completions.create` answers with the first sentence of the prompt's
+    context after `latency_ms` (0 by default, to time only the code around the call).
+    """
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        prompt = messages[-1]["content"]
+        context = prompt.split("Context:", 1)[-1].strip()
+        answer = re.split(r"(?<=[.!?])\s", context, maxsplit=1)[0][:200] or "I don't know based on the provided documents."
+        if stream:
+            return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+                         for word in re.findall(r"\S+\s*", answer)])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))],
+                               usage=SimpleNamespace(prompt_tokens=len(prompt) // 4, completion_tokens=len(answer) // 4))
+
+class StubEncoding:
+    """
+    Whitespace tokenizer with the tiktoken methods the context packer uses (one token per word and
+    its trailing spaces, so decode(encode(text)) == text). Only used when tiktoken cannot load offline.
+    """
+    name = "stub-whitespace"
+    _TOKEN = re.compile(r"\s+|\S+\s*")
+
+    def encode_ordinary(self, text):
+        return self._TOKEN.findall(text)
+
+    def encode_ordinary_batch(self, texts):
+        return [self.encode_ordinary(text) for text in texts]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+def install_tokenizer(context_module):
+    """Makes sure `context.get_encoding` works offline; returns the name of the tokenizer in use."""
+    try:
+        return context_module.get_encoding().name
+    except Exception:
+        encoding = StubEncoding()
+        context_module.get_encoding = lambda model=context_module.ENCODING_MODEL: encoding
+        return encoding.name
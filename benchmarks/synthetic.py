@@ -0,0 +1,131 @@
+# ==========================================
+# SYNTHETIC CORPORA
+# Deterministic text chunks, questions, pages and PDFs of any size, so benchmark runs
+# are reproducible and comparable across commits without shipping real documents.
+# ==========================================
+import os
+import numpy as np
+
+VOCABULARY_SIZE = 20000
+ZIPF_EXPONENT = 1.1           # Word frequencies follow a Zipf law, like natural text (matters for BM25)
+WORDS_PER_CHUNK = (60, 120)   # Uniform range
+WORDS_PER_SENTENCE = (8, 20)
+CHUNKS_PER_PAGE = 6
+PAGES_PER_PDF = 20
+GENERATION_BLOCK = 10000      # Chunks generated at once, to bound memory on 1M-chunk corpora
+
+_SYLLABLES = ["ka", "to", "ri", "mu", "sen", "la", "vo", "dex", "pli", "nor", "qua", "bi", "tes", "ran", "gu", "fe"]
+
+def vocabulary(size=VOCABULARY_SIZE):
+    """Pronounceable pseudo-words, the same for every run."""
+    words, n = [], len(_SYLLABLES)
+    for i in range(size):
+        word, j = "", i + n
+        while j:
+            word += _SYLLABLES[j % n]
+            j //= n
+        words.append(word)
+    return words
+
+def _word_probabilities(size):
+    weights = 1.0 / np.arange(1, size + 1) ** ZIPF_EXPONENT
+    return weights / weights.sum()
+
+def iter_chunks(count, seed=0):
+    """Yields `count` chunks of a few sentences each; the same seed yields the same corpus."""
+    words = np.array(vocabulary())
+    probabilities = _word_probabilities(len(words))
+    rng = np.random.default_rng(seed)
+    for start in range(0, count, GENERATION_BLOCK):
+        block = min(GENERATION_BLOCK, count - start)
+        lengths = rng.integers(*WORDS_PER_CHUNK, size=block, endpoint=True)
+        ids = rng.choice(len(words), size=int(lengths.sum()), p=probabilities).astype(np.int32)
+        offset = 0
+        for length in lengths:
+            chunk_words = words[ids[offset:offset + length]]
+            offset += length
+            sentences, position = [], 0
+            while position < length:
+                size = int(rng.integers(*WORDS_PER_SENTENCE, endpoint=True))
+                sentence = " ".join(chunk_words[position:position + size])
+                sentences.append(sentence[0].upper() + sentence[1:] + ".")
+                position += size
+            yield " ".join(sentences)
+
+def make_chunks(count, seed=0):
+    return list(iter_chunks(count, seed))
+
+def make_questions(chunks, count, seed=1, words=6):
+    """Questions built from words of random chunks, so dense and keyword retrieval both have something to find."""
+    rng = np.random.default_rng(seed)
+    questions = []
+    for i in rng.integers(0, len(chunks), size=count):
+        chunk_words = chunks[i].rstrip(".").replace(".", "").split()
+        picked = rng.choice(len(chunk_words), size=min(words, len(chunk_words)), replace=False)
+        questions.append("What about " + " ".join(chunk_words[j] for j in sorted(picked)) + "?")
+    return questions
+
+def make_pages(chunks, chunks_per_page=CHUNKS_PER_PAGE):
+    """Groups chunks into page texts, paragraphs separated by blank lines."""
+    return ["\n\n".join(chunks[i:i + chunks_per_page]) for i in range(0, len(chunks), chunks_per_page)]
+
+# ==========================================
+# MINIMAL PDF WRITER
+# ==========================================
+LINE_CHARS = 90
+LINES_PER_PAGE = 64
+
+def _wrap(text, width=LINE_CHARS):
+    lines = []
+    for paragraph in text.split("\n\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + 1 + len(word) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    return lines
+
+def _escape(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path, pages):
+    """Writes a text PDF (Helvetica, one page per entry of `pages`, long pages continued on extra PDF pages)."""
+    page_lines = []
+    for text in pages:
+        lines = _wrap(text)
+        page_lines.extend(lines[i:i + LINES_PER_PAGE] for i in range(0, len(lines), LINES_PER_PAGE))
+
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in page_lines:
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       b"/Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{k} 0 R" for k in kids).encode(), len(kids))
+
+    out, offsets = bytearray(b"%PDF-1.4\n"), []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as file:
+        file.write(out)
+
+def write_pdfs(directory, chunks, pages_per_pdf=PAGES_PER_PDF):
+    """Writes the chunks as PDFs of `pages_per_pdf` pages into `directory`; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    pages = make_pages(chunks)
+    paths = []
+    for i in range(0, len(pages), pages_per_pdf):
+        paths.append(os.path.join(directory, f"synthetic_{i // pages_per_pdf:05d}.pdf"))
+        write_pdf(paths[-1], pages[i:i + pages_per_pdf])
+    return paths
@@ -0,0 +1,74 @@
+# ==========================================
+# EMBEDDING CACHE
+# Content-addressed store of embeddings in SQLite: a chunk that was already embedded
+# by the same model (in this corpus, another PDF or a previous run) is never encoded again.
+# Shared by the pdf pipeline and the teaching assistant (through a LangChain adapter).
+# ==========================================
+import hashlib
+import re
+import sqlite3
+import threading
+import numpy as np
+
+# SQLite limits the number of parameters per query
+_LOOKUP_BATCH = 500
+
+def normalize_text(text):
+    """Whitespace-insensitive form of a chunk, so re-extracted text with different spacing still hits."""
+    return re.sub(r"\s+", " ", text).strip()
+
+class EmbeddingCache:
+    """Maps sha256(model id + normalized text) to a float32 vector blob."""
+    def __init__(self, path, model_id):
+        self.path = path
+        self.model_id = model_id
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL)")
+        self.hits = self.misses = 0
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_id}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+    def _get_many(self, keys):
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self.connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch)
+                found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def _put_many(self, items):
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                        [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items])
+
+    def embed(self, texts, embed_fn):
+        """
+        Returns float32 vectors for `texts`, calling `embed_fn` only for texts not cached yet.
+        Duplicates inside the batch are embedded once.
+        """
+        keys = [self.key(text) for text in texts]
+        unique = {}
+        for key, text in zip(keys, texts):
+            unique.setdefault(key, text)
+
+        vectors = self._get_many(list(unique))
+        missing = [key for key in unique if key not in vectors]
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            new_vectors = np.asarray(embed_fn([unique[key] for key in missing]), dtype=np.float32)
+            self._put_many(zip(missing, new_vectors))
+            vectors.update(zip(missing, new_vectors))
+
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,110 @@
+# ==========================================
+# PARALLEL PDF TEXT EXTRACTION
+# Fans PDFs (and page ranges of large PDFs) out over a process pool,
+# streaming the extracted pages back in their original order.
+# Shared by the pdf pipeline and the teaching assistant.
+# ==========================================
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import PyPDF2
+
+# Large PDFs are split into ranges of this many pages so one file can use several cores
+PAGES_PER_TASK = 32
+
+# ==========================================
+# WORKER FUNCTIONS (RUN IN CHILD PROCESSES)
+# ==========================================
+def _count_pages(pdf_path):
+    """Returns the number of pages of a PDF, or the exception raised while opening it."""
+    try:
+        with open(pdf_path, "rb") as file:
+            return len(PyPDF2.PdfReader(file).pages)
+    except Exception as e:
+        return e
+
+def _extract_page_range(pdf_path, start, stop):
+    """Extracts the text of pages [start, stop) of a PDF."""
+    with open(pdf_path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+# ==========================================
+# PARALLEL PIPELINE
+# ==========================================
+def _pool_context():
+    """
+    Avoids fork: the pool is started from the ingestion thread of a process already running
+    torch/OpenMP threads, whose locks a forked child could inherit held. A fork server (where available)
+    imports the calling script and PyPDF2 once, then forks each worker from that clean single-threaded process.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["__main__", __name__])
+    return context
+
+def iter_pdf_pages(pdf_files, max_workers=None, pages_per_task=PAGES_PER_TASK):
+    """
+    Yields (pdf_path, page_number, text) for every page of `pdf_files`, in file and page order.
+    A PDF that fails to open or parse is logged and skipped without stopping the others; its pages are only
+    yielded once all of them are extracted, so a failure never leaves half a file indexed.
+    At most a few tasks per worker are in flight (plus the pages of the PDF in progress), so memory stays bounded.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    start_time, page_total, failed = time.perf_counter(), 0, set()
+
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as executor:
+        page_counts = executor.map(_count_pages, pdf_files, chunksize=8)
+        tasks = []
+        for pdf_path, count in zip(pdf_files, page_counts):
+            if isinstance(count, Exception):
+                print(f"\nSkipping {pdf_path}: {count}")
+                failed.add(pdf_path)
+                continue
+            tasks.extend((pdf_path, start, min(start + pages_per_task, count), start + pages_per_task >= count)
+                         for start in range(0, count, pages_per_task))
+
+        pending, next_task, file_pages = deque(), 0, []  # file_pages: extracted pages of the file in progress
+        while pending or next_task < len(tasks):
+            # Keep the pool busy while only holding a bounded number of results in memory
+            while next_task < len(tasks) and len(pending) < 2 * max_workers:
+                pdf_path, start, stop, last = tasks[next_task]
+                pending.append((pdf_path, start, last, executor.submit(_extract_page_range, pdf_path, start, stop)))
+                next_task += 1
+
+            pdf_path, start, last, future = pending.popleft()
+            try:
+                pages = future.result()
+            except Exception as e:
+                if pdf_path not in failed:
+                    print(f"\nFailed to extract {pdf_path} (from page {start + 1}): {e}")
+                failed.add(pdf_path)
+                file_pages = []
+                continue
+            if pdf_path in failed:
+                continue  # An earlier range of this file failed; drop the rest of it too
+            file_pages.extend(pages)
+            if last:
+                for page_number, text in enumerate(file_pages):
+                    yield pdf_path, page_number, text
+                page_total += len(file_pages)
+                file_pages = []
+
+    elapsed = time.perf_counter() - start_time
+    print(f"\nExtracted {page_total} pages from {len(pdf_files) - len(failed)} PDFs in {elapsed:.1f}s "
+          f"({page_total / elapsed if elapsed else 0:.1f} pages/s, {max_workers} workers).\n")  # Debugging
+
+def extract_pdfs(pdf_files, max_workers=None):
+    """Yields (pdf_path, text) per PDF, with pages joined as in `extract_text_from_pdf`."""
+    current_path, pages = None, []
+    for pdf_path, _, text in iter_pdf_pages(pdf_files, max_workers=max_workers):
+        if pdf_path != current_path:
+            if current_path is not None:
+                yield current_path, "\n".join(pages).strip()
+            current_path, pages = pdf_path, []
+        pages.append(text)
+    if current_path is not None:
+        yield current_path, "\n".join(pages).strip()
@@ -0,0 +1,212 @@
+# ==========================================
+# DAILY DIGEST (MAP-REDUCE)
+# The day's emails are grouped by thread, packed into token-budgeted batches and summarized
+# concurrently (map), then the partial summaries are merged into one structured digest (reduce).
+# The number of LLM rounds grows with log(emails), not with the number of emails.
+# ==========================================
+import json
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BATCH_TOKENS = 3000         # Email text per map call
+MAX_MESSAGE_TOKENS = 1000   # A longer email is cut to this many tokens
+REDUCE_FANOUT = 8           # Partial summaries merged per reduce call
+MAX_CONCURRENT_CALLS = 16   # LLM calls in flight at once
+CHARS_PER_TOKEN = 4         # Budget estimate: no tokenizer download, so it also works offline
+
+DIGEST_FIELDS = ("highlights", "action_items", "threads")
+
+MAP_PROMPT = """Summarize the following emails, grouped by thread.
+For each thread give one line: the subject, who is involved, what happened, and any action expected from me.
+Be concise; skip newsletters and notifications unless they need action.
+
+{emails}"""
+
+REDUCE_PROMPT = """Merge these partial email summaries into one, keeping every thread and action item, without repetition.
+
+{summaries}"""
+
+FINAL_PROMPT = """Write my daily email digest from these summaries.
+Answer with a JSON object only:
+{{"highlights": [the 3-5 most important points], "action_items": [what I must do, with the sender],
+"threads": [{{"subject": ..., "summary": one sentence}}]}}
+
+{summaries}"""
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+# ==========================================
+# GROUPING AND BATCHING
+# ==========================================
+def group_messages(messages):
+    """Groups messages by thread (sender when there is no thread), threads in order of their latest message."""
+    groups = {}
+    for message in sorted(messages, key=lambda m: m["date"] or 0):
+        groups.setdefault(message["thread"] or message["from"], []).append(message)
+    return sorted(groups.values(), key=lambda group: group[-1]["date"] or 0, reverse=True)
+
+def format_message(message, max_tokens=MAX_MESSAGE_TOKENS):
+    body = message["body"]
+    if estimate_tokens(body) > max_tokens:
+        body = body[:max_tokens * CHARS_PER_TOKEN] + " [...]"
+    attachments = "".join(f"\n[Attachment: {a['filename']}]" for a in message["attachments"])
+    return f"From: {message['from']}\nSubject: {message['subject']}\n{body}{attachments}"
+
+def pack_batches(groups, budget=BATCH_TOKENS):
+    """
+    Packs whole threads into batches of at most `budget` tokens (a thread larger than the budget
+    is split across consecutive batches), so each map call sees related messages together.
+    """
+    batches, current, used = [], [], 0
+
+    def flush():
+        nonlocal current, used
+        batches.append("\n\n---\n\n".join(current))
+        current, used = [], 0
+
+    for group in groups:
+        texts = [format_message(message) for message in group]
+        tokens = [estimate_tokens(text) for text in texts]
+        if current and used + sum(tokens) > budget:  # Start a new batch rather than splitting a thread that fits in one
+            flush()
+        for text, count in zip(texts, tokens):
+            if current and used + count > budget:
+                flush()
+            current.append(text)
+            used += count
+    if current:
+        flush()
+    return batches
+
+# ==========================================
+# ACCOUNTING
+# ==========================================
+class StageStats:
+    """Calls, tokens (as reported by the LLM, else estimated) and latency of one stage."""
+    def __init__(self, name):
+        self.name = name
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+        self.latencies = []
+        self.wall_time = 0.0
+        self.lock = threading.Lock()  # Calls of a stage finish on several threads
+
+    def add(self, prompt_tokens, completion_tokens, latency):
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.latencies.append(latency)
+
+    def report(self):
+        average = sum(self.latencies) / len(self.latencies) if self.latencies else 0.0
+        return (f"{self.name:<7} {self.calls:>5} calls  {self.prompt_tokens:>8} in  {self.completion_tokens:>7} out  "
+                f"avg {average * 1000:>6.0f} ms  max {max(self.latencies, default=0) * 1000:>6.0f} ms  "
+                f"wall {self.wall_time:.1f}s")
+
+# ==========================================
+# DIGEST ENGINE
+# ==========================================
+def parse_digest(text):
+    """Decodes the JSON digest (ignoring text around the object); free text is kept as a single highlight."""
+    try:
+        digest = json.loads(text[text.find("{"):text.rfind("}") + 1])
+    except ValueError:
+        digest = None
+    if not isinstance(digest, dict):
+        return {"highlights": [text.strip()], "action_items": [], "threads": []}
+    return {field: digest.get(field) if isinstance(digest.get(field), list) else [] for field in DIGEST_FIELDS}
+
+class DigestEngine:
+    """
+    `llm` is any LangChain LLM or chat model (or the StubLLM below): only `invoke(prompt)` is used,
+    from at most `max_concurrency` threads at a time.
+    """
+    def __init__(self, llm, batch_tokens=BATCH_TOKENS, fanout=REDUCE_FANOUT, max_concurrency=MAX_CONCURRENT_CALLS):
+        self.llm = llm
+        self.batch_tokens = batch_tokens
+        self.fanout = fanout
+        self.max_concurrency = max_concurrency
+        self.stages = {}
+        self.rounds = 0
+
+    def _call(self, stats, prompt):
+        start_time = time.perf_counter()
+        response = self.llm.invoke(prompt)
+        latency = time.perf_counter() - start_time
+        text = getattr(response, "content", response)
+        usage = getattr(response, "usage_metadata", None) or {}
+        stats.add(usage.get("input_tokens", estimate_tokens(prompt)), usage.get("output_tokens", estimate_tokens(text)), latency)
+        return text
+
+    def _round(self, executor, stage, prompts):
+        """One parallel round: every prompt of the stage at once, bounded by the pool size."""
+        stats = self.stages.setdefault(stage, StageStats(stage))
+        start_time = time.perf_counter()
+        results = list(executor.map(lambda prompt: self._call(stats, prompt), prompts))
+        stats.wall_time += time.perf_counter() - start_time
+        self.rounds += 1
+        return results
+
+    def run(self, messages):
+        """Returns the structured digest of `messages`: {"highlights", "action_items", "threads"}."""
+        if not messages:
+            return {field: [] for field in DIGEST_FIELDS}
+        self.stages, self.rounds = {}, 0
+        batches = pack_batches(group_messages(messages), self.batch_tokens)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            summaries = self._round(executor, "map", [MAP_PROMPT.format(emails=batch) for batch in batches])
+            # Merge `fanout` summaries per call until one final call can read them all
+            while len(summaries) > self.fanout:
+                groups = [summaries[i:i + self.fanout] for i in range(0, len(summaries), self.fanout)]
+                summaries = self._round(executor, "reduce", [REDUCE_PROMPT.format(summaries="\n\n".join(group))
+                                                             for group in groups])
+            digest = parse_digest(self._round(executor, "final", [FINAL_PROMPT.format(summaries="\n\n".join(summaries))])[0])
+
+        print(f"\nDigest of {len(messages)} emails: {len(batches)} batches, {self.rounds} rounds "
+              f"(expected {self.expected_rounds(len(batches))}).")  # Debugging
+        for stats in self.stages.values():
+            print("  " + stats.report())  # Debugging
+        return digest
+
+    def expected_rounds(self, batch_count):
+        """map + one reduce level per factor of `fanout` above it + final: fixed for a given number of batches."""
+        levels = 0
+        while batch_count > self.fanout:
+            batch_count, levels = math.ceil(batch_count / self.fanout), levels + 1
+        return levels + 2
+
+def format_digest(digest):
+    lines = ["Highlights:"] + [f"  - {item}" for item in digest["highlights"]]
+    lines += ["Action items:"] + [f"  - {item}" for item in digest["action_items"]]
+    lines += ["Threads:"] + [f"  - {thread.get('subject', '')}: {thread.get('summary', '')}" if isinstance(thread, dict)
+                             else f"  - {thread}" for thread in digest["threads"]]
+    return "\n".join(lines)
+
+# ==========================================
+# STUB LLM (OFFLINE RUNS AND BENCHMARKS)
+# ==========================================
+class StubLLM:
+    """
+    Deterministic stand-in for the LLM: map/reduce calls return the first lines of their input,
+    the final call a valid JSON digest, after a simulated latency.
+    """
+    def __init__(self, latency_ms=200, jitter_ms=50, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+
+    def invoke(self, prompt):
+        time.sleep(max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        subjects = [line[len("Subject: "):] for line in prompt.splitlines() if line.startswith("Subject: ")]
+        if prompt.startswith(FINAL_PROMPT[:40]):
+            lines = [line for line in prompt.splitlines() if line.startswith("- ")]
+            return json.dumps({"highlights": [line[2:] for line in lines[:5]], "action_items": [],
+                               "threads": [{"subject": line[2:], "summary": "stub"} for line in lines]})
+        if subjects:
+            return "\n".join(f"- {subject}" for subject in dict.fromkeys(subjects))
+        return "\n".join(line for line in prompt.splitlines() if line.startswith("- "))
@@ -1,6 +1,6 @@
 # ==========================================
-# RAG SYSTEM FOR PDFs
-# Extracts information from PDFs and allows users to ask questions.
+# RAG SYSTEM FOR GMAIL
+# Syncs the new emails of the inbox into a FAISS store and allows users to ask questions.
 # ==========================================
 # SOURCES:
 # MAIN GUIDE: https://python.langchain.com/docs/tutorials/rag/
@@ -8,45 +8,41 @@
 # ==========================================
 
 # SETUP
+import argparse
 import getpass
+import json
 import os
+import time
 import openai
 from langchain_openai import OpenAI
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.vectorstores import VectorStoreRetriever
 from langchain.chains import RetrievalQA
 
+# Local Imports
+from mail_sources import open_source # Gmail API, Maildir or mbox, read from a saved cursor
+from mail_ingest import MailStore # Incremental parsing + persistent FAISS store
+from digest import DigestEngine, StubLLM, format_digest # Map-reduce daily digest
+
 # ==========================================
 # SETTING UP OPENAI API KEY
 # ==========================================
 
 # os.environ["OPENAI_API_KEY"] = "sk-"
 
-if not os.environ.get("OPENAI_API_KEY"):
-    api_key = getpass.getpass("Enter your API key here: ")
-    os.environ["OPENAI_API_KEY"] = api_key
-else:
-    api_key = os.environ["OPENAI_API_KEY"]
+# Asked from main() only: the MIME parsing workers import this script (see mail_ingest._pool_context)
+def get_api_key():
+    if not os.environ.get("OPENAI_API_KEY"):
+        os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your API key here: ")
+    return os.environ["OPENAI_API_KEY"]
 
 # ==========================================
-# PROCESSING PDFs
+# PROCESSING EMAILS
 # ==========================================
-PDF_DIR = "./pdfs"
-os.makedirs(PDF_DIR, exist_ok=True)
+MAIL_STORE_DIR = "./mail_store" # FAISS store, parsed messages and sync cursor
 
-def load_pdfs(directory):
-    """Loads all PDFs in a directory and extracts text."""
-    documents = []
-    for filename in os.listdir(directory):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(directory, filename)
-            loader = PyPDFLoader(pdf_path)
-            documents.extend(loader.load())
-    return documents
-    
 def process_documents(documents):
     """Splits documents into chunks."""
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
@@ -55,12 +51,12 @@ def process_documents(documents):
 # ==========================================
 # RETRIEVER - FAISS VECTORSTORE FOR EMBEDDINGS
 # ==========================================
-def build_faiss_vectorstore(chunks):
-    """Embeds text chunks and stores them in a FAISS index."""
-    embeddings = OpenAIEmbeddings(openai_api_key = api_key)
-    vectorstore = FAISS.from_documents(chunks, embeddings)
-    retriever = VectorStoreRetriever(vectorstore = vectorstore)
-    return retriever
+def sync_mail_store(source):
+    """Embeds the emails received since the last run and appends them to the saved FAISS store."""
+    embeddings = OpenAIEmbeddings(openai_api_key = get_api_key())
+    store = MailStore(MAIL_STORE_DIR, embeddings, process_documents)
+    store.sync(source)
+    return store
 
 # ==========================================
 # QUERYING THE DOCUMENTS
@@ -68,30 +64,64 @@ def build_faiss_vectorstore(chunks):
 def query_documents(query, retriever):
     """Retrieves relevant chunks and generates an answer using OpenAI."""
     qa_chain = RetrievalQA.from_chain_type(
-        llm=OpenAI(api_key = api_key),
+        llm=OpenAI(api_key = get_api_key()),
         retriever=retriever
     )
     response = qa_chain.invoke({"query": query})
     return response["result"] if isinstance(response, dict) and "result" in response else response
 
+# ==========================================
+# DAILY DIGEST
+# ==========================================
+DIGEST_MAX_TOKENS = 1024 # Room for the structured digest (the completion model defaults to 256 tokens)
+
+def write_digest(store, hours, llm):
+    """Summarizes the emails of the last `hours` into a structured digest, printed and saved next to the store."""
+    messages = list(store.iter_messages(since=time.time() - hours * 3600))
+    digest = DigestEngine(llm).run(messages)
+    path = os.path.join(MAIL_STORE_DIR, f"digest-{time.strftime('%Y-%m-%d')}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(digest, file, ensure_ascii=False, indent=2)
+    print(f"\n📬 Digest of {len(messages)} emails (saved to {path}):\n")
+    print(format_digest(digest))
+
 # ==========================================
 # MAIN EXECUTION
 # ==========================================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Sync new emails and ask questions about them.")
+    parser.add_argument("--source", choices=["gmail", "maildir", "mbox"], default="gmail",
+                        help="Where to read mail from (maildir/mbox: local copies, e.g. for offline tests)")
+    parser.add_argument("--path", help="Maildir directory or mbox file (with --source maildir/mbox)")
+    parser.add_argument("--sync-only", action="store_true", help="Sync the store and exit (e.g. from a daily cron job)")
+    parser.add_argument("--digest", action="store_true", help="Write the digest of the last --digest-hours and exit")
+    parser.add_argument("--digest-hours", type=float, default=24)
+    parser.add_argument("--stub-llm", action="store_true", help="Digest with a local stub instead of OpenAI (offline runs)")
+    return parser.parse_args()
+
 def main():
-    pdf_documents = load_pdfs(PDF_DIR)
-    if not pdf_documents:
-        print("No PDFs found. Add PDFs to the 'pdfs' directory and try again.")
+    args = parse_args()
+    get_api_key()  # Asked before the sync rather than at the first question
+    store = sync_mail_store(open_source(args.source, args.path))
+    if args.sync_only:
         return
-    
-    chunks = process_documents(pdf_documents)
-    retriever = build_faiss_vectorstore(chunks)
+    if args.digest:
+        llm = StubLLM() if args.stub_llm else OpenAI(api_key = get_api_key(), max_tokens = DIGEST_MAX_TOKENS)
+        write_digest(store, args.digest_hours, llm)
+        return
+
+    vectorstore = store.load()
+    if vectorstore is None:
+        print("No emails found. Check the mail source and try again.")
+        return
+    retriever = VectorStoreRetriever(vectorstore = vectorstore)
     
     print("\nReady for questions! Type 'exit' to quit.")
     
     while True:
         query = input("\n❓ Your question: ").strip()
         if query.lower() == "exit":
-            print("\nExiting. Thanks for using the PDF Q&A system by Victor SOTO!")
+            print("\nExiting. Thanks for using the Gmail Q&A system by Victor SOTO!")
             break
         
         answer = query_documents(query, retriever)
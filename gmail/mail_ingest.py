@@ -0,0 +1,280 @@
+# ==========================================
+# INCREMENTAL MAIL INGESTION
+# source -> (new messages only) -> MIME parsing in a process pool -> chunks -> persistent FAISS store.
+# Messages are logged, then indexed, then the cursor is saved: a crash means fetching the delta again, never losing it.
+# ==========================================
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from email import policy
+from email.parser import BytesParser
+from email.utils import getaddresses, parsedate_to_datetime
+from html.parser import HTMLParser
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repository root, for the shared modules
+from near_duplicates import NearDuplicateIndex, SIGNATURES_FILE # MinHash + LSH, shared with the teaching assistant
+
+FAISS_DIR = "faiss"
+MESSAGES_FILE = "messages.jsonl"  # Parsed messages, appended per sync (read by the digest)
+CURSOR_FILE = "cursor.json"
+
+# Fewer messages than this are parsed inline: starting a pool would cost more than it saves
+PARALLEL_MIN_MESSAGES = 32
+MAX_ATTACHMENT_CHARS = 20000  # Text kept per text attachment
+
+# ==========================================
+# MIME PARSING (RUNS IN CHILD PROCESSES)
+# ==========================================
+class _TextExtractor(HTMLParser):
+    """Visible text of an HTML body (scripts and styles skipped)."""
+    def __init__(self):
+        super().__init__()
+        self.parts, self.skipping = [], 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self.skipping += 1
+        elif tag in ("br", "p", "div", "tr", "li"):
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style") and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.parts.append(data)
+
+def html_to_text(html):
+    extractor = _TextExtractor()
+    extractor.feed(html)
+    return "\n".join(line.strip() for line in "".join(extractor.parts).splitlines() if line.strip())
+
+def _part_text(part):
+    content = part.get_content()
+    if isinstance(content, bytes):
+        return ""
+    return html_to_text(content) if part.get_content_type() == "text/html" else content
+
+def parse_message(item):
+    """
+    (source_id, raw bytes) -> message dict (headers, text body, attachments), or the exception raised.
+    The thread is the first Message-ID of References (else In-Reply-To, else the message itself).
+    """
+    source_id, raw = item
+    try:
+        message = BytesParser(policy=policy.default).parsebytes(raw)
+        message_id = (message.get("Message-ID") or "").strip() or f"<{source_id}>"
+        references = (message.get("References") or "").split() or (message.get("In-Reply-To") or "").split()
+        try:
+            date = parsedate_to_datetime(message["Date"]).timestamp() if message["Date"] else None
+        except (TypeError, ValueError):
+            date = None
+
+        body_part = message.get_body(preferencelist=("plain", "html"))
+        body = _part_text(body_part).strip() if body_part is not None else ""
+        attachments = []
+        for part in message.iter_attachments():
+            payload = part.get_payload(decode=True) or b""
+            attachment = {"filename": part.get_filename() or "", "content_type": part.get_content_type(), "size": len(payload)}
+            if part.get_content_maintype() == "text":
+                attachment["text"] = _part_text(part)[:MAX_ATTACHMENT_CHARS]
+            attachments.append(attachment)
+
+        return {
+            "id": message_id,
+            "source_id": source_id,
+            "thread": references[0] if references else message_id,
+            "subject": str(message.get("Subject") or ""),
+            "from": ", ".join(address for _, address in getaddresses([str(message.get("From") or "")])),
+            "to": ", ".join(address for _, address in getaddresses([str(message.get("To") or "")])),
+            "date": date,
+            "body": body,
+            "attachments": attachments,
+        }
+    except Exception as e:
+        return e
+
+def _pool_context():
+    """
+    Avoids fork, as extraction.py does: a forked child could inherit locks held by the parent's threads
+    (HTTP clients, embedding calls). A fork server (where available) imports the calling script and this module once,
+    then forks each worker from that clean single-threaded process; the script asks for its API key under __main__ only.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("spawn")
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["__main__", __name__])
+    return context
+
+def parse_messages(items, max_workers=None):
+    """Parses raw messages (in a process pool when there are enough of them), skipping unparsable ones."""
+    start_time = time.perf_counter()
+    if len(items) < PARALLEL_MIN_MESSAGES:
+        results = [parse_message(item) for item in items]
+    else:
+        max_workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context()) as executor:
+            results = list(executor.map(parse_message, items, chunksize=max(1, len(items) // (4 * max_workers))))
+
+    messages = []
+    for (source_id, _), result in zip(items, results):
+        if isinstance(result, Exception):
+            print(f"Skipping message {source_id}: {result}")  # Debugging
+        else:
+            messages.append(result)
+    print(f"Parsed {len(messages)} messages in {time.perf_counter() - start_time:.2f}s.")  # Debugging
+    return messages
+
+# ==========================================
+# MESSAGES -> DOCUMENTS
+# ==========================================
+def message_document(message):
+    """One document per message: headers first, so they are embedded with the text."""
+    text = f"From: {message['from']}\nTo: {message['to']}\nSubject: {message['subject']}\n\n{message['body']}"
+    for attachment in message["attachments"]:
+        text += f"\n\n[Attachment: {attachment['filename']}]"
+        if attachment.get("text"):
+            text += "\n" + attachment["text"]
+    metadata = {key: message[key] for key in ("id", "thread", "from", "subject", "date")}
+    return Document(page_content=text, metadata=metadata)
+
+# ==========================================
+# PERSISTENT MAIL STORE
+# ==========================================
+class MailStore:
+    """
+    A directory holding the FAISS vector store of the mail, the parsed messages (JSONL)
+    and the source cursor. `split_documents` turns message documents into chunks.
+    """
+    def __init__(self, directory, embeddings, split_documents):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.split_documents = split_documents
+        self.vectorstore = None
+        self.near_duplicates = None  # Loaded with the vector store
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def load(self):
+        """Returns the saved vector store, or None before the first sync."""
+        if self.vectorstore is None and os.path.exists(os.path.join(self._path(FAISS_DIR), "index.faiss")):
+            self.vectorstore = FAISS.load_local(self._path(FAISS_DIR), self.embeddings, allow_dangerous_deserialization=True)
+        if self.near_duplicates is None:
+            self.near_duplicates = NearDuplicateIndex()
+            if self.vectorstore is not None and os.path.exists(self._path(SIGNATURES_FILE)):
+                self.near_duplicates.load(self._path(SIGNATURES_FILE))
+        return self.vectorstore
+
+    def _deduplicate(self, chunks, ids):
+        """
+        Collapses near-duplicate chunks (quoted replies, newsletters) into the first copy, stored or new:
+        only the first is embedded, and it lists the other messages in its "duplicates" metadata.
+        Returns the chunks and ids to embed.
+        """
+        vectorstore, kept = self.vectorstore, {}
+        for chunk, chunk_id in zip(chunks, ids):
+            representative = self.near_duplicates.add(chunk_id, chunk.page_content)
+            if representative == chunk_id:
+                kept[chunk_id] = chunk
+                continue
+            target = kept.get(representative) or vectorstore.docstore.search(representative)
+            duplicates = target.metadata.setdefault("duplicates", [])
+            if chunk.metadata["id"] not in duplicates and chunk.metadata["id"] != target.metadata["id"]:
+                duplicates.append(chunk.metadata["id"])
+        print(f"Near-duplicates: {len(chunks) - len(kept)} of {len(chunks)} chunks collapsed "
+              f"({(len(chunks) - len(kept)) / len(chunks):.0%} dedup ratio).")  # Debugging
+        return list(kept.values()), list(kept)
+
+    def _load_cursor(self):
+        try:
+            with open(self._path(CURSOR_FILE), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cursor(self, cursor):
+        with open(self._path(CURSOR_FILE) + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(cursor, file)
+        os.replace(self._path(CURSOR_FILE) + ".tmp", self._path(CURSOR_FILE))
+
+    def _logged_ids(self):
+        return {message["id"] for message in self.iter_messages()}
+
+    def _append_messages(self, messages):
+        """Appends to messages.jsonl and syncs it to disk before anything is indexed."""
+        path = self._path(MESSAGES_FILE)
+        with open(path, "ab") as file:
+            if file.tell():
+                with open(path, "rb") as existing:
+                    existing.seek(-1, os.SEEK_END)
+                    if existing.read(1) != b"\n":
+                        file.write(b"\n")  # A line cut by a crash stays on its own (and is skipped when read)
+            for message in messages:
+                file.write((json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8"))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def sync(self, source, max_workers=None):
+        """
+        Fetches the messages received since the last sync, parses them, appends them to messages.jsonl
+        and their chunks to the vector store, then saves the cursor. Each step skips the messages it already has,
+        so after a crash between two steps, fetching the same delta again completes the missing ones.
+        Returns the new messages.
+        """
+        start_time = time.perf_counter()
+        cursor = self._load_cursor()
+        items, new_cursor = source.fetch(cursor)
+        fetched = list({message["id"]: message for message in (parse_messages(items, max_workers) if items else [])}.values())
+
+        logged = self._logged_ids() if fetched else set()
+        messages = [message for message in fetched if message["id"] not in logged]
+        if messages:
+            self._append_messages(messages)
+
+        vectorstore = self.load()
+        stored = set()  # Messages with a chunk in the store, directly or as a collapsed duplicate
+        for document in (vectorstore.docstore._dict.values() if vectorstore is not None else ()):
+            stored.add(document.metadata["id"])
+            stored.update(document.metadata.get("duplicates", ()))
+        to_index = [message for message in fetched if message["id"] not in stored]
+
+        if to_index:
+            chunks, ids, counters = [], [], {}
+            for chunk in self.split_documents([message_document(message) for message in to_index]):
+                n = counters[chunk.metadata["id"]] = counters.get(chunk.metadata["id"], -1) + 1
+                chunks.append(chunk)
+                ids.append(f"{chunk.metadata['id']}#{n}")
+            chunks, ids = self._deduplicate(chunks, ids)
+            if vectorstore is None:
+                self.vectorstore = vectorstore = FAISS.from_documents(chunks, self.embeddings, ids=ids)
+            elif chunks:
+                vectorstore.add_documents(chunks, ids=ids)
+            vectorstore.save_local(self._path(FAISS_DIR))
+            self.near_duplicates.save(self._path(SIGNATURES_FILE))
+        if new_cursor != cursor:
+            self._save_cursor(new_cursor)
+
+        print(f"\nMail sync: {len(items)} fetched, {len(messages)} new, {len(to_index)} indexed, "
+              f"{vectorstore.index.ntotal if vectorstore is not None else 0} chunks stored, "
+              f"{time.perf_counter() - start_time:.1f}s.\n")  # Debugging
+        return messages
+
+    def iter_messages(self, since=None):
+        """Yields the stored messages (received after `since`, a timestamp, if given)."""
+        if not os.path.exists(self._path(MESSAGES_FILE)):
+            return
+        with open(self._path(MESSAGES_FILE), "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue  # Cut by a crash while appending: the message is fetched and logged again
+                if since is None or (message["date"] or 0) >= since:
+                    yield message
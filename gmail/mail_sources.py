@@ -0,0 +1,182 @@
+# ==========================================
+# MAIL SOURCES
+# Where messages come from: the Gmail API, or a local Maildir / mbox (e.g. for offline tests).
+# Every source fetches only what arrived after a saved cursor, and returns the new cursor.
+# ==========================================
+import base64
+import os
+import re
+
+# ==========================================
+# LOCAL SOURCES (OFFLINE)
+# ==========================================
+class MaildirSource:
+    """
+    Reads a Maildir (new/ and cur/). The cursor is the latest delivery time (file mtime) seen,
+    plus the keys delivered at that exact time, so a file is never read twice.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _entries(self):
+        for subdir in ("new", "cur"):
+            directory = os.path.join(self.path, subdir)
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.is_file() and not entry.name.startswith("."):
+                    # The key is stable when the client renames the file to set flags ("key:2,S")
+                    yield entry.stat().st_mtime, entry.name.split(":")[0], entry.path
+
+    def fetch(self, cursor=None):
+        """Returns ([(source_id, raw bytes)], new cursor) for the messages delivered after `cursor`."""
+        last_mtime = cursor["mtime"] if cursor else float("-inf")
+        last_keys = set(cursor["keys"]) if cursor else set()
+        new = sorted((mtime, key, path) for mtime, key, path in self._entries()
+                     if mtime > last_mtime or (mtime == last_mtime and key not in last_keys))
+        messages = []
+        for _, key, path in new:
+            with open(path, "rb") as file:
+                messages.append((key, file.read()))
+        if not new:
+            return messages, cursor
+        mtime = new[-1][0]
+        keys = [key for m, key, _ in new if m == mtime] + (list(last_keys) if mtime == last_mtime else [])
+        return messages, {"mtime": mtime, "keys": keys}
+
+class MboxSource:
+    """
+    Reads an mbox file, which only grows: the cursor is the byte offset already read,
+    so a sync reads nothing but the appended messages. A file that shrank is read again from the start.
+    """
+    _FROM_LINE = re.compile(rb"^From .*\r?\n", re.MULTILINE)
+
+    def __init__(self, path):
+        self.path = path
+
+    def fetch(self, cursor=None):
+        offset = cursor["offset"] if cursor else 0
+        if os.path.getsize(self.path) < offset:
+            offset = 0
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            data = file.read()
+
+        messages = []
+        starts = [match.start() for match in self._FROM_LINE.finditer(data)]
+        for i, start in enumerate(starts):
+            end = starts[i + 1] if i + 1 < len(starts) else len(data)
+            body_start = data.index(b"\n", start) + 1
+            raw = re.sub(rb"(?m)^>(>*From )", rb"\1", data[body_start:end])  # Undo the mboxrd quoting
+            messages.append((f"{offset + start}", raw))
+        return messages, {"offset": offset + len(data)}
+
+# ==========================================
+# GMAIL API
+# ==========================================
+GMAIL_SCOPES = ["https://www.googleapis.com/auth/gmail.readonly"]
+GMAIL_INITIAL_QUERY = "newer_than:1d"  # First sync: the last 24h only, not the whole inbox
+GMAIL_BATCH_SIZE = 50  # Messages fetched per batched HTTP request
+
+class GmailSource:
+    """
+    Reads the Gmail inbox. The cursor is the mailbox historyId: later syncs ask for the
+    messages added since then (history.list) instead of listing the inbox. It also keeps
+    the ids whose download failed, which the next sync fetches again.
+    """
+    def __init__(self, credentials_path="credentials.json", token_path="token.json", initial_query=GMAIL_INITIAL_QUERY):
+        self.credentials_path = credentials_path
+        self.token_path = token_path
+        self.initial_query = initial_query
+        self.service = None
+
+    def _connect(self):
+        # Imported here: only needed when reading from Gmail
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from googleapiclient.discovery import build
+
+        credentials = None
+        if os.path.exists(self.token_path):
+            credentials = Credentials.from_authorized_user_file(self.token_path, GMAIL_SCOPES)
+        if not credentials or not credentials.valid:
+            if credentials and credentials.expired and credentials.refresh_token:
+                credentials.refresh(Request())
+            else:
+                credentials = InstalledAppFlow.from_client_secrets_file(self.credentials_path, GMAIL_SCOPES).run_local_server(port=0)
+            with open(self.token_path, "w", encoding="utf-8") as file:
+                file.write(credentials.to_json())
+        return build("gmail", "v1", credentials=credentials)
+
+    def _list_ids(self, **params):
+        ids, page_token = [], None
+        while True:
+            response = self.service.users().messages().list(userId="me", pageToken=page_token, **params).execute()
+            ids.extend(message["id"] for message in response.get("messages", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                return ids
+
+    def _history_ids(self, history_id):
+        """Ids of the messages added since `history_id`, or None if Gmail no longer keeps that history."""
+        from googleapiclient.errors import HttpError
+        ids, page_token = [], None
+        try:
+            while True:
+                response = self.service.users().history().list(userId="me", startHistoryId=history_id, pageToken=page_token,
+                                                               historyTypes=["messageAdded"]).execute()
+                for record in response.get("history", []):
+                    ids.extend(added["message"]["id"] for added in record.get("messagesAdded", []))
+                page_token = response.get("nextPageToken")
+                if not page_token:
+                    return list(dict.fromkeys(ids))
+        except HttpError as e:
+            if e.resp.status == 404:  # History expired (about a week): fall back to the initial query
+                return None
+            raise
+
+    def _get_raw(self, ids):
+        """
+        Downloads messages in batched requests of GMAIL_BATCH_SIZE.
+        Returns ([(id, raw bytes)], ids to retry): a message deleted in the meantime (404) is not retried.
+        """
+        raw_by_id, failed = {}, []
+
+        def received(request_id, response, exception):
+            if exception is not None:
+                print(f"Could not fetch message {request_id}: {exception}")  # Debugging
+                if getattr(getattr(exception, "resp", None), "status", None) != 404:
+                    failed.append(request_id)
+            else:
+                raw_by_id[request_id] = base64.urlsafe_b64decode(response["raw"].encode("ascii"))
+
+        for start in range(0, len(ids), GMAIL_BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=received)
+            for message_id in ids[start:start + GMAIL_BATCH_SIZE]:
+                batch.add(self.service.users().messages().get(userId="me", id=message_id, format="raw"), request_id=message_id)
+            batch.execute()
+        return [(message_id, raw_by_id[message_id]) for message_id in ids if message_id in raw_by_id], failed
+
+    def fetch(self, cursor=None):
+        if self.service is None:
+            self.service = self._connect()
+        # Read the history id first: whatever arrives while listing is picked up by the next sync
+        history_id = self.service.users().getProfile(userId="me").execute()["historyId"]
+        ids = self._history_ids(cursor["history_id"]) if cursor else None
+        if ids is None:
+            ids = self._list_ids(q=self.initial_query)
+        # Downloads that failed last time are retried: the history id has moved past them
+        ids = list(dict.fromkeys((cursor or {}).get("retry", []) + ids))
+        messages, failed = self._get_raw(ids)
+        return messages, {"history_id": history_id, "retry": failed}
+
+def open_source(kind, path=None):
+    """Builds the source named on the command line."""
+    if kind == "gmail":
+        return GmailSource()
+    if kind == "maildir":
+        return MaildirSource(path)
+    if kind == "mbox":
+        return MboxSource(path)
+    raise ValueError(f"Unknown mail source: {kind}")
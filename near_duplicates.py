@@ -0,0 +1,98 @@
+# ==========================================
+# NEAR-DUPLICATE DETECTION (MINHASH + LSH)
+# Newsletters and quoted reply chains (mail), or headers and footers repeated on every slide (lessons),
+# produce many almost identical chunks; each would be embedded and then crowd the top-k. MinHash
+# signatures bucketed by LSH bands find them in near-constant time per chunk, so only one copy is embedded.
+# Shared by the Gmail assistant and the teaching assistant.
+# ==========================================
+import re
+import zlib
+import numpy as np
+
+NEAR_DUP_THRESHOLD = 0.8  # Estimated Jaccard similarity of word 5-grams above which two chunks are one
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16            # 16 bands of 4 rows: pairs at 0.8 similarity share a band with probability > 0.999
+SHINGLE_WORDS = 5
+SIGNATURES_FILE = "minhash.npz"
+
+_PRIME = 4294967311  # Smallest prime above 2^32: (a * x + b) stays below 2^64 for 32-bit a, x and b
+_TOKEN = re.compile(r"\w+")
+
+class NearDuplicateIndex:
+    """
+    Keeps the MinHash signature of every representative chunk, bucketed per LSH band.
+    `add` returns the key of the near-duplicate already indexed, or registers the chunk as a new representative.
+    """
+    def __init__(self, threshold=NEAR_DUP_THRESHOLD, num_permutations=NUM_PERMUTATIONS, bands=LSH_BANDS,
+                 shingle_words=SHINGLE_WORDS, seed=1):
+        random_state = np.random.RandomState(seed)
+        self.a = random_state.randint(1, 2 ** 32, size=num_permutations, dtype=np.uint64)
+        self.b = random_state.randint(0, 2 ** 32, size=num_permutations, dtype=np.uint64)
+        self.threshold = threshold
+        self.rows = num_permutations // bands
+        self.shingle_words = shingle_words
+        self.buckets = [{} for _ in range(bands)]  # band -> {band bytes: [keys]}
+        self.signatures = {}  # key -> signature
+
+    def copy(self):
+        """Independent copy, so a delta can be applied while the original keeps serving."""
+        other = NearDuplicateIndex.__new__(NearDuplicateIndex)
+        other.__dict__.update(self.__dict__)
+        other.buckets = [{band: list(keys) for band, keys in bucket.items()} for bucket in self.buckets]
+        other.signatures = dict(self.signatures)
+        return other
+
+    def signature(self, text):
+        tokens = _TOKEN.findall(text.lower())
+        k = self.shingle_words
+        shingles = {" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)} or {" ".join(tokens)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+        return ((np.outer(hashes, self.a) + self.b) % _PRIME).min(axis=0).astype(np.uint32)
+
+    def _bands(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(len(self.buckets))]
+
+    def find(self, signature):
+        """Key of the most similar indexed chunk above the threshold, or None."""
+        candidates = {key for band, bucket in zip(self._bands(signature), self.buckets) for key in bucket.get(band, ())}
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = float(np.mean(self.signatures[key] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+    def insert(self, key, signature):
+        self.signatures[key] = signature
+        for band, bucket in zip(self._bands(signature), self.buckets):
+            bucket.setdefault(band, []).append(key)
+
+    def add(self, key, text):
+        """Returns the representative of `text`: an indexed near-duplicate, or `key` itself (now indexed)."""
+        signature = self.signature(text)
+        representative = self.find(signature)
+        if representative is not None:
+            return representative
+        self.insert(key, signature)
+        return key
+
+    def remove(self, key):
+        signature = self.signatures.pop(key, None)
+        if signature is not None:
+            for band, bucket in zip(self._bands(signature), self.buckets):
+                keys = bucket.get(band)
+                if keys and key in keys:
+                    keys.remove(key)
+                    if not keys:
+                        del bucket[band]
+
+    def save(self, path):
+        keys = list(self.signatures)
+        np.savez(path, keys=np.array(keys, dtype=str),
+                 signatures=np.array([self.signatures[key] for key in keys], dtype=np.uint32).reshape(len(keys), len(self.a)))
+
+    def load(self, path):
+        """Re-indexes the signatures saved by `save` (same parameters assumed)."""
+        with np.load(path) as saved:
+            for key, signature in zip(saved["keys"].tolist(), saved["signatures"]):
+                self.insert(key, signature)
@@ -0,0 +1,130 @@
+# ==========================================
+# FAISS INDEX BACKENDS
+# Exact (flat) or approximate (IVF-Flat, HNSW, IVF-PQ) nearest-neighbour search,
+# with automatic training on a sample and a recall-vs-latency report against flat.
+# ==========================================
+import math
+import time
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# Default search-time knobs: higher means better recall and slower queries
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+# IVF centroids are trained on at most this many vectors per list (FAISS warns below ~39)
+TRAIN_POINTS_PER_LIST = 64
+MAX_TRAIN_SAMPLES = 200_000
+
+# ==========================================
+# INDEX CREATION & TRAINING
+# ==========================================
+def needs_training(index_type):
+    """IVF indexes cluster the data first, so they can only be built once all vectors are known."""
+    return index_type in ("ivf_flat", "ivf_pq")
+
+def default_nlist(count):
+    """Rule of thumb: about 4 * sqrt(n) inverted lists, capped so each list gets enough training points."""
+    return max(1, min(int(4 * math.sqrt(count)), count // TRAIN_POINTS_PER_LIST or 1))
+
+def default_pq_m(dimension):
+    """Number of PQ sub-quantizers: ~8 dimensions each, and it must divide the dimension."""
+    for m in range(max(1, dimension // 8), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def create_index(index_type, dimension, count=None, metric=faiss.METRIC_L2, nlist=None, hnsw_m=32, pq_m=None, pq_bits=8):
+    """Returns an empty FAISS index of the given type; IVF types need `count` (or `nlist`) to size their lists."""
+    if index_type == "flat":
+        return faiss.IndexFlat(dimension, metric)
+    if index_type == "hnsw":
+        return faiss.IndexHNSWFlat(dimension, hnsw_m, metric)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(count or 1)
+        quantizer = faiss.IndexFlat(dimension, metric)
+        if index_type == "ivf_flat":
+            return faiss.IndexIVFFlat(quantizer, dimension, nlist, metric)
+        return faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m or default_pq_m(dimension), pq_bits, metric)
+    raise ValueError(f"Unknown index type '{index_type}'. Choose one of: {', '.join(INDEX_TYPES)}")
+
+def train_sample(embeddings, index, seed=0):
+    """Draws a random training sample sized to the index (enough points per IVF list, bounded overall)."""
+    ivf = faiss.try_extract_index_ivf(index)
+    wanted = min(MAX_TRAIN_SAMPLES, max(TRAIN_POINTS_PER_LIST * (ivf.nlist if ivf else 1), 256 * 39))
+    if len(embeddings) <= wanted:
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+    rows = np.sort(np.random.default_rng(seed).choice(len(embeddings), wanted, replace=False))
+    return np.ascontiguousarray(embeddings[rows], dtype=np.float32)
+
+def add_in_blocks(index, embeddings, block_rows=65536):
+    """Adds vectors block by block, so a memory-mapped array is never loaded at once."""
+    for start in range(0, len(embeddings), block_rows):
+        index.add(np.ascontiguousarray(embeddings[start:start + block_rows], dtype=np.float32))
+
+def build_index(embeddings, index_type="flat", metric=faiss.METRIC_L2, **params):
+    """Creates, trains (on a sample, when needed) and fills an index from an array of vectors."""
+    if index_type == "ivf_pq" and len(embeddings) < 2 ** params.get("pq_bits", 8):
+        print(f"\nOnly {len(embeddings)} vectors: too few to train PQ codebooks, using ivf_flat instead.")
+        index_type = "ivf_flat"
+        params = {key: value for key, value in params.items() if key not in ("pq_m", "pq_bits")}
+    index = create_index(index_type, embeddings.shape[1], count=len(embeddings), metric=metric, **params)
+    if not index.is_trained:
+        index.train(train_sample(embeddings, index))
+    add_in_blocks(index, embeddings)
+    return index
+
+def set_search_params(index, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    """Applies the recall/latency knobs: nprobe for IVF indexes, efSearch for HNSW."""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efSearch = ef_search
+    return index
+
+# ==========================================
+# RECALL VS LATENCY REPORT
+# ==========================================
+def _timed_search(index, queries, top_k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], top_k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies)
+
+def recall_report(index, embeddings, num_queries=200, top_k=10, metric=faiss.METRIC_L2, seed=0):
+    """
+    Compares `index` with exact flat search over the same `embeddings`, using stored vectors as queries.
+    Returns recall@k and p50/p99 single-query latency (ms) of both.
+    """
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False))
+    queries = np.ascontiguousarray(embeddings[rows], dtype=np.float32)
+    top_k = min(top_k, len(embeddings))
+
+    flat = faiss.IndexFlat(embeddings.shape[1], metric)
+    add_in_blocks(flat, embeddings)
+    exact_ids, flat_latencies = _timed_search(flat, queries, top_k)
+    approx_ids, approx_latencies = _timed_search(index, queries, top_k)
+
+    hits = sum(len(set(exact) & set(approx)) for exact, approx in zip(exact_ids, approx_ids))
+    return {
+        "queries": len(queries),
+        "top_k": top_k,
+        f"recall@{top_k}": hits / (len(queries) * top_k),
+        "flat_p50_ms": float(np.percentile(flat_latencies, 50)),
+        "flat_p99_ms": float(np.percentile(flat_latencies, 99)),
+        "index_p50_ms": float(np.percentile(approx_latencies, 50)),
+        "index_p99_ms": float(np.percentile(approx_latencies, 99)),
+        "index_bytes_per_vector": _bytes_per_vector(index),
+    }
+
+def _bytes_per_vector(index):
+    """Approximate memory per stored vector, from the serialized index size."""
+    return len(faiss.serialize_index(index)) / max(index.ntotal, 1)
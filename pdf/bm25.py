@@ -0,0 +1,133 @@
+# ==========================================
+# BM25 KEYWORD INDEX + RECIPROCAL-RANK FUSION
+# Dense embeddings miss exact terms (function names, formula names, acronyms);
+# a small inverted index catches them, and RRF merges both rankings without score calibration.
+# ==========================================
+import json
+import os
+import re
+from array import array
+import numpy as np
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+# Reciprocal-rank fusion constant: larger values flatten the advantage of the very first ranks
+RRF_K = 60
+
+POSTINGS_FILE = "bm25.npz"
+TERMS_FILE = "bm25_terms.json"
+
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text):
+    return _TOKEN.findall(text.lower())
+
+class BM25Index:
+    """
+    Inverted index in CSR form: the postings of term t are doc_ids[offsets[t]:offsets[t + 1]],
+    with their BM25 weight (idf and length normalization included) precomputed at build time,
+    so a query is a few vectorized additions per query term.
+    """
+    def __init__(self, terms, offsets, doc_ids, weights, num_docs):
+        self.term_ids = {term: i for i, term in enumerate(terms)}
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.num_docs = num_docs
+
+    @classmethod
+    def build(cls, texts, k1=K1, b=B):
+        term_ids = {}
+        token_ids, doc_lengths = array("q"), array("i")  # Compact while collecting
+        for text in texts:
+            tokens = tokenize(text)
+            token_ids.extend([term_ids.setdefault(token, len(term_ids)) for token in tokens])
+            doc_lengths.append(len(tokens))
+
+        num_docs = len(doc_lengths)
+        token_docs = np.repeat(np.arange(num_docs, dtype=np.int64), np.frombuffer(doc_lengths, dtype=np.int32))
+        # One (term, doc) key per token: unique keys come out grouped by term with sorted doc ids, counts are tfs
+        keys, tfs = np.unique(np.frombuffer(token_ids, dtype=np.int64) * max(num_docs, 1) + token_docs, return_counts=True)
+        post_terms = keys // max(num_docs, 1)
+        doc_ids = (keys % max(num_docs, 1)).astype(np.int32)
+        tfs = tfs.astype(np.float32)
+        document_frequency = np.bincount(post_terms, minlength=len(term_ids))
+        offsets = np.concatenate([[0], np.cumsum(document_frequency)]).astype(np.int64)
+
+        lengths = np.frombuffer(doc_lengths, dtype=np.int32).astype(np.float32)
+        average_length = lengths.mean() if num_docs else 1.0
+        idf = np.log1p((num_docs - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths[doc_ids] / max(average_length, 1e-9))
+        weights = (np.repeat(idf, document_frequency) * tfs * (k1 + 1) / (tfs + norm)).astype(np.float32)
+
+        terms = [None] * len(term_ids)
+        for term, i in term_ids.items():
+            terms[i] = term
+        return cls(terms, offsets, doc_ids, weights, num_docs)
+
+    def idf(self, document_frequency):
+        return np.log1p((self.num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query, top_k=10, min_coverage=0.0):
+        """
+        Returns [(doc_id, score)] of the best `top_k` documents sharing at least one term with the query.
+        Documents holding less than `min_coverage` of the query's idf-weighted terms (sum of idf^2 of the
+        query terms they contain / same sum over all query terms, unknown terms counting as the rarest)
+        are left out, so a match on common words only ("what", "about") is not a hit.
+        """
+        terms = set(tokenize(query))
+        postings = [self.term_ids[term] for term in terms if term in self.term_ids]
+        if not postings:
+            return []
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        coverage = np.zeros(self.num_docs, dtype=np.float32) if min_coverage > 0 else None
+        for t in postings:
+            start, end = self.offsets[t], self.offsets[t + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]  # Doc ids are unique within a term
+            if coverage is not None:
+                coverage[self.doc_ids[start:end]] += self.idf(end - start) ** 2
+        candidates = np.flatnonzero(scores)
+        if coverage is not None:
+            query_mass = sum(self.idf(self.offsets[t + 1] - self.offsets[t]) ** 2 for t in postings) \
+                + (len(terms) - len(postings)) * self.idf(0) ** 2
+            candidates = candidates[coverage[candidates] >= min_coverage * query_mass]
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(i), float(scores[i])) for i in candidates]
+
+    def search_batch(self, queries, top_k=10, min_coverage=0.0):
+        return [self.search(query, top_k, min_coverage) for query in queries]
+
+    def save(self, directory):
+        """Writes both files through temporary files, so a crash never leaves a half-written index."""
+        postings_path, terms_path = os.path.join(directory, POSTINGS_FILE), os.path.join(directory, TERMS_FILE)
+        with open(postings_path + ".tmp", "wb") as file:
+            np.savez(file, offsets=self.offsets, doc_ids=self.doc_ids, weights=self.weights, num_docs=np.array(self.num_docs))
+        with open(terms_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.terms, file, ensure_ascii=False)
+        os.replace(postings_path + ".tmp", postings_path)
+        os.replace(terms_path + ".tmp", terms_path)
+
+    @classmethod
+    def load(cls, directory):
+        """Returns the saved index, or None if there is none."""
+        try:
+            with np.load(os.path.join(directory, POSTINGS_FILE)) as saved:
+                arrays = {name: saved[name] for name in saved.files}
+            with open(os.path.join(directory, TERMS_FILE), "r", encoding="utf-8") as file:
+                terms = json.load(file)
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(terms, arrays["offsets"], arrays["doc_ids"], arrays["weights"], int(arrays["num_docs"]))
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Merges ranked lists of ids: each id scores sum(1 / (k + rank)). Returns [(id, score)], best first."""
+    fused = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda pair: pair[1], reverse=True)
@@ -0,0 +1,147 @@
+# ==========================================
+# LAYOUT-AWARE CHUNKING
+# Chunks each page separately from its sentences and lines, within token bounds,
+# drops empty and duplicate chunks, and records where every chunk came from
+# (file, page, character offsets) in a compact columnar table.
+# ==========================================
+import hashlib
+import math
+import re
+from array import array
+import numpy as np
+from context import count_tokens
+
+MIN_CHUNK_TOKENS = 64   # Smaller chunks are merged into the previous one when it has room
+MAX_CHUNK_TOKENS = 384  # Larger sentences are cut at whitespace
+MIN_KEEP_TOKENS = 8     # Leftovers below this (page numbers, running headers) are dropped
+
+# Unit boundaries: whitespace after a sentence end, or a line break (a blank line ends a paragraph)
+_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+_WORD = re.compile(r"\w")
+
+# ==========================================
+# PAGE CHUNKING
+# ==========================================
+def _units(text):
+    """Splits a page into (start, end, ends_paragraph) spans of sentences or lines, without surrounding whitespace."""
+    units, position = [], 0
+    for boundary in _BOUNDARY.finditer(text):
+        if boundary.start() > position:
+            units.append((position, boundary.start(), boundary.group().count("\n") > 1))
+        elif units and boundary.group().count("\n") > 1:
+            units[-1] = (*units[-1][:2], True)
+        position = boundary.end()
+    if position < len(text):
+        units.append((position, len(text), True))
+    return units
+
+def _split_oversized(text, start, end, tokens, max_tokens):
+    """Cuts a span longer than `max_tokens` into roughly equal pieces at whitespace."""
+    pieces = math.ceil(tokens / max_tokens)
+    step = (end - start) / pieces
+    spans, piece_start = [], start
+    for i in range(1, pieces):
+        cut = text.rfind(" ", piece_start + 1, start + int(step * i))
+        cut = cut if cut > piece_start else start + int(step * i)
+        spans.append((piece_start, cut))
+        piece_start = cut + (text[cut] == " ")
+    spans.append((piece_start, end))
+    return spans
+
+def chunk_page(text, min_tokens=MIN_CHUNK_TOKENS, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Returns (start, end) character spans of the chunks of one page: consecutive sentences/lines are grouped
+    up to `max_tokens`, preferably ending at a paragraph once `min_tokens` is reached; a short tail joins the
+    previous chunk when it fits, and what is still too short to carry meaning is dropped.
+    """
+    units = _units(text)
+    if not units:
+        return []
+    unit_tokens = count_tokens([text[start:end] for start, end, _ in units])
+
+    chunks = []  # [start, end, tokens]
+    current = None
+
+    def flush():
+        nonlocal current
+        if current is None:
+            return
+        if current[2] < min_tokens and chunks and chunks[-1][2] + current[2] <= max_tokens:
+            chunks[-1][1] = current[1]
+            chunks[-1][2] += current[2]
+        else:
+            chunks.append(current)
+        current = None
+
+    for (start, end, ends_paragraph), tokens in zip(units, unit_tokens):
+        if tokens > max_tokens:
+            flush()
+            for piece_start, piece_end in _split_oversized(text, start, end, tokens, max_tokens):
+                chunks.append([piece_start, piece_end, math.ceil(tokens * (piece_end - piece_start) / (end - start))])
+            continue
+        if current is not None and current[2] + tokens > max_tokens:
+            flush()
+        if current is None:
+            current = [start, end, tokens]
+        else:
+            current[1], current[2] = end, current[2] + tokens
+        if ends_paragraph and current[2] >= min_tokens:
+            flush()
+    flush()
+
+    return [(start, end) for start, end, tokens in chunks
+            if tokens >= MIN_KEEP_TOKENS and _WORD.search(text, start, end)]
+
+def iter_page_chunks(pages, min_tokens=MIN_CHUNK_TOKENS, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    page -> chunk: yields (pdf_path, chunk, (page_number, start, end)) for every page of `pages`,
+    skipping chunks whose whitespace-normalized text was already yielded (repeated headers, duplicate pages).
+    """
+    seen = set()
+    for pdf_path, page_number, text in pages:
+        for start, end in chunk_page(text, min_tokens, max_tokens):
+            chunk = text[start:end]
+            key = hashlib.blake2b(" ".join(chunk.split()).encode("utf-8"), digest_size=16).digest()
+            if key in seen:
+                continue
+            seen.add(key)
+            yield pdf_path, chunk, (page_number, start, end)
+
+# ==========================================
+# COLUMNAR CHUNK METADATA
+# ==========================================
+class ChunkTable:
+    """
+    Where each chunk comes from, one typed array per column (file id, page, start and end character
+    of the chunk in the page text) instead of a dict per chunk: 16 bytes per chunk.
+    """
+    COLUMNS = ("file_id", "page", "start", "end")
+
+    def __init__(self, columns=None):
+        self.columns = {name: array("i", columns[name] if columns else []) for name in self.COLUMNS}
+
+    def __len__(self):
+        return len(self.columns["file_id"])
+
+    def append(self, file_id, page, start, end):
+        for name, value in zip(self.COLUMNS, (file_id, page, start, end)):
+            self.columns[name].append(value)
+
+    def extend_from(self, other, start, stop, file_id):
+        """Copies rows [start, stop) of another table, assigning them a new file id."""
+        self.columns["file_id"].extend([file_id] * (stop - start))
+        for name in self.COLUMNS[1:]:
+            self.columns[name].extend(other.columns[name][start:stop])
+
+    def row(self, i):
+        """Returns (file_id, page, start, end) of chunk i."""
+        return tuple(self.columns[name][i] for name in self.COLUMNS)
+
+    def save(self, path):
+        with open(path, "wb") as file:  # A file object, so numpy does not append ".npz" to temporary names
+            np.savez(file, **{name: np.frombuffer(column, dtype=np.int32) for name, column in self.columns.items()})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            return cls({name: saved[name].tolist() for name in cls.COLUMNS})
@@ -0,0 +1,127 @@
+# ==========================================
+# TOKEN-AWARE CONTEXT PACKING
+# Chunk token counts are computed once (at index time) and looked up per query,
+# so building the prompt context costs a few integer additions instead of re-encoding every chunk.
+# ==========================================
+import re
+from functools import lru_cache
+import tiktoken
+
+ENCODING_MODEL = "gpt-4"
+
+# A chunk that does not fit is truncated only if at least this many tokens of budget are left
+MIN_TRUNCATED_TOKENS = 64
+SEPARATOR = "\n"
+# Shorter shared prefixes/suffixes are coincidences (a common word), not the overlap of neighbouring splits
+MIN_OVERLAP_CHARS = 32
+
+# Sentence ends: ., ! or ? followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n+")
+
+@lru_cache(maxsize=None)
+def get_encoding(model=ENCODING_MODEL):
+    """The tokenizer is loaded once per process instead of once per request."""
+    return tiktoken.encoding_for_model(model)
+
+def count_tokens(texts, model=ENCODING_MODEL):
+    """Token count of each text, encoded in one multi-threaded batch."""
+    return [len(tokens) for tokens in get_encoding(model).encode_ordinary_batch(list(texts))]
+
+def _normalized(text):
+    return " ".join(text.split())
+
+def _overlap(left, right, min_chars=MIN_OVERLAP_CHARS):
+    """Length of the longest suffix of `left` that is also a prefix of `right` (0 if shorter than `min_chars`)."""
+    if min(len(left), len(right)) < min_chars:
+        return 0
+    head = right[:min_chars]
+    position = left.find(head, max(0, len(left) - len(right)))
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(head, position + 1)
+    return 0
+
+def truncate_to_sentences(text, max_tokens, model=ENCODING_MODEL):
+    """Longest prefix of whole sentences within `max_tokens` (empty if even the first sentence is too long)."""
+    encoding = get_encoding(model)
+    tokens = encoding.encode_ordinary(text)
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    prefix = encoding.decode(tokens[:max_tokens])
+    cut = [match.start() for match in _SENTENCE_END.finditer(prefix)]
+    if not cut:
+        return "", 0
+    truncated = prefix[:cut[-1]].rstrip()
+    return truncated, len(encoding.encode_ordinary(truncated))
+
+class ContextPacker:
+    """Packs ranked chunks into a token budget using the token counts registered for the corpus."""
+    def __init__(self, model=ENCODING_MODEL):
+        self.model = model
+        self.separator_tokens = count_tokens([SEPARATOR], model)[0]
+        self.tokens_by_chunk = {}
+
+    def register(self, text_chunks, token_counts=None):
+        """Records the token count of every indexed chunk (computed here if not given, e.g. not stored yet)."""
+        if token_counts is None:
+            token_counts = count_tokens(text_chunks, self.model)
+        self.tokens_by_chunk = dict(zip(text_chunks, token_counts))
+
+    def tokens(self, chunk):
+        count = self.tokens_by_chunk.get(chunk)
+        if count is None:  # Not from the index (e.g. a caller-provided text): counted once, then remembered
+            count = self.tokens_by_chunk[chunk] = count_tokens([chunk], self.model)[0]
+        return count
+
+    def _trim_overlaps(self, chunk, selected):
+        """
+        `chunk` without the text it shares with the selected chunks: a head repeating the tail of one of them
+        and a tail repeating the head of one of them (the overlap of neighbouring splits).
+        """
+        for other in selected:
+            shared = _overlap(other, chunk)
+            if shared:
+                chunk = chunk[shared:].lstrip()
+        for other in selected:
+            shared = _overlap(chunk, other)
+            if shared:
+                chunk = chunk[:len(chunk) - shared].rstrip()
+        return chunk
+
+    def pack(self, relevant_chunks, max_tokens):
+        """
+        Fills the budget in relevance order: duplicate chunks (or chunks contained in an already selected one)
+        are dropped, the text a chunk shares with a selected neighbouring split is cut off, a chunk that does not
+        fit is skipped rather than ending the context, and the first one that does not fit is cut at a sentence
+        boundary if enough budget is left.
+        Returns (selected chunks, tokens used).
+        """
+        selected, keys, used = [], [], 0
+        truncated_once = False
+        for chunk in relevant_chunks:
+            key = _normalized(chunk)
+            if not key or any(key in other for other in keys):
+                continue
+            text = self._trim_overlaps(chunk, selected)
+            if text != chunk:
+                key = _normalized(text)
+                if not key or any(key in other for other in keys):
+                    continue
+            # Trimmed texts are counted here, not remembered: they depend on what else the query selected
+            tokens = self.tokens(chunk) if text == chunk else count_tokens([text], self.model)[0]
+            separator = self.separator_tokens if selected else 0
+            if used + tokens + separator <= max_tokens:
+                selected.append(text)
+                keys.append(key)
+                used += tokens + separator
+                continue
+            remaining = max_tokens - used - separator
+            if not truncated_once and remaining >= MIN_TRUNCATED_TOKENS:
+                truncated_once = True
+                part, part_tokens = truncate_to_sentences(text, remaining, self.model)
+                if part:
+                    selected.append(part)
+                    keys.append(_normalized(part))
+                    used += part_tokens + separator
+        return selected, used
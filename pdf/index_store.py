@@ -0,0 +1,268 @@
+# ==========================================
+# PERSISTENT FAISS INDEX STORE
+# Keeps the FAISS index, the chunk texts (with their file, page and offsets) and a content hash per PDF on disk,
+# so a restart only re-embeds the PDFs that actually changed.
+# ==========================================
+import hashlib
+import json
+import os
+import faiss
+import numpy as np
+from ann_index import build_index, create_index, needs_training
+from bm25 import BM25Index, POSTINGS_FILE, TERMS_FILE
+from chunking import ChunkTable
+
+INDEX_FILE = "index.faiss"
+EMBEDDINGS_FILE = "embeddings.f32"  # Raw float32 rows, shape recorded in the manifest
+CHUNKS_FILE = "chunks.json"
+TOKENS_FILE = "token_counts.json"  # Tokens per chunk, aligned with chunks.json
+META_FILE = "chunk_meta.npz"  # File id, page and character offsets per chunk, aligned with chunks.json
+MANIFEST_FILE = "manifest.json"
+STORE_VERSION = 4
+
+# Vectors are copied in blocks of this many rows to keep memory flat
+COPY_BLOCK_ROWS = 65536
+
+# ==========================================
+# HELPERS
+# ==========================================
+def file_hash(path, block_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _save_json(obj, path):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(obj, file)
+
+def _atomic_write(path, write_fn):
+    """Writes to a temporary file first so a crash never leaves a half-written file."""
+    tmp_path = path + ".tmp"
+    write_fn(tmp_path)
+    os.replace(tmp_path, path)
+
+# ==========================================
+# INDEX STORE
+# ==========================================
+class IndexStore:
+    def __init__(self, directory, embedding_id=None, index_type="flat", metric=faiss.METRIC_L2, count_tokens=None,
+                 keyword_search=False, **index_params):
+        self.directory = directory
+        self.embedding_id = embedding_id  # e.g. model name; a change invalidates every stored vector
+        self.index_type = index_type
+        self.metric = metric
+        self.count_tokens = count_tokens  # list of chunks -> token counts, stored so queries never re-encode
+        self.keyword_search = keyword_search  # Also keep a BM25 index of the chunks (see bm25.py)
+        self.index_params = index_params  # nlist, hnsw_m, pq_m, pq_bits (see ann_index.create_index)
+        self.corpus_id = None  # Set by sync()
+        self.token_counts = None  # Set by sync() when count_tokens is given
+        self.keyword_index = None  # Set by sync() when keyword_search is on
+        self.chunk_table = None  # Set by sync(): where each chunk comes from (see chunking.ChunkTable)
+        self.file_paths = None  # Set by sync(): file id -> PDF path
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def index_spec(self):
+        """Describes the index layout; a change means rebuilding the index (but not re-embedding)."""
+        return {"type": self.index_type, "metric": int(self.metric), **self.index_params}
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def corpus_fingerprint(self, hashes):
+        """Identifies the indexed content (not file names), e.g. to invalidate answers cached against it."""
+        digest = hashlib.sha256(str(self.embedding_id).encode("utf-8"))
+        for content_hash in sorted(hashes.values()):
+            digest.update(content_hash.encode("ascii"))
+        return digest.hexdigest()
+
+    def _load_manifest(self):
+        """Returns the saved manifest, or None if the store is missing, from another version or another embedding model."""
+        try:
+            with open(self._path(MANIFEST_FILE), "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != STORE_VERSION or manifest.get("embedding") != self.embedding_id:
+            return None
+        required = (INDEX_FILE, EMBEDDINGS_FILE, CHUNKS_FILE, TOKENS_FILE, META_FILE)
+        if not all(os.path.exists(self._path(name)) for name in required):
+            return None
+        return manifest
+
+    def _load_chunks(self):
+        with open(self._path(CHUNKS_FILE), "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _load_token_counts(self):
+        with open(self._path(TOKENS_FILE), "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def _build_keyword_index(self, text_chunks):
+        keyword_index = BM25Index.build(text_chunks)
+        keyword_index.save(self.directory)
+        return keyword_index
+
+    def _load_chunk_tables(self, manifest):
+        """
+        Loads the stored chunks, their locations, token counts and BM25 index
+        (the last two built once if the store was written without them).
+        """
+        text_chunks = self._load_chunks()
+        self.chunk_table = ChunkTable.load(self._path(META_FILE))
+        self.file_paths = list(manifest["files"])
+        if self.count_tokens:
+            token_counts = self._load_token_counts()
+            if len(token_counts) != len(text_chunks) or None in token_counts:
+                token_counts = list(self.count_tokens(text_chunks))
+                _atomic_write(self._path(TOKENS_FILE), lambda p: _save_json(token_counts, p))
+            self.token_counts = token_counts
+        if self.keyword_search:
+            keyword_index = BM25Index.load(self.directory)
+            if keyword_index is None or keyword_index.num_docs != len(text_chunks):
+                keyword_index = self._build_keyword_index(text_chunks)
+            self.keyword_index = keyword_index
+        return text_chunks
+
+    def source(self, row):
+        """Returns (pdf_path, page_number, start, end) of chunk `row`."""
+        file_id, page, start, end = self.chunk_table.row(row)
+        return self.file_paths[file_id], page, start, end
+
+    def _load_embeddings(self, manifest):
+        """Memory-maps the saved vectors without reading them into RAM."""
+        if not manifest["count"]:
+            return None
+        shape = (manifest["count"], manifest["dimension"])
+        return np.memmap(self._path(EMBEDDINGS_FILE), dtype=np.float32, mode="r", shape=shape)
+
+    def load_embeddings(self):
+        """Returns the stored vectors memory-mapped (e.g. as the exact baseline of a recall report)."""
+        manifest = self._load_manifest()
+        return self._load_embeddings(manifest) if manifest else None
+
+    def _build_index(self, embeddings):
+        return build_index(embeddings, self.index_type, metric=self.metric, **self.index_params)
+
+    def _write_manifest(self, manifest):
+        _atomic_write(self._path(MANIFEST_FILE), lambda p: _save_json(manifest, p))
+
+    def sync(self, pdf_files, embed_batches):
+        """
+        Brings the store in line with `pdf_files` and returns (index, text_chunks).
+        `embed_batches(paths)` streams (pdf_paths, chunks, vectors, locations) batches for the given PDFs in file order,
+        locations being the (page_number, start, end) of each chunk.
+        Unchanged files are served from disk; only new or modified files are embedded.
+        A file that yields no chunks (failed extraction, no text) is left out of the manifest, so the next sync retries it.
+        """
+        hashes = {path: file_hash(path) for path in pdf_files}
+        manifest = self._load_manifest()
+        self.corpus_id = self.corpus_fingerprint(hashes)
+
+        if manifest is not None and manifest["files"].keys() == hashes.keys() \
+                and all(manifest["files"][path]["hash"] == h for path, h in hashes.items()):
+            if manifest.get("index") == self.index_spec:
+                index = faiss.read_index(self._path(INDEX_FILE), faiss.IO_FLAG_MMAP)
+                print(f"\nLoaded cached FAISS index with {index.ntotal} chunks.\n")  # Debugging
+                return index, self._load_chunk_tables(manifest)
+            # Same corpus, different index type: rebuild from the stored vectors, no re-embedding
+            index = self._build_index(self._load_embeddings(manifest))
+            _atomic_write(self._path(INDEX_FILE), lambda p: faiss.write_index(index, p))
+            self._write_manifest({**manifest, "index": self.index_spec})
+            print(f"\nRebuilt {self.index_type} FAISS index from {index.ntotal} cached embeddings.\n")  # Debugging
+            return index, self._load_chunk_tables(manifest)
+
+        # Reuse by content hash, so renamed or moved files are not re-embedded either
+        old_by_hash, old_chunks, old_counts, old_table, old_embeddings = {}, [], [], None, None
+        if manifest is not None:
+            old_by_hash = {entry["hash"]: entry for entry in manifest["files"].values()}
+            old_chunks = self._load_chunks()
+            old_counts = self._load_token_counts()
+            old_table = ChunkTable.load(self._path(META_FILE))
+            old_embeddings = self._load_embeddings(manifest)
+        to_embed = [path for path in pdf_files if hashes[path] not in old_by_hash]
+
+        files, text_chunks, token_counts, chunk_table = {}, [], [], ChunkTable()  # File ids follow the order of `files`
+        index = dimension = None
+        tmp_embeddings = self._path(EMBEDDINGS_FILE) + ".tmp"
+
+        with open(tmp_embeddings, "wb") as out:
+            def append(vectors):
+                """Writes a block of vectors to disk and, when the index is ready for it, to the index."""
+                nonlocal index, dimension
+                vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+                dimension = vectors.shape[1]
+                if index is None and not needs_training(self.index_type):
+                    index = create_index(self.index_type, dimension, metric=self.metric, **self.index_params)
+                out.write(vectors.tobytes())
+                if index is not None:
+                    index.add(vectors)
+
+            # Vectors of unchanged files are copied block by block from the memory map
+            for path in pdf_files:
+                entry = old_by_hash.get(hashes[path])
+                if entry is None:
+                    continue
+                start, count = entry["start"], entry["count"]
+                chunk_table.extend_from(old_table, start, start + count, file_id=len(files))
+                files[path] = {"hash": hashes[path], "start": len(text_chunks), "count": count}
+                text_chunks.extend(old_chunks[start:start + count])
+                token_counts.extend(old_counts[start:start + count])
+                for block in range(start, start + count, COPY_BLOCK_ROWS):
+                    append(old_embeddings[block:min(block + COPY_BLOCK_ROWS, start + count)])
+
+            # New or modified files stream through the ingestion pipeline; a file gets its entry (and id) with its first chunk
+            file_ids = {path: i for i, path in enumerate(files)}
+            if to_embed:
+                for pdf_paths, chunks, vectors, locations in embed_batches(to_embed):
+                    for i, (path, (page, start, end)) in enumerate(zip(pdf_paths, locations)):
+                        entry = files.get(path)
+                        if entry is None:
+                            # A batch can span several files
+                            entry = files[path] = {"hash": hashes[path], "start": len(text_chunks) + i, "count": 0}
+                            file_ids[path] = len(file_ids)
+                        entry["count"] += 1
+                        chunk_table.append(file_ids[path], page, start, end)
+                    text_chunks.extend(chunks)
+                    token_counts.extend(self.count_tokens(chunks) if self.count_tokens else [None] * len(chunks))
+                    append(vectors)
+        del old_embeddings, old_chunks, old_table  # Release the memory map before replacing the file
+
+        if not text_chunks:
+            os.remove(tmp_embeddings)
+            raise ValueError("No text chunks could be extracted from the PDFs.")
+
+        # Invalidate the store while its files are swapped, so a crash means a rebuild, never a mismatch.
+        # The BM25 files go too: a later hybrid run must not load postings of the previous chunks (rebuilt below if needed)
+        for name in (MANIFEST_FILE, POSTINGS_FILE, TERMS_FILE):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        os.replace(tmp_embeddings, self._path(EMBEDDINGS_FILE))
+        if index is None:
+            # IVF indexes are trained on a sample once every vector is on disk
+            index = self._build_index(np.memmap(self._path(EMBEDDINGS_FILE), dtype=np.float32, mode="r",
+                                                shape=(len(text_chunks), dimension)))
+        _atomic_write(self._path(INDEX_FILE), lambda p: faiss.write_index(index, p))
+        if self.count_tokens:
+            # Chunks stored by a run without a tokenizer get their counts now
+            missing = [i for i, count in enumerate(token_counts) if count is None]
+            for i, count in zip(missing, self.count_tokens([text_chunks[i] for i in missing]) if missing else []):
+                token_counts[i] = count
+            self.token_counts = token_counts
+        _atomic_write(self._path(CHUNKS_FILE), lambda p: _save_json(text_chunks, p))
+        _atomic_write(self._path(TOKENS_FILE), lambda p: _save_json(token_counts, p))
+        _atomic_write(self._path(META_FILE), chunk_table.save)
+        self.chunk_table, self.file_paths = chunk_table, list(files)
+        if self.keyword_search:
+            self.keyword_index = self._build_keyword_index(text_chunks)
+        self._write_manifest({"version": STORE_VERSION, "embedding": self.embedding_id, "dimension": int(dimension), "count": len(text_chunks),
+                              "index": self.index_spec, "files": files})
+        self.corpus_id = self.corpus_fingerprint({path: entry["hash"] for path, entry in files.items()})
+
+        skipped = [path for path in to_embed if path not in files]
+        print(f"\nIndex store updated: {len(to_embed) - len(skipped)} file(s) embedded, {len(pdf_files) - len(to_embed)} reused, "
+              f"{len(skipped)} without chunks (retried next sync), {len(text_chunks)} chunks total.\n")  # Debugging
+        return index, text_chunks
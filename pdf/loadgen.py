@@ -0,0 +1,75 @@
+# ==========================================
+# LOAD GENERATOR FOR THE QUERY SERVER
+# Keeps N concurrent clients (one keep-alive connection each) posting questions
+# to /ask, then reports throughput and latency percentiles.
+# ==========================================
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+import numpy as np
+from server import post_json
+
+DEFAULT_QUESTIONS = [
+    "What is an embedding?",
+    "How does FAISS search for nearest neighbours?",
+    "What is retrieval-augmented generation?",
+    "Summarize the main conclusions of the document.",
+    "Which methods are compared in the experiments?",
+]
+
+def load_questions(path):
+    if not path:
+        return DEFAULT_QUESTIONS
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line)["question"] for line in file if line.strip()]
+
+async def client(host, port, questions, next_request, latencies, statuses, total):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            i = next_request()
+            if i >= total:
+                return
+            start_time = time.perf_counter()
+            try:
+                status, _ = await post_json(reader, writer, host, "/ask", {"question": questions[i % len(questions)]})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                statuses["error"] = statuses.get("error", 0) + 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append((time.perf_counter() - start_time) * 1000)
+            elif status == 503:
+                await asyncio.sleep(0.05)  # Honour the backpressure signal briefly
+    finally:
+        writer.close()
+
+async def run(args):
+    url = urlsplit(args.url)
+    questions = load_questions(args.questions)
+    latencies, statuses = [], {}
+    counter = iter(range(args.requests + args.concurrency))
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(client(url.hostname, url.port or 80, questions, lambda: next(counter), latencies, statuses, args.requests)
+                           for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start_time
+
+    print(f"\n{args.requests} requests, {args.concurrency} concurrent clients, {elapsed:.2f} s")
+    print(f"  status counts: {', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str))}")
+    if latencies:
+        print(f"  throughput: {len(latencies) / elapsed:.1f} answered QPS")
+        print(f"  latency p50: {np.percentile(latencies, 50):.1f} ms, p90: {np.percentile(latencies, 90):.1f} ms, "
+              f"p99: {np.percentile(latencies, 99):.1f} ms, max: {max(latencies):.1f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the pdf.py query server.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Base URL of the query server")
+    parser.add_argument("--requests", type=int, default=1000, help="Total number of questions to send")
+    parser.add_argument("--concurrency", type=int, default=64, help="Number of concurrent clients")
+    parser.add_argument("--questions", help="JSONL file of {\"question\": ...} lines (defaults to a few built-in questions)")
+    asyncio.run(run(parser.parse_args()))
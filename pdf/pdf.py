@@ -6,23 +6,59 @@
 # MAIN GUIDE: https://python.langchain.com/docs/tutorials/rag/
 # ==========================================
 import os
+import sys
+import argparse
+import asyncio
 import getpass
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 import faiss
 import numpy as np
 import PyPDF2
-from sentence_transformers import SentenceTransformer
-import openai
-import tiktoken  # Tokenizer to estimate token count
 import gc # Garbage collector for memory management
 import signal # Handles crashes gracefully
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repository root, for the shared modules
+from index_store import IndexStore # On-disk cache of the FAISS index
+from pipeline import stream_embeddings # Streaming page -> chunk -> embedding ingestion
+from semantic_cache import SemanticCache # Reuses answers of near-identical past questions
+from ann_index import INDEX_TYPES, DEFAULT_NPROBE, DEFAULT_EF_SEARCH, build_index, set_search_params, recall_report
+from server import QueryServer, MAX_PENDING # Async HTTP front-end for concurrent users
+from context import ContextPacker, count_tokens # Token budget packing with precomputed chunk token counts
+from bm25 import reciprocal_rank_fusion # Keyword (BM25) + dense hybrid ranking
+from rerank import Reranker, RERANK_CANDIDATES, RERANK_BUDGET_MS # Optional cross-encoder rescoring of the candidates
+from tracing import tracer, TRACE_ENV # Per-stage spans (off unless RAG_TRACE or --trace names an exporter)
+from embedding_cache import EmbeddingCache # Content-addressed store of chunk embeddings
 
 # ==========================================
 # SETTING UP OPENAI API KEY
 # ==========================================
-if not os.environ.get("OPENAI_API_KEY"):
-    openai.api_key = getpass.getpass("Enter your API key here: ")
-else:
-    openai.api_key = os.environ["OPENAI_API_KEY"]
+# openai and httpx are imported, and the key asked for, on first use: the module then imports without them
+# (e.g. in the benchmarks, which replace the client with a stub, and in the PDF extraction workers, which import this script)
+def get_api_key():
+    if not os.environ.get("OPENAI_API_KEY"):
+        os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your API key here: ")
+    return os.environ["OPENAI_API_KEY"]
+
+# One client for the whole run: its pooled keep-alive connections skip a TCP + TLS handshake per question
+# (OPENAI_BASE_URL redirects it, e.g. to stub_llm.py for offline load tests)
+OPENAI_LIMITS = {"max_connections": 32, "max_keepalive_connections": 16, "keepalive_expiry": 120}
+OPENAI_TIMEOUT = {"timeout": 60.0, "connect": 10.0}
+openai_client = None
+
+def create_openai_client(asynchronous=False):
+    import httpx
+    import openai
+    http_options = {"limits": httpx.Limits(**OPENAI_LIMITS), "timeout": httpx.Timeout(**OPENAI_TIMEOUT)}
+    if asynchronous:
+        return openai.AsyncOpenAI(api_key=get_api_key(), http_client=httpx.AsyncClient(**http_options))
+    return openai.Client(api_key=get_api_key(), http_client=httpx.Client(**http_options))
+
+def get_openai_client():
+    global openai_client
+    if openai_client is None:
+        openai_client = create_openai_client()
+    return openai_client
 
 # ==========================================
 # FAISS THREAD MANAGEMENT (PREVENT FAULTS)
@@ -32,32 +68,99 @@ faiss.omp_set_num_threads(1) # ensures faiss doesn't overuse CPU
 # ==========================================
 # MODELS INITIALIZATION
 # ==========================================
-# Load the embedding model:
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+# Load the embedding model (on first use, so the module can be imported without it, e.g. by the benchmarks):
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+embedding_model = None
+
+def get_embedding_model():
+    global embedding_model
+    if embedding_model is None:
+        from sentence_transformers import SentenceTransformer
+        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    return embedding_model
+
+# Embeddings are L2-normalized, so inner product = cosine similarity (in [-1, 1]):
+EMBEDDING_ID = f"{EMBEDDING_MODEL_NAME}:normalized"
+INDEX_METRIC = faiss.METRIC_INNER_PRODUCT
+
+# Chunks already embedded once (in any PDF, in any run) are read back from here instead of re-encoded
+# (opened on first use, so importing the module creates no database, e.g. in the benchmark workers):
+EMBEDDING_CACHE_PATH = "./embedding_cache.sqlite"
+embedding_cache = None
+
+def get_embedding_cache():
+    global embedding_cache
+    if embedding_cache is None:
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_ID)
+    return embedding_cache
+
+# Retrieval cut-offs: chunks below MIN_SCORE, or more than MAX_SCORE_DROP below the best hit, are dropped
+MIN_SCORE = 0.3
+MAX_SCORE_DROP = 0.15
+
+# Hybrid retrieval: dense and BM25 candidates fetched per query (x top_k) before fusion,
+# BM25 hits holding less than this share of the query's idf-weighted terms being dropped (see bm25.py)
+HYBRID_FETCH_FACTOR = 4
+KEYWORD_MIN_COVERAGE = 0.3
 
 # Path to the directory storing the PDFs:
 PDF_DIR = "./pdfs"
 os.makedirs(PDF_DIR, exist_ok=True)
 
+# Path to the directory caching the FAISS index between runs:
+INDEX_DIR = "./index_cache"
+
+# Memory ceiling (MB of chunk text) buffered between extraction and embedding:
+INGEST_BUFFER_MB = 64
+
+# Token counts of the indexed chunks, registered once the index is loaded:
+context_packer = ContextPacker()
+
+# Path to the semantic answer cache, and how similar a question must be to reuse an answer:
+ANSWER_CACHE_DIR = "./answer_cache"
+ANSWER_CACHE_THRESHOLD = 0.92
+
 # ==========================================
 # TEXT EXTRACTION FROM PDF
 # ==========================================
 def extract_text_from_pdf(pdf_path):
     """Extracts text from a given PDF file."""
-    with open(pdf_path, "rb") as file:
+    with tracer.span("extract", file=os.path.basename(pdf_path)) as span, open(pdf_path, "rb") as file:
         reader = PyPDF2.PdfReader(file)
         text = "\n".join([page.extract_text() or "" for page in reader.pages])
+        span.set(pages=len(reader.pages), chars=len(text))
     return text.strip()
 
 # ==========================================
 # TEXT INDEXING - FAISS
 # ==========================================
-def build_faiss_index(text_chunks):
-    """Embeds text chunks and stores them in a FAISS index."""
-    embeddings = embedding_model.encode(text_chunks, convert_to_numpy=True, show_progress_bar=True, batch_size=32)
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
+def embed_queries(texts, show_progress_bar=False):
+    """Embeds texts into L2-normalized float32 vectors (no caching: questions rarely repeat verbatim)."""
+    with tracer.span("encode", texts=len(texts)):
+        return get_embedding_model().encode(texts, convert_to_numpy=True, normalize_embeddings=True,
+                                            show_progress_bar=show_progress_bar, batch_size=32).astype(np.float32)
+
+def embed_chunks(text_chunks, show_progress_bar=True):
+    """Embeds text chunks, encoding only those missing from the embedding cache (duplicates once)."""
+    with tracer.span("embed", chunks=len(text_chunks)) as span:
+        cache = get_embedding_cache()
+        hits, misses = cache.hits, cache.misses
+        vectors = cache.embed(text_chunks, lambda missing: embed_queries(missing, show_progress_bar))
+        span.set(cache_hits=cache.hits - hits, cache_misses=cache.misses - misses)
+    return vectors
+
+def embed_pdfs(pdf_paths):
+    """Streams (pdf_paths, chunks, vectors, locations) batches for the given PDFs with bounded memory."""
+    return stream_embeddings(pdf_paths, lambda chunks: embed_chunks(chunks, show_progress_bar=False), max_buffer_mb=INGEST_BUFFER_MB)
+
+def build_faiss_index(text_chunks, index_type="flat", **index_params):
+    """Embeds text chunks and stores them in a FAISS index (flat, ivf_flat, hnsw or ivf_pq)."""
+    with tracer.span("index", chunks=len(text_chunks), index_type=index_type):
+        embeddings = embed_chunks(text_chunks)
+        with tracer.span("faiss_build"):
+            index = build_index(embeddings, index_type, metric=INDEX_METRIC, **index_params)
+        with tracer.span("count_tokens", chunks=len(text_chunks)):
+            context_packer.register(text_chunks)
 
     print(f"\nIndexed {len(text_chunks)} text chunks in FAISS.\n")  # Debugging
     return index, text_chunks
@@ -65,35 +168,92 @@ def build_faiss_index(text_chunks):
 # ==========================================
 # RETRIEVAL FUNCTION
 # ==========================================
-def retrieve_relevant_chunks(query, index, text_chunks, top_k=3):
-    """Finds the most relevant text chunks based on the user's query."""
-    query_embedding = embedding_model.encode([query], convert_to_numpy=True)
-    
+def select_hits(scores, indices, text_chunks, min_score=MIN_SCORE, max_score_drop=MAX_SCORE_DROP):
+    """
+    Adaptive k: keeps (chunk, score) pairs that clear `min_score` and stay within
+    `max_score_drop` of the best hit, so weak matches never reach the LLM.
+    """
+    hits = [(text_chunks[i], float(score)) for score, i in zip(scores, indices) if 0 <= i < len(text_chunks)]
+    if not hits:
+        return []
+    cutoff = max(min_score, hits[0][1] - max_score_drop)
+    return [(chunk, score) for chunk, score in hits if score >= cutoff]
+
+def fuse_hits(scores, indices, keyword_hits, text_chunks, top_k, min_score=MIN_SCORE, max_score_drop=MAX_SCORE_DROP):
+    """
+    Hybrid ranking: dense hits passing the cut-offs of select_hits and BM25 hits (already filtered by coverage)
+    are merged by reciprocal-rank fusion, so chunks sharing exact terms with the query (function or formula names)
+    are not missed. Returns the best `top_k` (chunk, fused score) pairs; none if neither side has a hit.
+    """
+    valid = [(float(score), int(i)) for score, i in zip(scores, indices) if 0 <= i < len(text_chunks)]
+    cutoff = max(min_score, valid[0][0] - max_score_drop) if valid else min_score
+    dense = [i for score, i in valid if score >= cutoff]
+    keyword = [i for i, _ in keyword_hits]
+    return [(text_chunks[i], score) for i, score in reciprocal_rank_fusion([dense, keyword])[:top_k]]
+
+def retrieve_batch(queries, index, text_chunks, top_k=3, min_score=MIN_SCORE, max_score_drop=MAX_SCORE_DROP, return_scores=False,
+                   query_embeddings=None, keyword_index=None, reranker=None, min_keyword_coverage=KEYWORD_MIN_COVERAGE):
+    """
+    Retrieves chunks for many queries at once: one encoder forward pass and one FAISS matrix search.
+    With a `keyword_index` (BM25), dense and keyword candidates are fused (scores are then fusion scores).
+    With a `reranker`, `reranker.candidates` chunks are retrieved per query and the cross-encoder keeps the best `top_k`
+    within `max_score_drop` of its best score (scores are then cross-encoder scores, or retrieval scores past its budget).
+    """
     if not index.is_trained or index.ntotal == 0:
         print("\n FAISS index is empty! Skipping retrieval.")
-        return []
-    
-    distances, indices = index.search(query_embedding, min(top_k, index.ntotal))
+        return [[] for _ in queries]
+
+    with tracer.span("retrieve", queries=len(queries), hybrid=keyword_index is not None, rerank=reranker is not None) as span:
+        if query_embeddings is None:
+            query_embeddings = embed_queries(list(queries))
+        candidates = max(top_k, reranker.candidates) if reranker else top_k
+        # Reranked candidates are cut by their distance to the best cross-encoder score, not to the best retrieval one
+        retrieval_drop = 1.0 if reranker else max_score_drop
+        fetch = candidates * HYBRID_FETCH_FACTOR if keyword_index else candidates
+        with tracer.span("faiss_search", queries=len(queries), k=min(fetch, index.ntotal)):
+            scores, indices = index.search(query_embeddings, min(fetch, index.ntotal))
+        keyword_results = [None] * len(queries)
+        if keyword_index:
+            with tracer.span("bm25_search", queries=len(queries)):
+                keyword_results = keyword_index.search_batch(queries, fetch, min_keyword_coverage)
+        results = []
+        for query_scores, query_indices, keyword_hits in zip(scores, indices, keyword_results):
+            if keyword_hits is None:
+                hits = select_hits(query_scores, query_indices, text_chunks, min_score, retrieval_drop)
+            else:
+                hits = fuse_hits(query_scores, query_indices, keyword_hits, text_chunks, candidates, min_score, retrieval_drop)
+            results.append(hits)
 
-    retrieved_texts = [text_chunks[i] for i in indices[0] if i < len(text_chunks)]
+        if reranker:
+            with tracer.span("rerank", queries=len(queries), candidates=sum(len(hits) for hits in results)):
+                reranked = reranker.rerank_batch(queries, [[chunk for chunk, _ in hits] for hits in results], top_k,
+                                                 max_score_drop, return_scores=True)
+            results = [[(chunk, retrieval_scores[chunk] if score is None else score) for chunk, score in hits]
+                       for retrieval_scores, hits in zip(map(dict, results), reranked)]
+        span.set(chunks=sum(len(hits) for hits in results), empty=sum(not hits for hits in results))
+    return results if return_scores else [[chunk for chunk, _ in hits] for hits in results]
 
-    print(f"\nRetrieved {len(retrieved_texts)} chunks for query: '{query}'")
-    return retrieved_texts
+def retrieve_relevant_chunks(query, index, text_chunks, top_k=3, min_score=MIN_SCORE, max_score_drop=MAX_SCORE_DROP, return_scores=False,
+                             keyword_index=None, reranker=None, query_embedding=None):
+    """Finds the most relevant text chunks based on the user's query (with their cosine or fusion scores if asked)."""
+    hits = retrieve_batch([query], index, text_chunks, top_k, min_score, max_score_drop, return_scores=True,
+                          query_embeddings=query_embedding, keyword_index=keyword_index, reranker=reranker)[0]
+
+    print(f"\nRetrieved {len(hits)} chunks for query: '{query}' "
+          f"(scores: {', '.join(f'{score:.3f}' for _, score in hits)})")
+    return hits if return_scores else [chunk for chunk, _ in hits]
 
 # ==========================================
 # TRIM CONTEXT WITHIN TOKEN LIMIT
 # ==========================================
 def trim_context(relevant_chunks, max_tokens=4000):
-    """Ensures the retrieved text remains within the model's token limit."""
-    encoding = tiktoken.encoding_for_model("gpt-4")
-    token_count, trimmed_chunks = 0, []
-
-    for chunk in relevant_chunks:
-        chunk_tokens = encoding.encode(chunk)
-        if token_count + len(chunk_tokens) > max_tokens:
-            break
-        trimmed_chunks.append(chunk)
-        token_count += len(chunk_tokens)
+    """
+    Ensures the retrieved text remains within the model's token limit, using the token counts
+    stored at index time: duplicates are dropped, oversized chunks skipped, the last one cut at a sentence.
+    """
+    with tracer.span("trim_context", chunks_in=len(relevant_chunks), max_tokens=max_tokens) as span:
+        trimmed_chunks, token_count = context_packer.pack(relevant_chunks, max_tokens)
+        span.set(chunks=len(trimmed_chunks), tokens=token_count)
 
     print(f"\nUsing {token_count} tokens (limit: {max_tokens}).\n")  # Debugging
     return "\n".join(trimmed_chunks)
@@ -101,14 +261,20 @@ def trim_context(relevant_chunks, max_tokens=4000):
 # ==========================================
 # RESPONSE GENERATION FUNCTION
 # ==========================================
-def generate_answer(query, relevant_chunks):
-    """Generates an AI response using GPT-4 based on retrieved document excerpts."""
+NO_ANSWER = "I don't know based on the provided documents."
+
+def worth_caching(answer):
+    """Only answers found in the documents are reused: a "don't know" can stop being true when they change."""
+    return bool(answer.strip()) and NO_ANSWER.rstrip(".") not in answer
+
+def build_prompt(query, relevant_chunks):
+    """Builds the GPT-4 prompt from the retrieved excerpts, or returns None if no context fits."""
     context = trim_context(relevant_chunks)
-    
+
     if not context:
-        return "I don't know based on the provided documents."
+        return None
 
-    prompt = f"""
+    return f"""
     You are an AI assistant that answers questions strictly based on the provided document excerpts.
     If the context does not contain the answer, simply respond: "I don't know based on the provided documents."
 
@@ -119,32 +285,269 @@ def generate_answer(query, relevant_chunks):
     Answer:
     """
 
-    client = openai.Client()
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}]
-    )
+def record_usage(span, response):
+    """Copies the token usage reported by the API onto the LLM span."""
+    usage = getattr(response, "usage", None)
+    if span and usage is not None:
+        span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+def generate_answer(query, relevant_chunks):
+    """Generates an AI response using GPT-4 based on retrieved document excerpts."""
+    prompt = build_prompt(query, relevant_chunks)
+    if prompt is None:
+        return NO_ANSWER
+
+    start_time = time.perf_counter()
+    with tracer.span("llm", model="gpt-4") as span:
+        response = get_openai_client().chat.completions.create(
+            model="gpt-4",
+            messages=[{"role": "user", "content": prompt}]
+        )
+        record_usage(span, response)
+    print(f"\nGPT-4 answered in {(time.perf_counter() - start_time) * 1000:.0f} ms.")  # Debugging
 
     return response.choices[0].message.content  # Extract answer
 
+def stream_answer(query, relevant_chunks):
+    """Same as generate_answer, but yields the answer token by token as GPT-4 produces it."""
+    prompt = build_prompt(query, relevant_chunks)
+    if prompt is None:
+        yield NO_ANSWER
+        return
+
+    start_time = time.perf_counter()
+    first_token_ms = None
+    # Started and finished by hand: a `with` span would stay current in the caller between two tokens
+    span = tracer.span("llm", model="gpt-4", stream=True).start()
+    error = None
+    try:
+        stream = get_openai_client().chat.completions.create(
+            model="gpt-4",
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        )
+        for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start_time) * 1000
+                    span.set(first_token_ms=round(first_token_ms, 1))
+                span.add("completion_tokens")  # One streamed delta per token
+                yield token
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        span.finish(error)
+
+    if first_token_ms is not None:
+        print(f"\n\nGPT-4 first token after {first_token_ms:.0f} ms, "
+              f"full answer in {(time.perf_counter() - start_time) * 1000:.0f} ms.")  # Debugging
+
 # ==========================================
 # MAIN EXECUTION
 # ==========================================
+def format_sources(relevant_chunks, chunk_rows, store):
+    """Names the file and page of each retrieved chunk, e.g. "notes.pdf p.3"."""
+    sources = []
+    for chunk in relevant_chunks:
+        row = chunk_rows.get(chunk)
+        if row is not None:
+            pdf_path, page, _, _ = store.source(row)
+            source = f"{os.path.basename(pdf_path)} p.{page + 1}"
+            if source not in sources:
+                sources.append(source)
+    return sources
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ask questions about the PDFs in the 'pdfs' directory.")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="FAISS backend: exact 'flat', or approximate 'ivf_flat', 'hnsw', 'ivf_pq'")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="IVF lists visited per query")
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_EF_SEARCH, help="HNSW candidate list size per query")
+    parser.add_argument("--top-k", type=int, default=5, help="Maximum number of chunks retrieved per question")
+    parser.add_argument("--min-score", type=float, default=MIN_SCORE, help="Minimum cosine similarity of a retrieved chunk")
+    parser.add_argument("--dense-only", action="store_true",
+                        help="Disable BM25 keyword matching (by default dense and keyword hits are fused)")
+    parser.add_argument("--rerank", action="store_true",
+                        help="Rescore retrieved candidates with a local cross-encoder and keep the best --top-k")
+    parser.add_argument("--rerank-candidates", type=int, default=RERANK_CANDIDATES, help="Candidates retrieved per question for --rerank")
+    parser.add_argument("--rerank-budget-ms", type=float, default=RERANK_BUDGET_MS,
+                        help="CPU time allowed for --rerank per batch; past it, the retrieval order is kept")
+    parser.add_argument("--questions", help="JSONL file of {\"question\": ...} lines to answer non-interactively")
+    parser.add_argument("--answers", default="answers.jsonl", help="Where --questions mode writes its answers")
+    parser.add_argument("--batch-size", type=int, default=256, help="Questions retrieved per batch in --questions mode (largest micro-batch in --serve mode)")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent GPT-4 calls in --questions and --serve modes")
+    parser.add_argument("--serve", action="store_true", help="Answer questions over HTTP (POST /ask) instead of interactively")
+    parser.add_argument("--host", default="127.0.0.1", help="Address the --serve mode listens on")
+    parser.add_argument("--port", type=int, default=8000, help="Port the --serve mode listens on")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+                        help="Requests queued or in progress before --serve mode answers 503 (backpressure)")
+    parser.add_argument("--no-cache", action="store_true", help="Always call GPT-4, bypassing the semantic answer cache")
+    parser.add_argument("--recall-report", action="store_true",
+                        help="Print recall and latency of the index against exact flat search, then exit")
+    parser.add_argument("--trace", default=os.environ.get(TRACE_ENV, ""),
+                        help="Trace exporters, e.g. 'jsonl:traces.jsonl,prometheus:9464' (default: $RAG_TRACE, off if empty)")
+    return parser.parse_args()
+
+def lookup_and_retrieve(questions, index, text_chunks, top_k, min_score, cache=None, keyword_index=None, reranker=None):
+    """
+    Embeds a batch of questions once, serves what it can from the answer cache and
+    retrieves context for the rest in one FAISS search.
+    Returns (cached answer or None, chunks per question, question embeddings).
+    """
+    query_embeddings = embed_queries(list(questions))
+    answers = [None] * len(questions)
+    if cache:
+        with tracer.span("answer_cache", queries=len(questions)) as span:
+            answers = cache.lookup_batch(questions, query_embeddings)
+            span.set(cache_hits=sum(answer is not None for answer in answers))
+    misses = [i for i, answer in enumerate(answers) if answer is None]
+
+    batch_chunks = [[] for _ in questions]
+    if misses:
+        retrieved = retrieve_batch([questions[i] for i in misses], index, text_chunks, top_k=top_k, min_score=min_score,
+                                   query_embeddings=query_embeddings[misses], keyword_index=keyword_index, reranker=reranker)
+        for i, relevant_chunks in zip(misses, retrieved):
+            batch_chunks[i] = relevant_chunks
+    return answers, batch_chunks, query_embeddings
+
+def answer_question_batch(questions, index, text_chunks, executor, top_k, min_score, cache=None, keyword_index=None,
+                          reranker=None):
+    """
+    Looks up and retrieves a batch of questions in one pass, then answers the cache misses concurrently.
+    Returns (answers, chunks per question, whether each answer came from the cache).
+    """
+    with tracer.span("question_batch", questions=len(questions)) as span:
+        answers, batch_chunks, query_embeddings = lookup_and_retrieve(questions, index, text_chunks, top_k, min_score, cache,
+                                                                      keyword_index, reranker)
+        from_cache = [answer is not None for answer in answers]
+        misses = [i for i, hit in enumerate(from_cache) if not hit]
+
+        def answer(question, relevant_chunks):
+            if not relevant_chunks:
+                return NO_ANSWER
+            return generate_answer(question, relevant_chunks)
+
+        # bind: the GPT-4 calls run in the executor's threads but stay children of this batch's span
+        for i, generated in zip(misses, executor.map(tracer.bind(answer), [questions[i] for i in misses],
+                                                     [batch_chunks[i] for i in misses])):
+            answers[i] = generated
+
+        if cache:
+            # Only answers grounded in retrieved context are worth reusing
+            grounded = [i for i in misses if batch_chunks[i] and worth_caching(answers[i])]
+            cache.put_batch([questions[i] for i in grounded], [answers[i] for i in grounded], query_embeddings[grounded])
+        span.set(cache_hits=len(questions) - len(misses), generated=len(misses))
+    return answers, batch_chunks, from_cache
+
+def answer_questions_file(questions_path, answers_path, index, text_chunks, args, cache=None, keyword_index=None, reranker=None):
+    """Non-interactive mode: answers every question of a JSONL file and writes one JSON line per answer."""
+    def flush(records, out, executor):
+        answers, batch_chunks, from_cache = answer_question_batch([record["question"] for record in records], index,
+                                                                  text_chunks, executor, args.top_k, args.min_score, cache,
+                                                                  keyword_index, reranker)
+        for record, answer, relevant_chunks, cached in zip(records, answers, batch_chunks, from_cache):
+            out.write(json.dumps({**record, "answer": answer, "chunks_used": len(relevant_chunks), "cached": cached},
+                                 ensure_ascii=False) + "\n")
+        out.flush()
+
+    answered = 0
+    with open(questions_path, "r", encoding="utf-8") as questions_file, \
+            open(answers_path, "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=args.workers) as executor:
+        records = []
+        for line in questions_file:
+            if line.strip():
+                records.append(json.loads(line))
+            if len(records) == args.batch_size:
+                flush(records, out, executor)
+                answered += len(records)
+                records = []
+                print(f"Answered {answered} questions...")
+        if records:
+            flush(records, out, executor)
+            answered += len(records)
+
+    print(f"\nWrote {answered} answers to {answers_path}"
+          + (f" ({cache.hits} served from the answer cache)." if cache else "."))
+
+def serve_questions(index, text_chunks, args, cache=None, keyword_index=None, reranker=None):
+    """
+    HTTP mode: concurrent questions are micro-batched into one embedding pass and FAISS search,
+    then answered by up to --workers concurrent GPT-4 calls (see server.py).
+    """
+    async_client = create_openai_client(asynchronous=True)
+
+    def prepare_batch(questions):
+        answers, batch_chunks, query_embeddings = lookup_and_retrieve(questions, index, text_chunks, args.top_k,
+                                                                      args.min_score, cache, keyword_index, reranker)
+        return list(zip(answers, batch_chunks, query_embeddings))  # The embedding is reused to cache the answer
+
+    def remember(question, answer, query_embedding):
+        if worth_caching(answer):
+            cache.put_batch([question], [answer], query_embedding[None])
+
+    async def generate(question, relevant_chunks):
+        prompt = build_prompt(question, relevant_chunks)
+        if prompt is None:
+            return NO_ANSWER
+        with tracer.span("llm", model="gpt-4") as span:
+            response = await async_client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": prompt}])
+            record_usage(span, response)
+        return response.choices[0].message.content
+
+    server = QueryServer(prepare_batch, generate, remember=remember if cache else None,
+                         max_batch=args.batch_size, max_concurrent_llm=args.workers, max_pending=args.max_pending)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
 def main():
     """Loads PDFs, builds FAISS index, and starts an interactive Q&A loop."""
-    
+    args = parse_args()
+    tracer.configure(args.trace)
+    get_api_key()  # Asked before the (possibly long) ingestion rather than at the first question
+
     pdf_files = [os.path.join(PDF_DIR, f) for f in os.listdir(PDF_DIR) if f.endswith(".pdf")]
     
     if not pdf_files:
         print("No PDF files found in the 'pdfs' directory. Please add PDFs and try again.")
         return
     
-    all_text = "\n".join([extract_text_from_pdf(pdf) for pdf in pdf_files])
-    text_chunks = all_text.split("\n\n")  # Simple chunking by paragraphs
+    # Load the FAISS index from disk, re-embedding only new or modified PDFs
+    store = IndexStore(INDEX_DIR, embedding_id=EMBEDDING_ID, index_type=args.index_type, metric=INDEX_METRIC,
+                       count_tokens=count_tokens, keyword_search=not args.dense_only)
+    with tracer.span("ingest", files=len(pdf_files)) as span:
+        index, text_chunks = store.sync(sorted(pdf_files), embed_pdfs)
+        context_packer.register(text_chunks, store.token_counts)
+        span.set(chunks=len(text_chunks))
+    keyword_index = store.keyword_index  # None with --dense-only
+    reranker = Reranker(candidates=args.rerank_candidates, budget_ms=args.rerank_budget_ms) if args.rerank else None
+    set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+    if args.recall_report:
+        report = recall_report(index, store.load_embeddings(), metric=INDEX_METRIC)
+        print(f"\n{args.index_type} vs flat:")
+        for key, value in report.items():
+            print(f"  {key}: {value:.3f}" if isinstance(value, float) else f"  {key}: {value}")
+        return
 
-    # Build FAISS index
-    index, chunks = build_faiss_index(text_chunks)
+    cache = None
+    if not args.no_cache:
+        cache = SemanticCache(ANSWER_CACHE_DIR, embed_queries,
+                              corpus_id=store.corpus_id, threshold=ANSWER_CACHE_THRESHOLD)
 
+    if args.questions:
+        answer_questions_file(args.questions, args.answers, index, text_chunks, args, cache, keyword_index, reranker)
+        return
+
+    if args.serve:
+        serve_questions(index, text_chunks, args, cache, keyword_index, reranker)
+        return
+
+    chunk_rows = {chunk: row for row, chunk in enumerate(text_chunks)}
     print("\nReady for questions! Type 'exit' to quit.")
 
     while True:
@@ -154,14 +557,37 @@ def main():
             print("\nExiting. Thanks for using the PDF Q&A system!")
             break
 
-        relevant_chunks = retrieve_relevant_chunks(query, index, text_chunks, top_k=5)  # Increase retrieval depth
+        with tracer.span("question") as span:
+            cached_answer = query_embedding = None
+            if cache:
+                query_embedding = embed_queries([query])  # Embedded once for the lookup, the retrieval and the cache
+                with tracer.span("answer_cache", queries=1) as cache_span:
+                    cached_answer = cache.lookup_batch([query], query_embedding)[0]
+                    cache_span.set(cache_hits=int(cached_answer is not None))
+            if cached_answer is not None:
+                print("\n💡 Answer (cached):\n", cached_answer)
+                span.set(cached=True)
+                continue
+
+            relevant_chunks = retrieve_relevant_chunks(query, index, text_chunks, top_k=args.top_k, min_score=args.min_score,
+                                                       keyword_index=keyword_index, reranker=reranker,
+                                                       query_embedding=query_embedding)
+            span.set(cached=False, chunks=len(relevant_chunks))
 
-        if not relevant_chunks:
-            print("\nNo relevant text found! Try rephrasing your question.\n")
-            continue
+            if not relevant_chunks:
+                print("\nNo relevant text found! Try rephrasing your question.\n")
+                continue
 
-        answer = generate_answer(query, relevant_chunks)
-        print("\n💡 Answer:\n", answer)
+            print("\n💡 Answer:\n", end=" ", flush=True)
+            tokens = []
+            for token in stream_answer(query, relevant_chunks):
+                print(token, end="", flush=True)
+                tokens.append(token)
+            print()
+            print("\n📄 Sources:", ", ".join(format_sources(relevant_chunks, chunk_rows, store)))
+            answer = "".join(tokens)
+            if cache and worth_caching(answer):
+                cache.put_batch([query], [answer], query_embedding)
 
 # ==========================================
 # RUN MAIN FUNCTION
@@ -10,6 +10,7 @@
 # SETUP
 import getpass
 import os
+import sys
 import openai
 from langchain_openai import OpenAI
 from langchain_community.document_loaders import PyPDFLoader
@@ -17,7 +18,12 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.retrievers import BaseRetriever
+from langchain.retrievers import EnsembleRetriever
 from langchain.chains import RetrievalQA
+from bm25 import BM25Index # Keyword index, fused with FAISS hits for exact-term queries
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repository root, for the shared tracing.py
+from tracing import tracer, langchain_callbacks # Per-stage spans (off unless RAG_TRACE names an exporter)
 
 # ==========================================
 # SETTING UP OPENAI API KEY
@@ -37,29 +43,93 @@ else:
 PDF_DIR = "./pdfs"
 os.makedirs(PDF_DIR, exist_ok=True)
 
+# Optional cross-encoder reranking (rerank.py): retrieve more candidates, keep the best RERANK_TOP_K
+RERANK = False
+RERANK_TOP_K = 3
+
+# Chunks handed to the LLM, after fusing the dense and keyword rankings (each contributes up to that many)
+TOP_K = 4
+# Keyword hits must cover this share of the query's term weight (see BM25Index.search)
+KEYWORD_MIN_COVERAGE = 0.3
+
 def load_pdfs(directory):
     """Loads all PDFs in a directory and extracts text."""
     documents = []
-    for filename in os.listdir(directory):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(directory, filename)
-            loader = PyPDFLoader(pdf_path)
-            documents.extend(loader.load())
+    with tracer.span("load_pdfs") as span:
+        for filename in os.listdir(directory):
+            if filename.endswith(".pdf"):
+                pdf_path = os.path.join(directory, filename)
+                loader = PyPDFLoader(pdf_path)
+                documents.extend(loader.load())
+                span.add("files")
+        span.set(pages=len(documents))
     return documents
     
 def process_documents(documents):
     """Splits documents into chunks."""
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    return text_splitter.split_documents(documents)
+    with tracer.span("split", pages=len(documents)) as span:
+        chunks = text_splitter.split_documents(documents)
+        span.set(chunks=len(chunks))
+    return chunks
 
 # ==========================================
 # RETRIEVER - FAISS VECTORSTORE FOR EMBEDDINGS
 # ==========================================
+class KeywordRetriever(BaseRetriever):
+    """BM25 search over the chunks (see bm25.py) as a LangChain retriever."""
+    keyword_index: BM25Index
+    documents: list
+    k: int = TOP_K
+    min_coverage: float = KEYWORD_MIN_COVERAGE
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return [self.documents[i] for i, _ in self.keyword_index.search(query, self.k, self.min_coverage)]
+
+class TopKRetriever(BaseRetriever):
+    """Keeps the first `k` chunks of `base`: the ensemble returns the union of its retrievers' hits, up to 2k."""
+    base: BaseRetriever
+    k: int = TOP_K
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self.base.invoke(query)[:self.k]
+
+class RerankingRetriever(BaseRetriever):
+    """Over-fetches from `base` and keeps the `k` chunks the cross-encoder scores best (within its time budget)."""
+    base: BaseRetriever
+    reranker: object
+    k: int = RERANK_TOP_K
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        documents = self.base.invoke(query)
+        by_text = {document.page_content: document for document in documents}
+        return [by_text[text] for text in self.reranker.rerank(query, list(by_text), self.k)]
+
 def build_faiss_vectorstore(chunks):
-    """Embeds text chunks and stores them in a FAISS index."""
+    """
+    Embeds text chunks and stores them in a FAISS index, with a BM25 index built alongside.
+    The returned retriever merges both rankings by reciprocal-rank fusion and keeps the TOP_K best chunks.
+    """
     embeddings = OpenAIEmbeddings(openai_api_key = api_key)
-    vectorstore = FAISS.from_documents(chunks, embeddings)
-    retriever = VectorStoreRetriever(vectorstore = vectorstore)
+    with tracer.span("index", chunks=len(chunks)):
+        vectorstore = FAISS.from_documents(chunks, embeddings)
+    candidates = TOP_K
+    if RERANK:
+        from rerank import Reranker, RERANK_CANDIDATES # Loads a local model: only imported when enabled
+        candidates = RERANK_CANDIDATES
+    dense_retriever = VectorStoreRetriever(vectorstore = vectorstore, search_kwargs = {"k": candidates})
+    with tracer.span("bm25_build", chunks=len(chunks)):
+        keyword_index = BM25Index.build([chunk.page_content for chunk in chunks])
+    keyword_retriever = KeywordRetriever(keyword_index=keyword_index, documents=chunks, k=candidates)
+    retriever = EnsembleRetriever(retrievers=[dense_retriever, keyword_retriever], weights=[0.5, 0.5])
+    if RERANK:
+        retriever = RerankingRetriever(base=retriever, reranker=Reranker())  # Cuts to RERANK_TOP_K itself
+    else:
+        retriever = TopKRetriever(base=retriever)
     return retriever
 
 # ==========================================
@@ -71,13 +141,16 @@ def query_documents(query, retriever):
         llm=OpenAI(api_key = api_key),
         retriever=retriever
     )
-    response = qa_chain.invoke({"query": query})
+    # The callbacks add the retrieval and LLM spans (chunks found, token usage) under the question's span
+    with tracer.span("question"):
+        response = qa_chain.invoke({"query": query}, config={"callbacks": langchain_callbacks()})
     return response["result"] if isinstance(response, dict) and "result" in response else response
 
 # ==========================================
 # MAIN EXECUTION
 # ==========================================
 def main():
+    tracer.configure()
     pdf_documents = load_pdfs(PDF_DIR)
     if not pdf_documents:
         print("No PDFs found. Add PDFs to the 'pdfs' directory and try again.")
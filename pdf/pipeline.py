@@ -0,0 +1,101 @@
+# ==========================================
+# STREAMING INGESTION PIPELINE
+# page -> chunk -> embedding batch, as generators connected by a bounded buffer,
+# so memory stays flat whatever the corpus size and embedding overlaps extraction.
+# ==========================================
+import threading
+from collections import deque
+from extraction import iter_pdf_pages # Repository root, shared with the teaching assistant
+from chunking import iter_page_chunks
+
+BATCH_SIZE = 64
+MAX_BUFFER_MB = 64
+
+# ==========================================
+# BOUNDED BUFFER BETWEEN THE STAGES
+# ==========================================
+class BoundedBuffer:
+    """Thread-safe FIFO bounded by the total size of what it holds rather than by item count."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.items = deque()
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, item, size):
+        """Blocks while the buffer is full; returns False if the consumer went away."""
+        with self.condition:
+            # An item larger than the whole budget is still let through once the buffer is empty
+            self.condition.wait_for(lambda: self.closed or not self.items or self.size + size <= self.max_bytes)
+            if self.closed:
+                return False
+            self.items.append((item, size))
+            self.size += size
+            self.condition.notify_all()
+            return True
+
+    def get(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.items)
+            item, size = self.items.popleft()
+            self.size -= size
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+# ==========================================
+# GENERATOR STAGES
+# ==========================================
+def iter_chunks(pages):
+    """page -> chunk: yields (pdf_path, chunk, (page_number, start, end)), token-bounded and deduplicated (see chunking.py)."""
+    return iter_page_chunks(pages)
+
+def iter_batches(chunks, batch_size=BATCH_SIZE):
+    """chunk -> batch: groups chunk records into lists of at most `batch_size`."""
+    batch = []
+    for item in chunks:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+_DONE = object()
+
+def stream_embeddings(pdf_files, embed_fn, batch_size=BATCH_SIZE, max_buffer_mb=MAX_BUFFER_MB, max_workers=None):
+    """
+    batch -> embedding: yields (pdf_paths, chunks, vectors, locations) per batch, in file order,
+    where locations are the (page_number, start, end) of each chunk in its page text.
+    Extraction and chunking run on a background thread and block once `max_buffer_mb`
+    of chunk text is waiting, so embedding overlaps extraction without unbounded memory.
+    """
+    buffer = BoundedBuffer(max_buffer_mb * 1024 * 1024)
+
+    def produce():
+        try:
+            for batch in iter_batches(iter_chunks(iter_pdf_pages(pdf_files, max_workers=max_workers)), batch_size):
+                if not buffer.put(batch, sum(len(chunk) for _, chunk, _ in batch)):
+                    return
+            buffer.put(_DONE, 0)
+        except BaseException as e:
+            buffer.put(e, 0)
+
+    producer = threading.Thread(target=produce, name="pdf-extraction", daemon=True)
+    producer.start()
+    try:
+        while True:
+            batch = buffer.get()
+            if batch is _DONE:
+                break
+            if isinstance(batch, BaseException):
+                raise batch
+            pdf_paths, chunks, locations = zip(*batch)
+            yield list(pdf_paths), list(chunks), embed_fn(list(chunks)), list(locations)
+    finally:
+        buffer.close()  # Unblocks the producer if the consumer stopped early
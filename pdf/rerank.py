@@ -0,0 +1,60 @@
+# ==========================================
+# CROSS-ENCODER RERANKING
+# Over-fetched retrieval candidates are rescored by a small CPU cross-encoder that reads
+# query and chunk together, so fewer (but better) chunks reach the LLM.
+# A time budget bounds the CPU cost: past it, the retrieval order is kept.
+# ==========================================
+import time
+
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20  # Chunks retrieved per query before reranking
+RERANK_BUDGET_MS = 300
+RERANK_BATCH_SIZE = 32
+
+class Reranker:
+    def __init__(self, model_name=RERANK_MODEL_NAME, candidates=RERANK_CANDIDATES, budget_ms=RERANK_BUDGET_MS,
+                 batch_size=RERANK_BATCH_SIZE):
+        from sentence_transformers import CrossEncoder  # Imported here: pdf.py loads this module even without --rerank
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.candidates = candidates
+        self.budget_ms = budget_ms
+        self.batch_size = batch_size
+        self.reranked = self.fallbacks = 0
+
+    def rerank_batch(self, queries, candidate_lists, top_k, max_score_drop=None, return_scores=False):
+        """
+        Reorders each query's candidates by cross-encoder score (a relevance probability in [0, 1]) and keeps `top_k`,
+        dropping those more than `max_score_drop` below the best one if given.
+        (query, chunk) pairs of all queries are scored together in batches; if the budget runs out,
+        queries not fully scored keep their retrieval order (and get None scores with `return_scores`).
+        """
+        pairs = [(query, chunk) for query, chunks in zip(queries, candidate_lists) for chunk in chunks]
+        scores, start_time = [], time.perf_counter()
+        for start in range(0, len(pairs), self.batch_size):
+            if (time.perf_counter() - start_time) * 1000 > self.budget_ms:
+                break
+            scores.extend(self.model.predict(pairs[start:start + self.batch_size], batch_size=self.batch_size,
+                                             show_progress_bar=False).tolist())
+
+        results, offset = [], 0
+        for chunks in candidate_lists:
+            chunk_scores = scores[offset:offset + len(chunks)]
+            if len(chunk_scores) == len(chunks):
+                hits = sorted(zip(chunks, chunk_scores), key=lambda hit: hit[1], reverse=True)[:top_k]
+                if hits and max_score_drop is not None:
+                    hits = [(chunk, score) for chunk, score in hits if score >= hits[0][1] - max_score_drop]
+                results.append(hits)
+                self.reranked += 1
+            else:
+                results.append([(chunk, None) for chunk in chunks[:top_k]])  # Over budget: retrieval order
+                self.fallbacks += 1
+            offset += len(chunks)
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        print(f"\nReranked {len(pairs)} candidates in {elapsed_ms:.0f} ms"
+              + (f" (budget of {self.budget_ms} ms exceeded, {len(pairs) - len(scores)} left in retrieval order)."
+                 if len(scores) < len(pairs) else "."))  # Debugging
+        return results if return_scores else [[chunk for chunk, _ in hits] for hits in results]
+
+    def rerank(self, query, chunks, top_k):
+        return self.rerank_batch([query], [chunks], top_k)[0]
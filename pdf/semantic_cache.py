@@ -0,0 +1,132 @@
+# ==========================================
+# SEMANTIC ANSWER CACHE
+# Answers a question from a previous answer when a near-identical question
+# (by embedding similarity) was already asked against the same corpus.
+# ==========================================
+import json
+import os
+import threading
+import time
+import faiss
+import numpy as np
+
+ENTRIES_FILE = "answers.json"
+VECTORS_FILE = "questions.npy"
+
+class SemanticCache:
+    """
+    Small FAISS inner-product index of past questions (L2-normalized embeddings) with their answers.
+    Entries expire after `ttl_seconds`, the least recently used ones are evicted past `max_entries`,
+    and the whole cache is dropped when `corpus_id` differs from the one it was saved with.
+    """
+    def __init__(self, directory, embed_fn, corpus_id, threshold=0.92, max_entries=1000, ttl_seconds=7 * 24 * 3600):
+        self.directory = directory
+        self.embed_fn = embed_fn  # list of questions -> normalized float32 vectors
+        self.corpus_id = corpus_id
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.entries, self.vectors, self.index = [], None, None
+        self.hits = self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path(ENTRIES_FILE), "r", encoding="utf-8") as file:
+                saved = json.load(file)
+            vectors = np.load(self._path(VECTORS_FILE))
+        except (OSError, ValueError):
+            return
+        if saved.get("corpus_id") != self.corpus_id or len(saved["entries"]) != len(vectors):
+            print("\nDocuments changed since the answer cache was saved: starting with an empty cache.")
+            return
+        self.entries, self.vectors = saved["entries"], vectors
+        self._expire()
+        self._rebuild_index()
+
+    def _save(self):
+        """Writes vectors then entries, each through a temporary file; a torn pair is rejected on load."""
+        vectors = self.vectors if self.vectors is not None else np.zeros((0, 0), dtype=np.float32)
+        with open(self._path(VECTORS_FILE) + ".tmp", "wb") as file:
+            np.save(file, vectors)
+        os.replace(self._path(VECTORS_FILE) + ".tmp", self._path(VECTORS_FILE))
+        with open(self._path(ENTRIES_FILE) + ".tmp", "w", encoding="utf-8") as file:
+            json.dump({"corpus_id": self.corpus_id, "entries": self.entries}, file, ensure_ascii=False)
+        os.replace(self._path(ENTRIES_FILE) + ".tmp", self._path(ENTRIES_FILE))
+
+    def _rebuild_index(self):
+        """The cache is small, so evictions simply rebuild the flat index."""
+        if not self.entries:
+            self.vectors, self.index = None, None
+            return
+        self.index = faiss.IndexFlatIP(self.vectors.shape[1])
+        self.index.add(self.vectors)
+
+    def _keep(self, rows):
+        self.entries = [self.entries[i] for i in rows]
+        self.vectors = self.vectors[rows] if rows else None
+        self._rebuild_index()
+
+    def _expire(self):
+        now = time.time()
+        fresh = [i for i, entry in enumerate(self.entries) if now - entry["created"] <= self.ttl_seconds]
+        if len(fresh) != len(self.entries):
+            self._keep(fresh)
+
+    def lookup_batch(self, questions, question_vectors=None):
+        """Returns the cached answer (or None) for each question, embedding them in one pass."""
+        if question_vectors is None:
+            question_vectors = self.embed_fn(list(questions))
+        with self.lock:
+            self._expire()
+            if self.index is None:
+                self.misses += len(questions)
+                return [None] * len(questions)
+            scores, indices = self.index.search(np.ascontiguousarray(question_vectors, dtype=np.float32), 1)
+            answers, now = [], time.time()
+            for score, i in zip(scores[:, 0], indices[:, 0]):
+                if i >= 0 and score >= self.threshold:
+                    self.entries[i]["last_used"] = now
+                    answers.append(self.entries[i]["answer"])
+                    self.hits += 1
+                else:
+                    answers.append(None)
+                    self.misses += 1
+            return answers
+
+    def lookup(self, question):
+        return self.lookup_batch([question])[0]
+
+    def put_batch(self, questions, answers, question_vectors=None):
+        """Stores answers, evicting the least recently used entries beyond `max_entries`, and saves to disk."""
+        if not questions:
+            return
+        if question_vectors is None:
+            question_vectors = self.embed_fn(list(questions))
+        question_vectors = np.asarray(question_vectors, dtype=np.float32)
+        with self.lock:
+            now = time.time()
+            self.entries.extend({"question": q, "answer": a, "created": now, "last_used": now}
+                                for q, a in zip(questions, answers))
+            self.vectors = question_vectors if self.vectors is None else np.concatenate([self.vectors, question_vectors])
+            if len(self.entries) > self.max_entries:
+                by_recency = sorted(range(len(self.entries)), key=lambda i: self.entries[i]["last_used"], reverse=True)
+                self._keep(sorted(by_recency[:self.max_entries]))
+            else:
+                if self.index is None:
+                    self.index = faiss.IndexFlatIP(question_vectors.shape[1])
+                self.index.add(question_vectors)
+            self._save()
+
+    def put(self, question, answer):
+        self.put_batch([question], [answer])
+
+    def clear(self):
+        with self.lock:
+            self.entries, self.vectors, self.index = [], None, None
+            self._save()
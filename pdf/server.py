@@ -0,0 +1,238 @@
+# ==========================================
+# ASYNC QUERY SERVER
+# Serves the RAG pipeline over HTTP to many concurrent users: incoming questions are
+# micro-batched into one embedding pass + one FAISS search, LLM calls run concurrently
+# under a semaphore, and requests beyond the queue limit are rejected (503) instead of piling up.
+# Standard library only (asyncio streams), so it runs anywhere pdf.py runs.
+# ==========================================
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Micro-batching: a batch closes at MAX_BATCH questions or MAX_WAIT_MS after its first question
+MAX_BATCH = 64
+MAX_WAIT_MS = 5
+
+# Concurrent LLM calls, and requests admitted (queued or in progress) before answering 503
+MAX_CONCURRENT_LLM = 16
+MAX_PENDING = 512
+
+MAX_BODY_BYTES = 1 << 20
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+# ==========================================
+# MINIMAL HTTP/1.1 (keep-alive, Content-Length bodies)
+# ==========================================
+async def read_message(reader):
+    """Reads one HTTP request or response; returns (start line parts, headers, body) or None at EOF."""
+    line = await reader.readline()
+    if not line:
+        return None
+    start = line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise ValueError("body too large")
+    body = await reader.readexactly(length) if length else b""
+    return start, headers, body
+
+def encode_message(start_line, body, headers=None):
+    """Serializes a start line, headers and a body (bytes) with Content-Length framing."""
+    lines = [start_line, f"Content-Length: {len(body)}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+async def write_json(writer, status, obj, headers=None):
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    writer.write(encode_message(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}", body,
+                                {"Content-Type": "application/json", **(headers or {})}))
+    await writer.drain()
+
+async def post_json(reader, writer, host, path, obj):
+    """Client side: POSTs a JSON body on an open keep-alive connection and returns (status, decoded body)."""
+    body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    writer.write(encode_message(f"POST {path} HTTP/1.1", body, {"Host": host, "Content-Type": "application/json"}))
+    await writer.drain()
+    message = await read_message(reader)
+    if message is None:
+        raise ConnectionError("connection closed by server")
+    start, _, body = message
+    return int(start[1]), json.loads(body) if body else None
+
+# ==========================================
+# MICRO-BATCHER
+# ==========================================
+class MicroBatcher:
+    """
+    Groups items submitted concurrently into batches for `process_batch(items) -> results`,
+    which runs on a single worker thread (it is CPU-bound: embedding + FAISS search).
+    """
+    def __init__(self, process_batch, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.process_batch = process_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batcher")
+        self.batches = self.items = 0
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, item):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((item, future))
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0 and self.queue.empty():
+                break
+            try:
+                batch.append(self.queue.get_nowait() if remaining <= 0 else
+                             await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.process_batch, items)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                if not future.done():  # The client may have gone away
+                    future.set_result(result)
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+        self.executor.shutdown(wait=False)
+
+# ==========================================
+# QUERY SERVER
+# ==========================================
+class QueryServer:
+    """
+    POST /ask {"question": ...} -> {"answer", "cached", "chunks_used", "latency_ms"}; GET /health -> counters.
+    `prepare_batch(questions)` runs retrieval for a micro-batch and returns (cached answer or None, chunks, key) per question;
+    `generate(question, chunks)` is the async LLM call; `remember(question, answer, key)` (optional) stores fresh answers,
+    `key` being what prepare_batch returned with the chunks (e.g. the question embedding, so it is not computed twice).
+    """
+    def __init__(self, prepare_batch, generate, remember=None, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS,
+                 max_concurrent_llm=MAX_CONCURRENT_LLM, max_pending=MAX_PENDING):
+        self.batcher = MicroBatcher(prepare_batch, max_batch, max_wait_ms)
+        self.generate = generate
+        self.remember = remember
+        self.max_concurrent_llm = max_concurrent_llm
+        self.max_pending = max_pending
+        self.llm_slots = None  # asyncio.Semaphore, created on the serving loop
+        self.pending = 0
+        self.served = self.rejected = self.failed = 0
+
+    async def answer(self, question):
+        cached_answer, chunks, key = await self.batcher.submit(question)
+        if cached_answer is not None:
+            return {"answer": cached_answer, "cached": True, "chunks_used": 0}
+        if not chunks:
+            return {"answer": "I don't know based on the provided documents.", "cached": False, "chunks_used": 0}
+        async with self.llm_slots:
+            answer = await self.generate(question, chunks)
+        if self.remember:
+            await asyncio.get_running_loop().run_in_executor(None, self.remember, question, answer, key)
+        return {"answer": answer, "cached": False, "chunks_used": len(chunks)}
+
+    async def handle_ask(self, writer, body):
+        try:
+            question = json.loads(body)["question"].strip()
+        except (ValueError, KeyError, TypeError, AttributeError):
+            await write_json(writer, 400, {"error": "expected a JSON body {\"question\": \"...\"}"})
+            return
+        if self.pending >= self.max_pending:
+            # Backpressure: fail fast rather than queue requests that would time out anyway
+            self.rejected += 1
+            await write_json(writer, 503, {"error": "server busy, retry later"}, {"Retry-After": "1"})
+            return
+
+        self.pending += 1
+        start_time = time.perf_counter()
+        try:
+            result = await self.answer(question)
+        except Exception as e:
+            self.failed += 1
+            print(f"\nError answering '{question}': {e}")
+            await write_json(writer, 500, {"error": str(e)})
+            return
+        finally:
+            self.pending -= 1
+        self.served += 1
+        await write_json(writer, 200, {**result, "latency_ms": (time.perf_counter() - start_time) * 1000})
+
+    def stats(self):
+        return {"status": "ok", "pending": self.pending, "served": self.served, "rejected": self.rejected,
+                "failed": self.failed, "batches": self.batcher.batches,
+                "avg_batch": self.batcher.items / max(self.batcher.batches, 1)}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    message = await read_message(reader)
+                except ValueError:
+                    await write_json(writer, 413, {"error": "request too large"})
+                    break
+                if message is None:
+                    break
+                start, headers, body = message
+                if len(start) < 2:
+                    await write_json(writer, 400, {"error": "malformed request line"})
+                    break
+                method, path = start[0], start[1]
+                if path == "/ask":
+                    if method != "POST":
+                        await write_json(writer, 405, {"error": "use POST"})
+                    else:
+                        await self.handle_ask(writer, body)
+                elif path == "/health":
+                    await write_json(writer, 200, self.stats())
+                else:
+                    await write_json(writer, 404, {"error": f"unknown path {path}"})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        self.llm_slots = asyncio.Semaphore(self.max_concurrent_llm)
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        print(f"\nServing questions on http://{host}:{port}/ask "
+              f"(batches of up to {self.batcher.max_batch}, {self.max_concurrent_llm} concurrent LLM calls).")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.batcher.close()
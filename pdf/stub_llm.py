@@ -0,0 +1,50 @@
+# ==========================================
+# STUB LLM ENDPOINT
+# OpenAI-compatible /v1/chat/completions that answers after a simulated delay,
+# so the query server can be load-tested offline without spending tokens.
+# Point the OpenAI client at it with OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+# ==========================================
+import argparse
+import asyncio
+import random
+import time
+from server import read_message, write_json
+
+async def handle_connection(reader, writer, args):
+    try:
+        while True:
+            message = await read_message(reader)
+            if message is None:
+                break
+            start, _, _ = message
+            if not start[1].endswith("/chat/completions"):
+                await write_json(writer, 404, {"error": {"message": f"unknown path {start[1]}"}})
+                continue
+            await asyncio.sleep(max(0.0, random.gauss(args.latency_ms, args.jitter_ms)) / 1000)
+            await write_json(writer, 200, {
+                "id": f"stub-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": "stub",
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "Stub answer based on the provided documents."}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def main(args):
+    server = await asyncio.start_server(lambda r, w: handle_connection(r, w, args), args.host, args.port, backlog=1024)
+    print(f"Stub LLM listening on http://{args.host}:{args.port}/v1 ({args.latency_ms:.0f} ± {args.jitter_ms:.0f} ms per call)")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions endpoint for offline load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=300, help="Mean simulated completion time")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Standard deviation of the completion time")
+    asyncio.run(main(parser.parse_args()))
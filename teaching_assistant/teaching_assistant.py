@@ -10,20 +10,64 @@
 # SETUP
 import logging
 import getpass
+import hashlib
+import json
 import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import faiss
+import httpx
 import tkinter as tk
-from tkinter import scrolledtext, messagebox, Radiobutton, IntVar, StringVar, Checkbutton
+from tkinter import ttk, scrolledtext, messagebox, Radiobutton, IntVar, StringVar, Checkbutton
 from langchain_openai import OpenAI
-from langchain_community.document_loaders import PyPDFLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_core.vectorstores import VectorStoreRetriever
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import Document
+from langchain_core.callbacks import BaseCallbackHandler
+import numpy as np
 from langchain.chains import RetrievalQA
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repository root, for the shared modules
+from tracing import tracer, langchain_callbacks # Per-stage spans (off unless RAG_TRACE names an exporter)
+from embedding_cache import EmbeddingCache # Content-addressed store of chunk embeddings, shared with pdf.py
+from near_duplicates import NearDuplicateIndex # MinHash + LSH, shared with the Gmail assistant
+from extraction import iter_pdf_pages # Parallel page extraction, shared with pdf.py
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# How often the lessons directory is checked for added, modified or removed PDFs
+WATCH_INTERVAL_MS = 5000
+
+# Semantic answer cache for Open-Questions: where it lives and how similar a question must be to reuse an answer
+ANSWER_CACHE_DIR = "./answer_cache"
+ANSWER_CACHE_THRESHOLD = 0.92
+# What the model is told to answer when the lessons do not cover a question (such answers are never cached)
+NO_ANSWER = "This is not covered in the lessons."
+
+# Chunks already embedded once (in any lesson, in any session) are read back from here instead of re-paid
+EMBEDDING_CACHE_PATH = "./embedding_cache.sqlite"
+
+# Ready-to-serve questions per mode, generated in the background and kept across sessions
+QUESTION_POOL_PATH = "./question_pool.json"
+QUESTION_POOL_SIZE = 8
+QUESTION_BATCH_SIZE = 4
+QUESTION_MODES = ("MCQ", "Open-Answer")
+# Topic clusters the lessons are split into when sampling chunks to ask about
+TOPIC_CLUSTERS = 32
+
+# Chunks whose word 5-grams overlap at least this much (MinHash estimate) share one vector,
+# e.g. headers and footers repeated on every slide
+NEAR_DUP_THRESHOLD = 0.8
+
 # ==========================================
 # CLASSES FOR MODULARIZATION
 # ==========================================
@@ -32,118 +76,801 @@ class PDFProcessor:
     def __init__(self, directory):
         self.directory = directory
 
-    def load_pdfs(self):
-        """Loads all Lessons' PDFs in a directory and extracts text."""
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def _load(self, filenames, max_workers=None):
+        """
+        One Document per page, in file and page order. Files and page ranges of large files are extracted in parallel
+        by the shared extraction pool (forkserver/spawn workers: this runs on a worker thread next to Tk and httpx);
+        a PDF that fails is skipped whole.
+        """
+        if not filenames:
+            return []
+        start_time = time.perf_counter()
         documents = []
-        for filename in os.listdir(self.directory):
-            if filename.endswith(".pdf"):
-                pdf_path = os.path.join(self.directory, filename)
-                try:
-                    loader = PyPDFLoader(pdf_path)
-                    documents.extend(loader.load())
-                    logging.info(f"Successfully loaded {filename}")
-                except Exception as e:
-                    logging.error(f"Error loading {filename}: {e}")
+        with tracer.span("load_pdfs", files=len(filenames)) as span:
+            for pdf_path, page, text in iter_pdf_pages([self.path(filename) for filename in filenames], max_workers):
+                documents.append(Document(page_content=text, metadata={"source": pdf_path, "page": page}))
+            span.set(pages=len(documents))
+        elapsed = time.perf_counter() - start_time
+        logging.info(f"Loaded {len(documents)} pages from {len(filenames)} PDFs in {elapsed:.1f}s "
+                     f"({len(documents) / elapsed if elapsed else 0:.1f} pages/s)")
         return documents
 
+    def load_pdf(self, filename):
+        """Loads a single Lesson's PDF and extracts text (its page ranges in parallel)."""
+        return self._load([filename])
+
+    def load_pdfs(self, max_workers=None):
+        """Loads all Lessons' PDFs in a directory and extracts text."""
+        return self._load(sorted(filename for filename in os.listdir(self.directory) if filename.endswith(".pdf")), max_workers)
+
     def process_documents(self, documents):
         """Splits documents into chunks."""
         try:
             text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-            chunks = text_splitter.split_documents(documents)
+            with tracer.span("split", pages=len(documents)) as span:
+                chunks = text_splitter.split_documents(documents)
+                span.set(chunks=len(chunks))
             logging.info(f"Processed {len(documents)} documents into {len(chunks)} chunks")
             return chunks
         except Exception as e:
             logging.error(f"Error processing documents: {e}")
             return []
 
+class LessonWatcher:
+    """Polls the lessons directory and reports which PDFs changed since the previous scan."""
+    def __init__(self, directory):
+        self.directory = directory
+        self.snapshot = {}
+
+    def scan(self):
+        """Returns (changed, removed) filenames; a file counts as changed when its mtime or size moved."""
+        current = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".pdf"):
+                try:
+                    stat = os.stat(os.path.join(self.directory, filename))
+                except OSError:
+                    continue  # Deleted between listdir and stat
+                current[filename] = (stat.st_mtime_ns, stat.st_size)
+        changed = [filename for filename, signature in current.items() if self.snapshot.get(filename) != signature]
+        removed = [filename for filename in self.snapshot if filename not in current]
+        self.snapshot = current
+        return changed, removed
+
+    def rollback(self, filenames, previous):
+        """Puts `filenames` back as they were in the `previous` snapshot, so the next scan reports them again."""
+        for filename in filenames:
+            if filename in previous:
+                self.snapshot[filename] = previous[filename]
+            else:
+                self.snapshot.pop(filename, None)
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain adapter of the shared embedding cache (embedding_cache.py): documents already embedded
+    by the same model are read back instead of sent to the API. Queries are not cached.
+    """
+    def __init__(self, underlying, path, model_id):
+        self.underlying = underlying
+        self.cache = EmbeddingCache(path, model_id)
+
+    @tracer.traced("embed")
+    def embed_documents(self, texts):
+        hits, misses = self.cache.hits, self.cache.misses
+        vectors = self.cache.embed(texts, self.underlying.embed_documents)
+        hits, misses = self.cache.hits - hits, self.cache.misses - misses
+        logging.info(f"Embedded {len(texts)} chunks: {misses} sent to the API, {hits} from cache")
+        tracer.current().set(chunks=len(texts), cache_hits=hits, cache_misses=misses)
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.underlying.embed_query(text)
+
 class EmbeddingRetriever:
     def __init__(self, api_key):
         self.api_key = api_key
+        self.embeddings = None
+        self.vectorstore = None
+        self.document_ids = {}  # source PDF path -> ids of its chunks
+        self.locations = {}  # chunk id -> (source PDF path, page)
+        self.representatives = {}  # chunk id -> id of the vector standing for it (itself unless a near-duplicate)
+        self.near_duplicates = NearDuplicateIndex(NEAR_DUP_THRESHOLD)
+
+    @property
+    def corpus_id(self):
+        """Fingerprint of the indexed chunks; it changes whenever a lesson is added, edited or removed."""
+        digest = hashlib.sha256()
+        for chunk_id in sorted(chunk_id for ids in self.document_ids.values() for chunk_id in ids):
+            digest.update(chunk_id.encode("ascii"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def chunk_id(chunk):
+        """Content-addressed id: an unchanged chunk keeps its id (and its vector) across updates."""
+        key = f"{chunk.metadata.get('source')}|{chunk.metadata.get('page')}|{chunk.page_content}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _location(chunk):
+        return chunk.metadata.get("source"), chunk.metadata.get("page")
+
+    def _index_chunks(self, chunks):
+        """Returns {source: {id: chunk}}, dropping exact duplicates within a page."""
+        by_source = {}
+        for chunk in chunks:
+            by_source.setdefault(chunk.metadata.get("source"), {}).setdefault(self.chunk_id(chunk), chunk)
+        return by_source
+
+    @property
+    def vector_ids(self):
+        """Ids of the chunks that have a vector in the store."""
+        return set(self.representatives.values())
 
+    @staticmethod
+    def _collapse(chunks, near_duplicates, representatives):
+        """
+        Maps every chunk of {id: chunk} to the vector that will stand for it, and returns the chunks that need one:
+        a near-duplicate of an indexed (or earlier) chunk is not embedded, it refers to that chunk's vector.
+        """
+        to_embed = {}
+        for chunk_id, chunk in chunks.items():
+            representative = near_duplicates.add(chunk_id, chunk.page_content)
+            representatives[chunk_id] = representative
+            if representative == chunk_id:
+                to_embed[chunk_id] = chunk
+        tracer.current().set(near_duplicates=len(chunks) - len(to_embed))
+        if chunks:
+            logging.info(f"Near-duplicates: {len(chunks) - len(to_embed)} of {len(chunks)} chunks share another chunk's vector "
+                         f"({(len(chunks) - len(to_embed)) / len(chunks):.0%} dedup ratio)")
+        return to_embed
+
+    @staticmethod
+    def _tag_duplicates(documents, locations, representatives):
+        """
+        Copies of the stored chunks {vector id: chunk} whose "duplicates" metadata lists the other lesson files
+        holding a near-duplicate of them: those chunks share the vector, so they would never show up as a source.
+        A vector kept for the duplicates of a removed chunk cites the first surviving one (`locations`: id -> (source, page)).
+        """
+        referrers = {vector_id: [] for vector_id in documents}
+        for chunk_id, vector_id in representatives.items():
+            if vector_id in referrers:
+                referrers[vector_id].append(chunk_id)
+        tagged = {}
+        for vector_id, document in documents.items():
+            metadata = {key: value for key, value in document.metadata.items() if key != "duplicates"}
+            chunk_ids = sorted(referrers[vector_id], key=lambda chunk_id: (str(locations[chunk_id][0]), locations[chunk_id][1] or 0))
+            if representatives.get(vector_id) != vector_id and chunk_ids:
+                metadata["source"], metadata["page"] = locations[chunk_ids[0]]
+            duplicates = sorted({locations[chunk_id][0] for chunk_id in chunk_ids} - {metadata.get("source")})
+            if duplicates:
+                metadata["duplicates"] = duplicates
+            tagged[vector_id] = Document(page_content=document.page_content, metadata=metadata)
+        return tagged
+
+    def _topic_clusters(self, vectorstore):
+        """Groups chunk ids by k-means cluster of their embeddings; computed once per vector store."""
+        if getattr(self, "_clusters_for", None) is vectorstore:
+            return self._clusters
+        ids = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+        n_clusters = min(TOPIC_CLUSTERS, len(ids))
+        if n_clusters < 2:
+            clusters = [ids]
+        else:
+            vectors = vectorstore.index.reconstruct_n(0, len(ids))
+            kmeans = faiss.Kmeans(vectors.shape[1], n_clusters, niter=20, seed=1234, min_points_per_centroid=1)
+            kmeans.train(vectors)
+            _, labels = kmeans.index.search(vectors, 1)
+            by_label = {}
+            for chunk_id, label in zip(ids, labels[:, 0]):
+                by_label.setdefault(int(label), []).append(chunk_id)
+            clusters = list(by_label.values())
+        self._clusters_for, self._clusters = vectorstore, clusters
+        return clusters
+
+    def sample_diverse_chunks(self, count):
+        """
+        Cluster-stratified sample: one random chunk from each of `count` different topic clusters,
+        so generated questions cover the lessons instead of the few chunks a "random topic" query keeps hitting.
+        Returns (chunk_id, chunk) pairs.
+        """
+        vectorstore = self.vectorstore
+        if vectorstore is None or vectorstore.index.ntotal == 0:
+            return []
+        clusters = self._topic_clusters(vectorstore)
+        picked = random.sample(clusters, min(count, len(clusters)))
+        while len(picked) < count:  # Fewer clusters than requested: go round again
+            picked.append(random.choice(clusters))
+        chunk_ids = [random.choice(cluster) for cluster in picked]
+        return [(chunk_id, vectorstore.docstore.search(chunk_id)) for chunk_id in chunk_ids]
+
+    def _clone_vectorstore(self):
+        """Copies the live vector store so it can be modified while the current retriever keeps serving."""
+        vectorstore = self.vectorstore
+        return FAISS(
+            embedding_function=vectorstore.embedding_function,
+            index=faiss.clone_index(vectorstore.index),
+            docstore=InMemoryDocstore(dict(vectorstore.docstore._dict)),
+            index_to_docstore_id=dict(vectorstore.index_to_docstore_id),
+        )
+
+    def _get_embeddings(self):
+        """OpenAI embeddings behind the on-disk embedding cache, created once and shared by every update."""
+        if self.embeddings is None:
+            openai_embeddings = OpenAIEmbeddings(openai_api_key=self.api_key)
+            self.embeddings = CachedEmbeddings(openai_embeddings, EMBEDDING_CACHE_PATH, model_id=openai_embeddings.model)
+        return self.embeddings
+
+    @tracer.traced("index")
     def build_faiss_vectorstore(self, chunks):
         """Embeds text chunks and stores them in a FAISS index."""
+        tracer.current().set(chunks=len(chunks))
         try:
-            embeddings = OpenAIEmbeddings(openai_api_key=self.api_key)
-            vectorstore = FAISS.from_documents(chunks, embeddings)
+            by_source = self._index_chunks(chunks)
+            near_duplicates, representatives = NearDuplicateIndex(NEAR_DUP_THRESHOLD), {}
+            to_embed = self._collapse({chunk_id: chunk for source_chunks in by_source.values()
+                                       for chunk_id, chunk in source_chunks.items()}, near_duplicates, representatives)
+            document_ids = {source: set(source_chunks) for source, source_chunks in by_source.items()}
+            locations = {chunk_id: self._location(chunk) for source_chunks in by_source.values()
+                         for chunk_id, chunk in source_chunks.items()}
+            to_embed = self._tag_duplicates(to_embed, locations, representatives)
+            vectorstore = FAISS.from_documents(list(to_embed.values()), self._get_embeddings(), ids=list(to_embed))
             retriever = VectorStoreRetriever(vectorstore=vectorstore)
+            self.vectorstore = vectorstore
+            self.document_ids, self.locations = document_ids, locations
+            self.near_duplicates, self.representatives = near_duplicates, representatives
             logging.info("Successfully built FAISS vector store")
             return retriever
         except Exception as e:
             logging.error(f"Error building FAISS vector store: {e}")
             return None
 
-class QueryHandler:
-    def __init__(self, api_key):
-        self.api_key = api_key
-
-    def generate_question(self, mode, retriever):
-        """Generates a question based on the selected mode with a random topic."""
+    @tracer.traced("update_index")
+    def update_documents(self, chunks_by_source, removed_sources):
+        """
+        Applies a delta to the vector store and returns a new retriever.
+        Only chunks not already indexed (nor near-duplicates of indexed ones) are embedded; a vector is deleted
+        once no chunk refers to it anymore.
+        The retriever currently in use is left untouched, so callers can swap to the new one atomically.
+        """
+        if self.vectorstore is None:
+            return self.build_faiss_vectorstore([chunk for chunks in chunks_by_source.values() for chunk in chunks])
         try:
-            if mode == "MCQ":
-                instruction = "Generate a multiple-choice question with options based on a random topic from the information provided in the documents."
-            elif mode == "Open-Answer":
-                instruction = "Generate an open-ended question based on a random topic from the information provided in the documents."
+            document_ids, locations = dict(self.document_ids), dict(self.locations)
+            representatives, near_duplicates = dict(self.representatives), self.near_duplicates.copy()
+            new_chunks_by_id, removed_ids = {}, set()
+            for source, chunks in chunks_by_source.items():
+                new_chunks = self._index_chunks(chunks).get(source, {})
+                old_ids = document_ids.get(source, set())
+                new_chunks_by_id.update({chunk_id: chunk for chunk_id, chunk in new_chunks.items() if chunk_id not in old_ids})
+                removed_ids |= old_ids - new_chunks.keys()
+                document_ids[source] = set(new_chunks)
+            for source in removed_sources:
+                removed_ids |= document_ids.pop(source, set())
+
+            for chunk_id in removed_ids:
+                locations.pop(chunk_id, None)
+            locations.update({chunk_id: self._location(chunk) for chunk_id, chunk in new_chunks_by_id.items()})
+            orphans = {representatives.pop(chunk_id) for chunk_id in removed_ids if chunk_id in representatives}
+            to_delete = orphans - set(representatives.values())  # Vectors still referred to by a duplicate stay
+            for chunk_id in to_delete:
+                near_duplicates.remove(chunk_id)
+            to_add = self._collapse(new_chunks_by_id, near_duplicates, representatives)
+            to_add = self._tag_duplicates(to_add, locations, representatives)
 
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=OpenAI(openai_api_key=self.api_key),
-                retriever=retriever
-            )
+            vectorstore = self._clone_vectorstore()
+            if to_add:
+                vectorstore.add_documents(list(to_add.values()), ids=list(to_add))
+            if to_delete:
+                vectorstore.delete(list(to_delete))
+            # Stored vectors that gained or lost a duplicate (or their own chunk): replaced by tagged copies,
+            # the live store keeps its own
+            retagged = ({representatives[chunk_id] for chunk_id in new_chunks_by_id} | orphans) - to_add.keys() - to_delete
+            docstore = vectorstore.docstore._dict
+            docstore.update(self._tag_duplicates({vector_id: docstore[vector_id] for vector_id in retagged},
+                                                 locations, representatives))
 
-            response = qa_chain.invoke({"query": instruction})
-            return response["result"] if isinstance(response, dict) and "result" in response else response
+            self.vectorstore = vectorstore
+            self.document_ids, self.locations = document_ids, locations
+            self.representatives, self.near_duplicates = representatives, near_duplicates
+            logging.info(f"Updated FAISS vector store: {len(to_add)} chunks embedded, {len(to_delete)} removed")
+            tracer.current().set(chunks_added=len(to_add), chunks_removed=len(to_delete))
+            return VectorStoreRetriever(vectorstore=vectorstore)
         except Exception as e:
-            logging.error(f"Error generating question: {e}")
-            return "Sorry, an error occurred while generating the question."
+            logging.error(f"Error updating FAISS vector store: {e}")
+            return None
+
+class AnswerCache:
+    """
+    Semantic cache of Open-Question answers: past questions live in a small FAISS store
+    (inner product over OpenAI's normalized embeddings = cosine) with the answer in their metadata.
+    Entries expire after `ttl_seconds`, the least recently used are evicted past `max_entries`,
+    and everything is dropped when the lessons corpus changes.
+    """
+    def __init__(self, directory, embeddings, threshold=ANSWER_CACHE_THRESHOLD, max_entries=500, ttl_seconds=7 * 24 * 3600):
+        self.directory = directory
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.corpus_id = None
+        self.vectorstore = None
+        self._load()
 
-    def evaluate_answer(self, mode, question, user_answer, retriever):
-        """Evaluates the user's answer based on the selected mode."""
+    def _load(self):
         try:
-            if mode == "MCQ":
-                # Extract correct answer from the question
-                parts = question.split(')')
-                options = parts[1:]  # Extract options
-                correct_answer = [option.strip().split('.')[1] for option in options if 'correct' in option.lower()]
+            with open(os.path.join(self.directory, "corpus.json"), "r", encoding="utf-8") as file:
+                self.corpus_id = json.load(file)["corpus_id"]
+            if os.path.exists(os.path.join(self.directory, "index.faiss")):
+                # The pickle is one this app wrote itself, hence safe to deserialize
+                self.vectorstore = FAISS.load_local(self.directory, self.embeddings, allow_dangerous_deserialization=True)
+                logging.info(f"Loaded {len(self.vectorstore.index_to_docstore_id)} cached answers")
+        except Exception as e:
+            logging.error(f"Error loading the answer cache, starting empty: {e}")
+            self.corpus_id, self.vectorstore = None, None
 
-                if not correct_answer:
-                    return "Error: Correct answer not identified.", ""
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.vectorstore is not None:
+            self.vectorstore.save_local(self.directory)
+        with open(os.path.join(self.directory, "corpus.json"), "w", encoding="utf-8") as file:
+            json.dump({"corpus_id": self.corpus_id}, file)
 
-                correct_answer = correct_answer[0]
-                is_correct = correct_answer.lower() in [answer.lower() for answer in user_answer]
+    def set_corpus(self, corpus_id):
+        """Invalidates every cached answer if the documents they were based on changed."""
+        with self.lock:
+            if corpus_id == self.corpus_id:
+                return
+            if self.vectorstore is not None:
+                logging.info("Lessons changed: clearing the answer cache")
+            self.corpus_id, self.vectorstore = corpus_id, None
+            for filename in ("index.faiss", "index.pkl"):
+                if os.path.exists(os.path.join(self.directory, filename)):
+                    os.remove(os.path.join(self.directory, filename))
+            self._save()
+
+    @tracer.traced("answer_cache")
+    def lookup(self, query):
+        """Returns the answer of a similar enough past question, or None."""
+        try:
+            with self.lock:
+                if self.vectorstore is None or not self.vectorstore.index_to_docstore_id:
+                    return None
+                document, score = self.vectorstore.similarity_search_with_score(query, k=1)[0]
+                now = time.time()
+                if score < self.threshold or now - document.metadata["created"] > self.ttl_seconds:
+                    return None
+                document.metadata["last_used"] = now
+                tracer.current().set(cache_hits=1)
+                return document.metadata["answer"]
+        except Exception as e:
+            logging.error(f"Error reading the answer cache: {e}")
+            return None
 
-                if is_correct:
-                    return "Correct!", f"Explanation: {question}"
+    def put(self, query, answer, corpus_id=None):
+        """Stores an answer, unless the lessons changed since it was asked (`corpus_id` then differs)."""
+        try:
+            with self.lock:
+                if corpus_id is not None and corpus_id != self.corpus_id:
+                    return
+                now = time.time()
+                metadata = {"answer": answer, "created": now, "last_used": now}
+                if self.vectorstore is None:
+                    self.vectorstore = FAISS.from_texts([query], self.embeddings, metadatas=[metadata],
+                                                        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT)
                 else:
-                    return "Incorrect.", f"Correct Answer: {correct_answer}. Explanation: {question}"
+                    self.vectorstore.add_texts([query], metadatas=[metadata])
+                self._evict(now)
+                self._save()
+        except Exception as e:
+            logging.error(f"Error writing the answer cache: {e}")
+
+    def _evict(self, now):
+        documents = {doc_id: self.vectorstore.docstore.search(doc_id) for doc_id in self.vectorstore.index_to_docstore_id.values()}
+        expired = [doc_id for doc_id, doc in documents.items() if now - doc.metadata["created"] > self.ttl_seconds]
+        live = sorted((doc.metadata["last_used"], doc_id) for doc_id, doc in documents.items() if doc_id not in expired)
+        overflow = [doc_id for _, doc_id in live[:max(0, len(live) - self.max_entries)]]
+        if expired or overflow:
+            self.vectorstore.delete(expired + overflow)
+
+# Shape the model must return for a multiple-choice question; "source_chunk_ids" is filled in locally
+MCQ_SCHEMA = {
+    "type": "object",
+    "required": ["stem", "options", "correct", "explanation"],
+    "properties": {
+        "stem": {"type": "string"},
+        "options": {"type": "array", "items": {"type": "string"}, "minItems": 2, "maxItems": 6},
+        "correct": {"type": "array", "items": {"type": "integer"}, "minItems": 1},
+        "explanation": {"type": "string"},
+        "source_chunk_ids": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+def validate_mcq(mcq):
+    """Checks a decoded MCQ against MCQ_SCHEMA (plus index bounds); raises ValueError if it does not match."""
+    if not isinstance(mcq, dict):
+        raise ValueError("MCQ must be a JSON object")
+    for field in MCQ_SCHEMA["required"]:
+        if field not in mcq:
+            raise ValueError(f"MCQ is missing '{field}'")
+    if not isinstance(mcq["stem"], str) or not mcq["stem"].strip():
+        raise ValueError("MCQ stem must be a non-empty string")
+    if not isinstance(mcq["explanation"], str):
+        raise ValueError("MCQ explanation must be a string")
+    options = mcq["options"]
+    option_schema = MCQ_SCHEMA["properties"]["options"]
+    if not isinstance(options, list) or not option_schema["minItems"] <= len(options) <= option_schema["maxItems"] \
+            or not all(isinstance(option, str) and option.strip() for option in options):
+        raise ValueError(f"MCQ needs {option_schema['minItems']} to {option_schema['maxItems']} non-empty options")
+    correct = mcq["correct"]
+    if not isinstance(correct, list) or not correct \
+            or not all(isinstance(i, int) and not isinstance(i, bool) and 0 <= i < len(options) for i in correct):
+        raise ValueError("MCQ correct answers must be indices of its options")
+    source_chunk_ids = mcq.get("source_chunk_ids", [])
+    if not isinstance(source_chunk_ids, list) or not all(isinstance(i, str) for i in source_chunk_ids):
+        raise ValueError("MCQ source_chunk_ids must be a list of strings")
+    return mcq
+
+def parse_mcq(text):
+    """Decodes the model's JSON answer (ignoring any text or code fence around the object) and validates it."""
+    mcq = validate_mcq(json.loads(text[text.find("{"):text.rfind("}") + 1]))
+    mcq = {field: mcq[field] for field in MCQ_SCHEMA["properties"] if field in mcq}
+    mcq["correct"] = sorted(set(mcq["correct"]))
+    return mcq
+
+def format_mcq(mcq):
+    """Readable form of a structured MCQ: the stem followed by lettered options."""
+    return mcq["stem"] + "\n" + "\n".join(f"{chr(ord('A') + i)}) {option}" for i, option in enumerate(mcq["options"]))
+
+class TokenStreamHandler(BaseCallbackHandler):
+    """Forwards completion tokens to `on_token` as they arrive and records the time to the first one."""
+    def __init__(self, on_token):
+        self.on_token = on_token
+        self.start_time = time.perf_counter()
+        self.first_token_ms = None
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.perf_counter() - self.start_time) * 1000
+        self.on_token(token)
+
+def worth_caching(answer):
+    """A refusal must not be served again: the lessons may cover the question once updated."""
+    return bool(answer.strip()) and NO_ANSWER.rstrip(".") not in answer
+
+class QueryHandler:
+    def __init__(self, api_key, answer_cache=None):
+        self.api_key = api_key
+        self.answer_cache = answer_cache
+        # One LLM client for the whole session: its pooled keep-alive connections skip a TCP + TLS handshake per call
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=120),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+        )
+        self.llm = OpenAI(openai_api_key=api_key, http_client=self.http_client)
+        # The chain's LLM streams, so answers can be shown token by token (batched generation keeps self.llm)
+        self.chain_llm = OpenAI(openai_api_key=api_key, http_client=self.http_client, streaming=True)
+        self.chain = None
+        self.chain_retriever = None
+        self.chain_lock = threading.Lock()
+
+    def get_chain(self, retriever):
+        """Returns the RetrievalQA chain, rebuilt only when the retriever itself changes (e.g. after a lessons update)."""
+        with self.chain_lock:
+            if self.chain is None or self.chain_retriever is not retriever:
+                self.chain = RetrievalQA.from_chain_type(llm=self.chain_llm, retriever=retriever)
+                self.chain_retriever = retriever
+            return self.chain
+
+    def ask(self, query, retriever, label, on_token=None):
+        """
+        Runs one retrieval + completion round trip on the shared chain, logging setup and call time.
+        With `on_token`, the answer is also streamed to it token by token (time to first token is logged).
+        """
+        start_time = time.perf_counter()
+        qa_chain = self.get_chain(retriever)
+        setup_time = time.perf_counter()
+        stream_handler = TokenStreamHandler(on_token) if on_token else None
+        # The tracing callbacks add the retrieval and LLM spans (chunks found, token usage) under the caller's span
+        callbacks = ([stream_handler] if stream_handler else []) + langchain_callbacks()
+        response = qa_chain.invoke({"query": query}, config={"callbacks": callbacks} if callbacks else None)
+        first_token = ""
+        if stream_handler and stream_handler.first_token_ms is not None:
+            first_token = f", first token after {stream_handler.first_token_ms:.0f} ms"
+        logging.info(f"{label}: chain setup {(setup_time - start_time) * 1000:.1f} ms, "
+                     f"retrieval + LLM {(time.perf_counter() - setup_time) * 1000:.0f} ms{first_token}")
+        return response["result"] if isinstance(response, dict) and "result" in response else response
+
+    def generate_questions(self, mode, chunks, max_concurrency=QUESTION_BATCH_SIZE):
+        """
+        Generates one question per lesson excerpt, sending the completions concurrently. Failed ones are None.
+        MCQs come back as validated dicts (see MCQ_SCHEMA), so they can be graded without the model.
+        """
+        if mode == "MCQ":
+            instruction = ("Generate a multiple-choice question based on the following excerpt of the lessons. "
+                           "Reply with JSON only, no other text, matching this schema: "
+                           f"{json.dumps({key: MCQ_SCHEMA['properties'][key] for key in MCQ_SCHEMA['required']})}. "
+                           "\"correct\" holds the 0-based indices of every correct option.")
+        else:
+            instruction = "Generate an open-ended question based on the following excerpt of the lessons."
+        prompts = [f"{instruction}\n\nExcerpt:\n{chunk.page_content}\n\nQuestion:" for chunk in chunks]
+
+        start_time = time.perf_counter()
+        with tracer.span("generate_questions", mode=mode, questions=len(prompts)):
+            responses = self.llm.batch(prompts, config={"max_concurrency": max_concurrency, "callbacks": langchain_callbacks()},
+                                       return_exceptions=True)
+        logging.info(f"Generated {len(prompts)} {mode} questions in {(time.perf_counter() - start_time) * 1000:.0f} ms")
+        questions = []
+        for response in responses:
+            if isinstance(response, Exception):
+                logging.error(f"Error generating question: {response}")
+                questions.append(None)
+            elif mode == "MCQ":
+                try:
+                    questions.append(parse_mcq(response))
+                except ValueError as e:  # json.JSONDecodeError included
+                    logging.warning(f"Discarding malformed MCQ: {e}")
+                    questions.append(None)
+            else:
+                questions.append(response.strip())
+        return questions
+
+    @staticmethod
+    def grade_mcq(mcq, selected):
+        """Local MCQ grading: the selected option indices must be exactly the correct ones. No model call."""
+        correct = mcq["correct"]
+        correct_answer = ", ".join(f"{chr(ord('A') + i)}) {mcq['options'][i]}" for i in correct)
+        if sorted(set(selected)) == correct:
+            return "Correct!", mcq["explanation"]
+        return "Incorrect.", f"Correct Answer: {correct_answer}. {mcq['explanation']}"
+
+    def evaluate_answer(self, mode, question, user_answer, retriever, on_token=None):
+        """
+        Evaluates the user's answer based on the selected mode and returns (feedback, explanation).
+        MCQs are graded locally from their structured answer key; only Open-Answer asks the model
+        (its feedback is streamed to `on_token` if given).
+        """
+        try:
+            if mode == "MCQ":
+                return self.grade_mcq(question, user_answer)
 
             elif mode == "Open-Answer":
-                # Simulate open-answer correction (this part can be enhanced with actual answer checking logic)
                 instruction = f"Evaluate the following answer to the question '{question}': {user_answer}"
-                qa_chain = RetrievalQA.from_chain_type(
-                    llm=OpenAI(api_key=self.api_key),
-                    retriever=retriever
-                )
-                response = qa_chain.invoke({"query": instruction})
-                return response["result"] if isinstance(response, dict) and "result" in response else response
+                with tracer.span("evaluate_answer"):
+                    return self.ask(instruction, retriever, "Answer evaluation", on_token), ""
         except Exception as e:
             logging.error(f"Error evaluating answer: {e}")
-            return "Sorry, an error occurred while evaluating your answer."
+            return "Sorry, an error occurred while evaluating your answer.", ""
 
-    def query_documents(self, query, retriever):
-        """Handles open questions and generates responses using OpenAI."""
+    @tracer.traced("question")
+    def query_documents(self, query, retriever, on_token=None):
+        """Handles open questions and generates responses using OpenAI, streamed to `on_token` if given."""
+        corpus_id = None
+        if self.answer_cache:
+            corpus_id = self.answer_cache.corpus_id  # Lessons the answer is based on, checked again before caching it
+            cached_answer = self.answer_cache.lookup(query)
+            if cached_answer is not None:
+                logging.info("Answer served from the semantic cache")
+                return cached_answer
         try:
-            instruction = "Answer based only on the information provided in the documents. If the information is not available, state that clearly."
+            instruction = ("Answer based only on the information provided in the documents. "
+                           f"If the information is not available, answer exactly: {NO_ANSWER}")
             full_query = f"{instruction} Query: {query}"
-            qa_chain = RetrievalQA.from_chain_type(
-                llm=OpenAI(api_key=self.api_key),
-                retriever=retriever
-            )
-            response = qa_chain.invoke({"query": full_query})
-            return response["result"] if isinstance(response, dict) and "result" in response else response
+            answer = self.ask(full_query, retriever, "Open question", on_token)
+            if self.answer_cache and worth_caching(answer):
+                self.answer_cache.put(query, answer, corpus_id)
+            return answer
         except Exception as e:
             logging.error(f"Error querying documents: {e}")
             return "Sorry, an error occurred while processing your request."
 
+class QuestionPool:
+    """
+    Bounded per-mode queues of ready questions. They are generated in background batches from
+    cluster-stratified lesson chunks, saved to disk, and pruned when the chunks they came from disappear.
+    """
+    def __init__(self, path, embedding_retriever, query_handler, size=QUESTION_POOL_SIZE, batch_size=QUESTION_BATCH_SIZE):
+        self.path = path
+        self.embedding_retriever = embedding_retriever
+        self.query_handler = query_handler
+        self.size = size
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.queues = {mode: deque() for mode in QUESTION_MODES}
+        self.refilling = set()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+            for mode in QUESTION_MODES:
+                self.queues[mode].extend(item for item in saved.get(mode, [])[:self.size] if self._is_valid(mode, item))
+            logging.info("Loaded question pool: " + ", ".join(f"{len(q)} {mode}" for mode, q in self.queues.items()))
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def _is_valid(mode, item):
+        """Rejects saved items that do not match the current question format (e.g. free-text MCQs)."""
+        if mode != "MCQ":
+            return isinstance(item.get("question"), str)
+        try:
+            validate_mcq(item.get("question"))
+            return True
+        except ValueError:
+            return False
+
+    def _save(self):
+        """Called with the lock held."""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({mode: list(queue) for mode, queue in self.queues.items()}, file, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def retain(self, valid_chunk_ids):
+        """Drops questions whose source chunk is no longer in the lessons (edited or removed PDF)."""
+        with self.lock:
+            for mode, queue in self.queues.items():
+                kept = [item for item in queue if item["chunk_id"] in valid_chunk_ids]
+                if len(kept) != len(queue):
+                    logging.info(f"Dropped {len(queue) - len(kept)} stale {mode} questions")
+                    self.queues[mode] = deque(kept)
+            self._save()
+
+    def pop(self, mode):
+        """Returns a ready question (dict with "question" and "chunk_id"), or None if the pool is empty."""
+        with self.lock:
+            if not self.queues[mode]:
+                return None
+            item = self.queues[mode].popleft()
+            self._save()
+            return item
+
+    def start_refill(self, mode):
+        """Claims the refill of a mode; False if it is full or already being refilled."""
+        with self.lock:
+            if mode in self.refilling or len(self.queues[mode]) >= self.size:
+                return False
+            self.refilling.add(mode)
+            return True
+
+    def _generate(self, mode, count):
+        sampled = self.embedding_retriever.sample_diverse_chunks(count)
+        if not sampled:
+            return []
+        questions = self.query_handler.generate_questions(mode, [chunk for _, chunk in sampled])
+        items = []
+        for (chunk_id, _), question in zip(sampled, questions):
+            if not question:
+                continue
+            if mode == "MCQ":
+                question["source_chunk_ids"] = [chunk_id]
+            items.append({"question": question, "chunk_id": chunk_id})
+        return items
+
+    def refill(self, mode):
+        """Runs on a worker thread after start_refill(): tops the mode's queue up, one concurrent batch at a time."""
+        try:
+            while True:
+                with self.lock:
+                    missing = self.size - len(self.queues[mode])
+                if missing <= 0:
+                    return
+                items = self._generate(mode, min(missing, self.batch_size))
+                if not items:
+                    return  # Nothing to sample from, or the API is failing: retry on the next refill
+                with self.lock:
+                    self.queues[mode].extend(items[:self.size - len(self.queues[mode])])
+                    self._save()
+        finally:
+            with self.lock:
+                self.refilling.discard(mode)
+
+    def generate_now(self, mode):
+        """Empty pool: generates a single question right away (still from a sampled chunk)."""
+        items = self._generate(mode, 1)
+        return items[0] if items else None
+
+class BackgroundTask:
+    """A unit of work running on the TaskRunner pool; its callbacks always run on the Tk main thread."""
+    def __init__(self, future=None):
+        self.future = future
+        self.callbacks = []
+        self.tokens = deque()  # Streamed by the worker (deque.append is thread-safe), drained on the main thread
+        self.token_handlers = []
+        self.cancelled = False
+        self.delivered = False
+        self.result = None
+        self.error = None
+
+    def then(self, on_done, on_error=None):
+        """Registers callbacks; if the task already finished they run right away."""
+        self.callbacks.append((on_done, on_error))
+        if self.delivered:
+            self._run_callback(on_done, on_error)
+        return self
+
+    def stream(self, on_tokens):
+        """Registers a main-thread handler for the text streamed so far (see TaskRunner.submit(streaming=True))."""
+        self.token_handlers.append(on_tokens)
+        return self
+
+    def _drain_tokens(self):
+        if not self.tokens:
+            return
+        text = "".join(self.tokens.popleft() for _ in range(len(self.tokens)))
+        if not self.cancelled:
+            for on_tokens in self.token_handlers:
+                on_tokens(text)
+
+    def cancel(self):
+        """Drops the result; the work itself is skipped only if it has not started yet."""
+        self.cancelled = True
+        self.future.cancel()
+
+    def _deliver(self):
+        if self.cancelled:
+            return
+        try:
+            self.result = self.future.result()
+        except Exception as e:
+            self.error = e
+            logging.error(f"Background task failed: {e}")
+        self.delivered = True
+        for on_done, on_error in self.callbacks:
+            self._run_callback(on_done, on_error)
+
+    def _run_callback(self, on_done, on_error):
+        if self.error is None:
+            on_done(self.result)
+        elif on_error:
+            on_error(self.error)
+
+class TaskRunner:
+    """Runs blocking work (indexing, retrieval, LLM calls) on a thread pool and polls for results with root.after."""
+    def __init__(self, root, max_workers=4, poll_ms=50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="assistant-worker")
+        self.pending = []
+        self.progress = None  # Latest progress message, set from any thread
+        self.shown_progress = None
+        self.on_progress = None
+        self.root.after(self.poll_ms, self._poll)
+
+    def submit(self, fn, *args, streaming=False):
+        """With streaming=True, `fn` also gets an `on_token` callback; its tokens reach task.stream() handlers."""
+        task = BackgroundTask()
+        if streaming:
+            task.future = self.executor.submit(fn, *args, on_token=task.tokens.append)
+        else:
+            task.future = self.executor.submit(fn, *args)
+        self.pending.append(task)
+        return task
+
+    def report(self, message):
+        """Thread-safe: workers publish progress, the main thread displays it on the next poll."""
+        self.progress = message
+
+    def _poll(self):
+        for task in self.pending:
+            task._drain_tokens()
+        for task in [task for task in self.pending if task.future.done()]:
+            self.pending.remove(task)
+            task._drain_tokens()
+            task._deliver()
+        if self.progress != self.shown_progress and self.on_progress:
+            self.shown_progress = self.progress
+            self.on_progress(self.progress)
+        self.root.after(self.poll_ms, self._poll)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 class TeachingAssistantApp:
     def __init__(self, root, api_key, pdf_processor, embedding_retriever, query_handler):
         self.root = root
@@ -154,11 +881,23 @@ class TeachingAssistantApp:
         self.query_handler = query_handler
 
         self.current_question = ""
-        self.mcq_options = []
-        self.selected_options = []
+        self.current_question_mode = None  # Mode current_question belongs to (a dict in MCQ mode, a str otherwise)
+        self.option_vars = []  # One checkbox variable per MCQ option, in option order
+
+        self.retriever = None
+        self.lesson_watcher = LessonWatcher(pdf_processor.directory)
+        self.pending_update = None
+
+        self.tasks = TaskRunner(root)
+        self.foreground_task = None  # The task the student is waiting on
+        self.foreground_cancellable = True  # Whether a newer foreground task may cancel it (indexing may not)
+        self.question_pool = QuestionPool(QUESTION_POOL_PATH, embedding_retriever, query_handler)
 
         self.create_widgets()
+        self.tasks.on_progress = self.set_status
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.load_documents()
+        self.root.after(WATCH_INTERVAL_MS, self.watch_lessons)
 
     def create_widgets(self):
         self.mode_var = StringVar(value="Open-Question")
@@ -187,98 +926,298 @@ class TeachingAssistantApp:
         self.answer_entry = tk.Entry(self.root, width=50)
         self.answer_entry.pack(pady=5)
 
-        self.submit_button = tk.Button(self.root, text="Submit", command=self.handle_submission)
+        self.submit_button = tk.Button(self.root, text="Submit", command=self.handle_submission, state=tk.DISABLED)
         self.submit_button.pack(pady=5)
 
         self.next_button = tk.Button(self.root, text="Next Question", command=self.generate_question, state=tk.DISABLED)
         self.next_button.pack(pady=5)
 
+        self.status_frame = tk.Frame(self.root)
+        self.status_frame.pack(pady=5)
+
+        self.status_label = tk.Label(self.status_frame, text="", fg="gray")
+        self.status_label.pack(side=tk.LEFT)
+
+        self.progress_bar = ttk.Progressbar(self.status_frame, mode="indeterminate", length=120)
+
+        self.cancel_button = tk.Button(self.status_frame, text="Cancel", command=self.cancel_foreground)
+
         self.answer_text = scrolledtext.ScrolledText(self.root, width=60, height=10)
         self.answer_text.pack(pady=5)
 
+    # ------------------------------------------
+    # Busy state / progress
+    # ------------------------------------------
+    def set_status(self, message):
+        self.status_label.config(text=message or "")
+
+    def run_foreground(self, message, task, on_done, cancellable=True):
+        """
+        Shows progress for a task the student is waiting on and hands its result to `on_done`.
+        Only the latest foreground task reaches the UI: a cancelled or superseded one is ignored.
+        """
+        if self.foreground_task and self.foreground_task is not task and self.foreground_cancellable:
+            self.foreground_task.cancel()
+        self.foreground_task, self.foreground_cancellable = task, cancellable
+        self.set_status(message)
+        self.progress_bar.pack(side=tk.LEFT, padx=5)
+        self.progress_bar.start(10)
+        if cancellable:
+            self.cancel_button.pack(side=tk.LEFT)
+
+        def finish(result):
+            if task is self.foreground_task:
+                self.end_foreground(task)
+                on_done(result)
+
+        def fail(error):
+            if task is self.foreground_task:
+                self.end_foreground(task, f"Something went wrong: {error}")
+
+        task.then(finish, fail)
+        return task
+
+    def end_foreground(self, task, message=""):
+        if task is not self.foreground_task:
+            return
+        self.foreground_task = None
+        self.progress_bar.stop()
+        self.progress_bar.pack_forget()
+        self.cancel_button.pack_forget()
+        self.set_status(message)
+
+    def cancel_foreground(self):
+        task = self.foreground_task
+        if task:
+            task.cancel()
+            self.end_foreground(task, "Cancelled.")
+
+    def close(self):
+        self.tasks.shutdown()
+        self.root.destroy()
+
+    # ------------------------------------------
+    # Indexing (off the UI thread)
+    # ------------------------------------------
     def load_documents(self):
+        self.lesson_watcher.scan()  # Snapshot first, so edits made while loading are picked up later
+        # Held as the pending update, so the watcher waits for the first index instead of racing it
+        self.pending_update = task = self.tasks.submit(self.build_retriever)
+        task.then(self.on_documents_loaded, lambda e: self.on_documents_loaded((None, f"Indexing failed: {e}")))
+        self.run_foreground("Indexing lessons...", task, lambda _: None, cancellable=False)
+
+    def build_retriever(self):
+        """Runs on a worker thread: loads, chunks and embeds every lesson. Returns (retriever, warning)."""
+        self.tasks.report("Loading lesson PDFs...")
         pdf_documents = self.pdf_processor.load_pdfs()
         if not pdf_documents:
-            messagebox.showwarning("Warning", "No PDFs found. Add PDFs to the 'lessons' directory and try again.")
-            return
+            return None, "No PDFs found. Add PDFs to the 'lessons' directory and try again."
 
         chunks = self.pdf_processor.process_documents(pdf_documents)
         if not chunks:
-            messagebox.showwarning("Warning", "No chunks processed. Check the PDFs and try again.")
+            return None, "No chunks processed. Check the PDFs and try again."
+
+        self.tasks.report(f"Embedding {len(chunks)} chunks from {len(pdf_documents)} pages...")
+        retriever = self.embedding_retriever.build_faiss_vectorstore(chunks)
+        if not retriever:
+            return None, "Failed to build FAISS vector store. Check the logs for errors."
+        return retriever, None
+
+    def on_documents_loaded(self, result):
+        retriever, warning = result
+        self.pending_update = None
+        if warning:
+            self.lesson_watcher.snapshot = {}  # The watcher indexes whatever is there (or added later) on its next poll
+            messagebox.showwarning("Warning", warning)
             return
+        self.on_retriever_ready(retriever)
+
+    def on_retriever_ready(self, retriever):
+        first = self.retriever is None
+        self.retriever = retriever
+        self.sync_answer_cache()
+        self.sync_question_pool()
+        if first:
+            self.submit_button.config(state=tk.NORMAL)
+            self.set_status("Lessons indexed. Ready!")
+            if self.mode_var.get() in QUESTION_MODES:
+                self.generate_question()
+
+    def sync_answer_cache(self):
+        """Drops cached answers if the lessons they were based on changed."""
+        if self.query_handler.answer_cache:
+            self.query_handler.answer_cache.set_corpus(self.embedding_retriever.corpus_id)
+
+    def watch_lessons(self):
+        """
+        Polls the lessons directory and swaps in an updated retriever once the background update finishes.
+        Also builds the first index when the app started without one (empty lessons folder, failed build).
+        """
+        if self.pending_update is None:
+            previous = dict(self.lesson_watcher.snapshot)
+            changed, removed = self.lesson_watcher.scan()
+            if changed or removed:
+                logging.info(f"Lessons changed: {len(changed)} added/modified, {len(removed)} removed")
+                self.pending_update = self.tasks.submit(self.apply_lesson_changes, changed, removed)
+                retry = lambda: self.lesson_watcher.rollback(changed + removed, previous)
+                self.pending_update.then(lambda retriever: self.on_lessons_updated(retriever, retry),
+                                         lambda _: self.on_lessons_updated(None, retry))
+        self.root.after(WATCH_INTERVAL_MS, self.watch_lessons)
+
+    def on_lessons_updated(self, retriever, retry):
+        if retriever:
+            self.on_retriever_ready(retriever)
+        else:
+            retry()  # The same change is applied again on the next poll
+        self.pending_update = None
+
+    def apply_lesson_changes(self, changed, removed):
+        """Runs on a worker thread: loads changed PDFs and applies the delta to the vector store."""
+        chunks_by_source = {}
+        for filename in changed:
+            documents = self.pdf_processor.load_pdf(filename)
+            chunks_by_source[self.pdf_processor.path(filename)] = self.pdf_processor.process_documents(documents) if documents else []
+        removed_sources = [self.pdf_processor.path(filename) for filename in removed]
+        retriever = self.embedding_retriever.update_documents(chunks_by_source, removed_sources)
+        if retriever:
+            self.sync_answer_cache()  # Right away: answers still being generated from the old lessons are not cached
+        return retriever
 
-        self.retriever = self.embedding_retriever.build_faiss_vectorstore(chunks)
-        if not self.retriever:
-            messagebox.showwarning("Warning", "Failed to build FAISS vector store. Check the logs for errors.")
+    # ------------------------------------------
+    # Questions (served from the background-filled pool)
+    # ------------------------------------------
+    def sync_question_pool(self):
+        """Prunes questions about removed or edited lessons, then tops every mode up in the background."""
+        self.question_pool.retain(self.embedding_retriever.vector_ids)
+        for mode in QUESTION_MODES:
+            self.refill_question_pool(mode)
+
+    def refill_question_pool(self, mode):
+        if self.question_pool.start_refill(mode):
+            self.tasks.submit(self.question_pool.refill, mode)
 
     def generate_question(self):
         mode = self.mode_var.get()
-        self.current_question = self.query_handler.generate_question(mode, self.retriever)
-        self.question_text.config(text=self.current_question.split(')')[0].strip() + ')')
+        if mode not in QUESTION_MODES:
+            return
+        if self.retriever is None:
+            self.set_status("Lessons are still being indexed...")
+            return
+
+        item = self.question_pool.pop(mode)
+        if item is not None:
+            self.show_question(mode, item)  # A queue pop: no waiting at all
+        else:
+            task = self.tasks.submit(self.question_pool.generate_now, mode)
+            self.run_foreground(f"Generating a {mode} question...", task, lambda item: self.show_question(mode, item))
+        self.refill_question_pool(mode)
+
+    def show_question(self, mode, item):
+        if self.mode_var.get() != mode:
+            return  # The student switched mode meanwhile
+        if item is None:
+            self.set_status("Could not generate a question. Check the logs and try again.")
+            return
+        self.current_question = item["question"]
+        self.current_question_mode = mode
 
         if mode == "MCQ":
-            self.mcq_options = [option.strip() for option in self.current_question.split(')')[1:]]
-            self.display_mcq_options()
+            self.question_text.config(text=self.current_question["stem"])
+            self.display_mcq_options(self.current_question["options"])
         else:
+            self.question_text.config(text=self.current_question)
             self.answer_entry.config(state=tk.NORMAL)
             self.clear_options()
 
         self.next_button.config(state=tk.NORMAL)
 
-    def display_mcq_options(self):
+    def display_mcq_options(self, options):
         self.answer_entry.config(state=tk.DISABLED)
         self.clear_options()
-        self.selected_options = []
+        self.option_vars = []
 
-        for index, option in enumerate(self.mcq_options):
+        for index, option in enumerate(options):
             var = IntVar()
-            checkbox = Checkbutton(self.options_frame, text=option, variable=var, command=lambda v=var: self.toggle_option(v))
+            checkbox = Checkbutton(self.options_frame, text=f"{chr(ord('A') + index)}) {option}", variable=var)
             checkbox.pack(anchor="w")
-
-    def toggle_option(self, var):
-        if var.get() == 1:
-            self.selected_options.append(var)
-        else:
-            self.selected_options.remove(var)
+            self.option_vars.append(var)
 
     def clear_options(self):
         for widget in self.options_frame.winfo_children():
             widget.destroy()
 
+    # ------------------------------------------
+    # Answers (evaluated in the background)
+    # ------------------------------------------
+    def show_answer(self, text):
+        self.answer_text.delete(1.0, tk.END)
+        self.answer_text.insert(tk.END, text)
+
+    def append_answer(self, text):
+        """Appends streamed tokens, so the answer appears as it is generated."""
+        self.answer_text.insert(tk.END, text)
+        self.answer_text.see(tk.END)
+
     def handle_submission(self):
         mode = self.mode_var.get()
+        if self.retriever is None:
+            self.set_status("Lessons are still being indexed...")
+            return
 
         if mode == "MCQ":
-            user_answer = [self.mcq_options[i] for i, var in enumerate(self.selected_options) if var.get() == 1]
-        elif mode == "Open-Answer":
+            user_answer = [i for i, var in enumerate(self.option_vars) if var.get() == 1]
+        else:
             user_answer = self.answer_entry.get().strip()
 
         if mode in ["MCQ", "Open-Answer"]:
             if not self.current_question:
                 messagebox.showwarning("Warning", "Please generate a question first.")
                 return
-            feedback, explanation = self.query_handler.evaluate_answer(mode, self.current_question, user_answer, self.retriever)
-            self.answer_text.delete(1.0, tk.END)
-            self.answer_text.insert(tk.END, self.current_question + "\n\nYour Answer: " + ", ".join(user_answer) + "\n\nFeedback: " + feedback + "\n\nExplanation: " + explanation)
+            if self.current_question_mode != mode:
+                # The mode was switched while its question is still being generated: the shown one is of the other kind
+                messagebox.showwarning("Warning", f"Please wait for the {mode} question.")
+                return
+            question = self.current_question
+
+            def show_feedback(result):
+                feedback, explanation = result
+                if mode == "MCQ":
+                    shown_question = format_mcq(question)
+                    shown_answer = ", ".join(f"{chr(ord('A') + i)}) {question['options'][i]}" for i in user_answer)
+                else:
+                    shown_question, shown_answer = question, user_answer
+                self.show_answer(shown_question + "\n\nYour Answer: " + shown_answer + "\n\nFeedback: " + feedback + "\n\nExplanation: " + explanation)
+
+            if mode == "MCQ":
+                # Graded locally against the answer key: instant, no model call
+                show_feedback(self.query_handler.evaluate_answer(mode, question, user_answer, self.retriever))
+                return
+            task = self.tasks.submit(self.query_handler.evaluate_answer, mode, question, user_answer, self.retriever, streaming=True)
+            self.show_answer(question + "\n\nYour Answer: " + user_answer + "\n\nFeedback: ")
+            task.stream(self.append_answer)
+            self.run_foreground("Checking your answer...", task, show_feedback)
 
         elif mode == "Open-Question":
             if not user_answer:
                 messagebox.showwarning("Warning", "Please enter a question.")
                 return
-            answer = self.query_handler.query_documents(user_answer, self.retriever)
-            self.answer_text.delete(1.0, tk.END)
-            self.answer_text.insert(tk.END, answer)
+            task = self.tasks.submit(self.query_handler.query_documents, user_answer, self.retriever, streaming=True)
+            self.show_answer("")
+            task.stream(self.append_answer)
+            self.run_foreground("Searching the lessons...", task, self.show_answer)
 
 def main():
     api_key = os.environ.get("OPENAI_API_KEY") or getpass.getpass("Enter your API key here: ")
     os.environ["OPENAI_API_KEY"] = api_key
+    tracer.configure()
 
     PDF_DIR = "./lessons"
     os.makedirs(PDF_DIR, exist_ok=True)
 
     pdf_processor = PDFProcessor(PDF_DIR)
     embedding_retriever = EmbeddingRetriever(api_key)
-    query_handler = QueryHandler(api_key)
+    answer_cache = AnswerCache(ANSWER_CACHE_DIR, OpenAIEmbeddings(openai_api_key=api_key))
+    query_handler = QueryHandler(api_key, answer_cache)
 
     root = tk.Tk()
     app = TeachingAssistantApp(root, api_key, pdf_processor, embedding_retriever, query_handler)
@@ -0,0 +1,28 @@
+# ==========================================
+# TEST SETUP
+# The projects are folders of scripts importing their siblings by name, so their folders go on sys.path.
+# ==========================================
+import importlib
+import os
+import sys
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(REPO_DIR, folder) for folder in ("pdf", "gmail", "teaching_assistant", "benchmarks")] + [REPO_DIR]
+
+@pytest.fixture(scope="session")
+def rag(tmp_path_factory):
+    """
+    pdf.py with the offline stubs of the benchmarks (hashing embedder, whitespace tokenizer if tiktoken
+    cannot load), imported from a scratch directory since it creates ./pdfs on import.
+    """
+    import context
+    from stubs import StubEmbedder, install_tokenizer
+    install_tokenizer(context)
+    directory = tmp_path_factory.mktemp("pdf_rag")
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(directory)
+        module = importlib.import_module("pdf")
+    module.embedding_model = StubEmbedder()
+    module.EMBEDDING_CACHE_PATH = str(directory / "embedding_cache.sqlite")  # Opened on first use, after the chdir is undone
+    return module
@@ -0,0 +1,31 @@
+# ==========================================
+# CONTEXT PACKING
+# Overlapping neighbouring splits are packed once, and a truncated chunk only blocks the text it kept.
+# ==========================================
+import context
+from context import ContextPacker, count_tokens
+from stubs import install_tokenizer
+
+install_tokenizer(context)
+
+def sentence(name, words):
+    return " ".join(f"{name}{i}" for i in range(words)) + "."
+
+def test_neighbouring_splits_are_packed_without_their_overlap():
+    text = " ".join(sentence(name, 30) for name in ("alpha", "beta", "gamma", "delta"))
+    cut = text.index("gamma0")
+    left, right = text[:cut + 200], text[cut:]  # Both splits hold the start of the third sentence
+    packer = ContextPacker()
+    selected, used = packer.pack([left, right, left[:150]], max_tokens=10000)
+    assert selected == [left, text[cut + 200:].lstrip()]
+    assert used == sum(count_tokens(selected)) + packer.separator_tokens
+    # The other way round: the tail of the second split repeats the head of the first one
+    selected, _ = packer.pack([right, left], max_tokens=10000)
+    assert selected == [right, text[:cut].rstrip()]
+
+def test_truncated_chunk_blocks_only_the_text_it_kept():
+    first, middle, last = sentence("alpha", 70), sentence("beta", 200), sentence("gamma", 8)
+    packer = ContextPacker()
+    budget = count_tokens([first])[0] + count_tokens([last])[0] + packer.separator_tokens + 2
+    selected, _ = packer.pack([f"{first} {middle} {last}", last, first], max_tokens=budget)
+    assert selected == [first, last]  # The last sentence was cut from the first chunk, so it is still packed
@@ -0,0 +1,28 @@
+# ==========================================
+# DAILY DIGEST
+# Map-reduce rounds against the stub LLM: the round count follows the batch count, and no thread is lost.
+# ==========================================
+from digest import DigestEngine, StubLLM, pack_batches, group_messages
+
+def make_messages(count, thread_size=1):
+    return [{"id": f"m{i}", "thread": f"t{i // thread_size}", "from": f"sender{i % 7}@example.com",
+             "subject": f"Subject {i // thread_size}", "date": 1_700_000_000 + i, "body": "word " * 100, "attachments": []}
+            for i in range(count)]
+
+def test_threads_that_fit_stay_in_one_batch():
+    batches = pack_batches(group_messages(make_messages(6, thread_size=3)), budget=450)
+    assert len(batches) == 2
+    assert all(len(set(line for line in batch.splitlines() if line.startswith("Subject: "))) == 1 for batch in batches)
+
+def test_map_reduce_rounds_and_threads():
+    engine = DigestEngine(StubLLM(latency_ms=0, jitter_ms=0), batch_tokens=150, fanout=4, max_concurrency=4)
+    digest = engine.run(make_messages(40))  # One email per batch: 40 map calls, reduced to 10, then 3, then the final call
+    assert engine.rounds == engine.expected_rounds(40) == 4
+    assert {name: stats.calls for name, stats in engine.stages.items()} == {"map": 40, "reduce": 13, "final": 1}
+    assert sorted(thread["subject"] for thread in digest["threads"]) == sorted(f"Subject {i}" for i in range(40))
+    assert len(digest["highlights"]) == 5 and digest["action_items"] == []
+
+def test_no_messages_means_no_call():
+    engine = DigestEngine(StubLLM(latency_ms=0, jitter_ms=0))
+    assert engine.run([]) == {"highlights": [], "action_items": [], "threads": []}
+    assert engine.rounds == 0
@@ -0,0 +1,16 @@
+# ==========================================
+# PARALLEL PDF EXTRACTION
+# Pages come back in file and page order across page ranges, and a broken PDF is skipped whole.
+# ==========================================
+from extraction import iter_pdf_pages
+from synthetic import write_pdf
+
+def test_pages_stream_back_in_order_and_broken_files_are_skipped(tmp_path):
+    first, broken, second = (str(tmp_path / name) for name in ("first.pdf", "broken.pdf", "second.pdf"))
+    write_pdf(first, [f"first page {i}" for i in range(5)])
+    (tmp_path / "broken.pdf").write_bytes(b"%PDF-1.4 not really a PDF")
+    write_pdf(second, ["second page 0", "second page 1"])
+
+    pages = list(iter_pdf_pages([first, broken, second], max_workers=2, pages_per_task=2))  # first.pdf in 3 ranges
+    assert [(path, number) for path, number, _ in pages] == [(first, i) for i in range(5)] + [(second, 0), (second, 1)]
+    assert [text.strip() for _, _, text in pages] == [f"first page {i}" for i in range(5)] + ["second page 0", "second page 1"]
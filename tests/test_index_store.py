@@ -0,0 +1,101 @@
+# ==========================================
+# INDEX STORE
+# Files reused across restarts must come back with their own chunks and vectors.
+# ==========================================
+import zlib
+import numpy as np
+from index_store import IndexStore
+
+DIMENSION = 8
+
+def embed(chunks):
+    """One deterministic vector per text, so a reused vector can be checked against its chunk."""
+    return np.stack([np.random.default_rng(zlib.crc32(chunk.encode())).random(DIMENSION, dtype=np.float32)
+                     for chunk in chunks])
+
+def write_pdf(directory, name, content):
+    path = directory / name
+    path.write_bytes(content)  # Only hashed by the store: the chunks come from `corpus`
+    return str(path)
+
+def embed_batches(corpus, batch_size=64):
+    """
+    Stands in for pipeline.stream_embeddings: the chunks of the given files, in file order, in shared batches
+    (chunk i of a file is located on page i).
+    """
+    def stream(pdf_paths):
+        items = [(path, chunk, (page, 0, len(chunk))) for path in pdf_paths for page, chunk in enumerate(corpus[path])]
+        for i in range(0, len(items), batch_size):
+            paths, chunks, locations = (list(column) for column in zip(*items[i:i + batch_size]))
+            yield paths, chunks, embed(chunks), locations
+    return stream
+
+def assert_store_matches(store, index, chunks, corpus):
+    np.testing.assert_array_equal(index.reconstruct_n(0, index.ntotal), embed(chunks))
+    sources = [(path, page) for path in store.file_paths for page in range(len(corpus[path]))]
+    assert [store.source(row)[:2] for row in range(len(chunks))] == sources
+
+def test_reused_files_keep_their_chunks_after_a_shared_batch(tmp_path):
+    first = write_pdf(tmp_path, "first.pdf", b"first lesson")
+    second = write_pdf(tmp_path, "second.pdf", b"second lesson")
+    corpus = {first: ["first 1", "first 2", "first 3"], second: ["second 1", "second 2"]}
+    store_dir = str(tmp_path / "index_cache")
+
+    store = IndexStore(store_dir)
+    index, chunks = store.sync([first, second], embed_batches(corpus))  # Both files in one batch
+    assert chunks == corpus[first] + corpus[second]
+    assert_store_matches(store, index, chunks, corpus)
+
+    # Restart with one more file: the first two are copied from disk, only the new one is embedded
+    third = write_pdf(tmp_path, "third.pdf", b"third lesson")
+    corpus[third] = ["third 1"]
+    store = IndexStore(store_dir)
+    index, chunks = store.sync([first, second, third], embed_batches(corpus))
+    assert chunks == corpus[first] + corpus[second] + corpus[third]
+    assert_store_matches(store, index, chunks, corpus)
+
+def test_file_starting_mid_batch_is_reused_alone(tmp_path):
+    first = write_pdf(tmp_path, "first.pdf", b"first lesson")
+    second = write_pdf(tmp_path, "second.pdf", b"second lesson")
+    corpus = {first: ["first 1", "first 2"], second: ["second 1", "second 2", "second 3"]}
+    store_dir = str(tmp_path / "index_cache")
+    IndexStore(store_dir).sync([first, second], embed_batches(corpus, batch_size=4))
+
+    # The first file is gone: the second, whose first chunk was mid-batch, must still find its own rows
+    store = IndexStore(store_dir)
+    index, chunks = store.sync([second], embed_batches(corpus))
+    assert chunks == corpus[second]
+    assert_store_matches(store, index, chunks, corpus)
+
+def test_file_without_chunks_is_retried_on_the_next_sync(tmp_path):
+    first = write_pdf(tmp_path, "first.pdf", b"first lesson")
+    scanned = write_pdf(tmp_path, "scanned.pdf", b"scanned lesson")
+    corpus = {first: ["first 1", "first 2"], scanned: []}  # Extraction failed (or found no text) this time
+    store_dir = str(tmp_path / "index_cache")
+    store = IndexStore(store_dir)
+    index, chunks = store.sync([scanned, first], embed_batches(corpus))
+    assert chunks == corpus[first] and store.file_paths == [first]
+    assert_store_matches(store, index, chunks, corpus)
+
+    # Same bytes on disk, but the extraction works now: the file is embedded rather than taken as known and empty
+    corpus[scanned] = ["scanned 1"]
+    store = IndexStore(store_dir)
+    index, chunks = store.sync([scanned, first], embed_batches(corpus))
+    assert chunks == corpus[first] + corpus[scanned]
+    assert_store_matches(store, index, chunks, corpus)
+
+def test_dense_only_sync_does_not_leave_stale_keyword_postings(tmp_path):
+    lesson = write_pdf(tmp_path, "lesson.pdf", b"version 1")
+    corpus = {lesson: ["pythagorean theorem", "derivative rules"]}
+    store_dir = str(tmp_path / "index_cache")
+    IndexStore(store_dir, keyword_search=True).sync([lesson], embed_batches(corpus))
+
+    # Same number of chunks, other words, synced without the keyword index
+    write_pdf(tmp_path, "lesson.pdf", b"version 2")
+    corpus[lesson] = ["derivative rules", "integration by parts"]
+    IndexStore(store_dir).sync([lesson], embed_batches(corpus))
+
+    store = IndexStore(store_dir, keyword_search=True)
+    _, chunks = store.sync([lesson], embed_batches(corpus))
+    assert [chunks[i] for i, _ in store.keyword_index.search("integration")] == ["integration by parts"]
+    assert [chunks[i] for i, _ in store.keyword_index.search("derivative")] == ["derivative rules"]
@@ -0,0 +1,66 @@
+# ==========================================
+# MAIL SYNC
+# Messages are logged, then indexed, then the cursor is saved: a crash between two steps loses nothing,
+# and fetching the same delta again duplicates nothing.
+# ==========================================
+import json
+import pytest
+
+pytest.importorskip("langchain_community")
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import mail_ingest
+from mail_ingest import MailStore, MESSAGES_FILE
+
+def raw_message(i):
+    return (f"Message-ID: <m{i}@example.com>\r\nFrom: sender{i}@example.com\r\nTo: me@example.com\r\n"
+            f"Subject: Subject {i}\r\nDate: Mon, 2 Jun 2025 10:0{i}:00 +0000\r\n\r\nBody number {i} of the test mail.\r\n").encode()
+
+class ListSource:
+    """Serves the messages after the cursor (an index into `items`)."""
+    def __init__(self, count):
+        self.items = [(f"s{i}", raw_message(i)) for i in range(count)]
+
+    def fetch(self, cursor=None):
+        start = cursor["next"] if cursor else 0
+        return self.items[start:], {"next": len(self.items)}
+
+class Crash(Exception):
+    pass
+
+def crash(*args, **kwargs):
+    raise Crash()
+
+def make_store(directory):
+    return MailStore(str(directory), DeterministicFakeEmbedding(size=16), lambda documents: documents)
+
+def logged_ids(directory):
+    with open(directory / MESSAGES_FILE, encoding="utf-8") as file:
+        return [json.loads(line)["id"] for line in file]
+
+def test_crash_before_indexing_is_completed_by_the_next_sync(tmp_path, monkeypatch):
+    source = ListSource(3)
+    with monkeypatch.context() as patch:
+        patch.setattr(mail_ingest.FAISS, "from_documents", crash)
+        with pytest.raises(Crash):
+            make_store(tmp_path).sync(source)
+    assert len(logged_ids(tmp_path)) == 3  # Logged before the crash, cursor not saved
+
+    store = make_store(tmp_path)
+    assert store.sync(source) == []  # Nothing new to log...
+    assert store.load().index.ntotal == 3  # ...but the same delta, fetched again, is indexed
+    assert len(logged_ids(tmp_path)) == 3
+
+def test_crash_before_the_cursor_duplicates_nothing(tmp_path, monkeypatch):
+    source = ListSource(3)
+    with monkeypatch.context() as patch:
+        patch.setattr(MailStore, "_save_cursor", crash)
+        with pytest.raises(Crash):
+            make_store(tmp_path).sync(source)
+
+    store = make_store(tmp_path)
+    assert store.sync(source) == []
+    assert store.load().index.ntotal == 3 and len(logged_ids(tmp_path)) == 3
+
+    source.items += [("s3", raw_message(3))]
+    assert [message["id"] for message in make_store(tmp_path).sync(source)] == ["<m3@example.com>"]
+    assert len(logged_ids(tmp_path)) == 4
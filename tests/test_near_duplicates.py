@@ -0,0 +1,35 @@
+# ==========================================
+# NEAR-DUPLICATES
+# The MinHash + LSH index shared by the Gmail assistant and the teaching assistant.
+# ==========================================
+from near_duplicates import NearDuplicateIndex
+
+LESSON = ("The gradient points in the direction of steepest ascent, so gradient descent steps the other way "
+          "with a learning rate small enough for the loss to keep decreasing at every iteration of training.")
+FOOTER = "Introduction to machine learning, lesson 4, all rights reserved by the course staff."
+
+def test_near_duplicates_share_a_representative():
+    index = NearDuplicateIndex()
+    assert index.add("a", LESSON) == "a"
+    assert index.add("b", LESSON.replace("training.", "training!")) == "a"  # Punctuation is not a word
+    assert index.add("c", FOOTER) == "c"
+    index.remove("a")
+    assert index.add("d", LESSON) == "d"
+
+def test_copy_leaves_the_original_untouched():
+    index = NearDuplicateIndex()
+    index.add("a", LESSON)
+    other = index.copy()
+    other.remove("a")
+    other.add("c", FOOTER)
+    assert index.add("b", LESSON) == "a"
+    assert index.add("d", FOOTER) == "d"
+    assert other.add("e", LESSON) == "e"
+
+def test_signatures_survive_save_and_load(tmp_path):
+    index = NearDuplicateIndex()
+    index.add("a", LESSON)
+    index.save(str(tmp_path / "minhash.npz"))
+    loaded = NearDuplicateIndex()
+    loaded.load(str(tmp_path / "minhash.npz"))
+    assert loaded.add("b", LESSON) == "a"
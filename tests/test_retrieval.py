@@ -0,0 +1,90 @@
+# ==========================================
+# HYBRID RETRIEVAL
+# BM25 ranking and coverage filter, reciprocal-rank fusion, the dense cut-offs surviving the fusion, and reranking.
+# ==========================================
+import numpy as np
+from bm25 import BM25Index, reciprocal_rank_fusion
+from rerank import Reranker
+
+CHUNKS = [
+    "The Pythagorean theorem relates the three sides of a right triangle.",
+    "The derivative of a function measures how fast its value changes.",
+    "np.argpartition finds the k smallest values of an array without a full sort.",
+    "What you will learn in this course and how the grading will work.",
+    "Read the lesson before the lab, then work through the exercises.",
+    "What does the exam cover? Everything in the lessons and the labs.",
+    "How much time does the project take? About two weeks of work.",
+    "Ask your questions about the course on the forum.",
+    "The labs are graded on what works and on how clean the code is.",
+    "Office hours are about answering what the lessons did not cover.",
+]
+PYTHAGORAS, DERIVATIVE, ARGPARTITION, PROJECT = 0, 1, 2, 6
+STRICT_DENSE = 0.99  # No stub embedding is that close to a question: only keyword hits can get through
+
+def test_bm25_ranks_documents_with_rare_query_terms_first():
+    index = BM25Index.build(CHUNKS)
+    assert index.search("Where is argpartition used?", top_k=3)[0][0] == ARGPARTITION
+    assert index.search("derivative of a function", top_k=3)[0][0] == DERIVATIVE
+    assert index.search("zidane") == []
+
+def test_bm25_coverage_drops_matches_on_common_words_only():
+    index = BM25Index.build(CHUNKS)
+    assert index.search("What about Zidane?", top_k=5)  # "what" and "about" are everywhere
+    assert index.search("What about Zidane?", top_k=5, min_coverage=0.3) == []
+    # Kept: the chunk with the rare term, and the one sharing three of the four query words
+    assert [doc for doc, _ in index.search("How does argpartition work?", top_k=5, min_coverage=0.3)] == [PROJECT, ARGPARTITION]
+
+def test_bm25_index_survives_save_and_load(tmp_path):
+    index = BM25Index.build(CHUNKS)
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    for query in ["pythagorean triangle", "how does the grading work", "What about Zidane?"]:
+        assert loaded.search(query, top_k=4, min_coverage=0.3) == index.search(query, top_k=4, min_coverage=0.3)
+    assert BM25Index.load(str(tmp_path / "missing")) is None
+
+def test_reciprocal_rank_fusion_favours_ids_found_by_both_rankings():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 4]], k=60)
+    assert [item for item, _ in fused] == [3, 1, 2, 4]
+    assert np.isclose(dict(fused)[3], 1 / 63 + 1 / 61)
+
+def test_fuse_hits_keeps_the_dense_cut_offs(rag):
+    scores, indices = np.array([0.9, 0.8, 0.5, 0.2]), np.array([0, 1, 2, 3])
+    hits = rag.fuse_hits(scores, indices, [], CHUNKS, top_k=4, min_score=0.3, max_score_drop=0.15)
+    assert [chunk for chunk, _ in hits] == CHUNKS[:2]
+    hits = rag.fuse_hits(scores, indices, [(ARGPARTITION, 3.0), (4, 1.0)], CHUNKS, top_k=2, min_score=0.3, max_score_drop=0.15)
+    assert [chunk for chunk, _ in hits] == [CHUNKS[0], CHUNKS[ARGPARTITION]]  # Rank 1 in each list, dense first on ties
+    assert rag.fuse_hits(np.array([0.1]), np.array([0]), [], CHUNKS, top_k=3) == []
+
+def test_hybrid_retrieval_needs_dense_or_strong_keyword_hits(rag):
+    index, _ = rag.build_faiss_index(CHUNKS)
+    keyword_index = BM25Index.build(CHUNKS)
+    weak, exact = "What about Zidane?", "How does argpartition work?"
+    results = rag.retrieve_batch([weak, exact], index, CHUNKS, min_score=STRICT_DENSE, keyword_index=keyword_index)
+    assert results == [[], [CHUNKS[PROJECT], CHUNKS[ARGPARTITION]]]
+
+class StubCrossEncoder:
+    """Scores each (query, chunk) pair from a table, like CrossEncoder.predict with its sigmoid activation."""
+    def __init__(self, scores):
+        self.scores = scores
+
+    def predict(self, pairs, **kwargs):
+        return np.array([self.scores.get(chunk, 0.0) for _, chunk in pairs])
+
+def stub_reranker(scores, budget_ms=1000):
+    reranker = Reranker.__new__(Reranker)  # Without loading the cross-encoder model
+    reranker.model, reranker.candidates, reranker.budget_ms, reranker.batch_size = StubCrossEncoder(scores), 10, budget_ms, 4
+    reranker.reranked = reranker.fallbacks = 0
+    return reranker
+
+def test_reranked_hits_carry_cross_encoder_scores(rag):
+    index, _ = rag.build_faiss_index(CHUNKS)
+    reranker = stub_reranker({CHUNKS[PROJECT]: 0.95, CHUNKS[ARGPARTITION]: 0.9, CHUNKS[DERIVATIVE]: 0.5})
+    hits = rag.retrieve_batch(["How long is the project?"], index, CHUNKS, top_k=3, min_score=-1.0,
+                              max_score_drop=0.15, return_scores=True, reranker=reranker)[0]
+    # Ordered by the cross-encoder, and the derivative chunk is cut: 0.5 is more than 0.15 below 0.95
+    assert hits == [(CHUNKS[PROJECT], 0.95), (CHUNKS[ARGPARTITION], 0.9)]
+
+def test_reranking_over_budget_keeps_the_retrieval_order():
+    reranker = stub_reranker({CHUNKS[PROJECT]: 0.95}, budget_ms=-1)
+    assert reranker.rerank_batch(["q"], [CHUNKS[:3]], top_k=2, return_scores=True) == [[(CHUNKS[0], None), (CHUNKS[1], None)]]
+    assert reranker.fallbacks == 1
@@ -0,0 +1,76 @@
+# ==========================================
+# QUERY SERVER
+# Micro-batching of concurrent questions, and 503 once MAX_PENDING requests are admitted.
+# ==========================================
+import asyncio
+import json
+from server import MicroBatcher, QueryServer
+
+class RecordingWriter:
+    """Stands in for an asyncio StreamWriter: keeps the responses written to it."""
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def status(self):
+        return int(self.data.split(b" ", 2)[1])
+
+    def json(self):
+        return json.loads(self.data.split(b"\r\n\r\n", 1)[1])
+
+def test_concurrent_submissions_are_batched():
+    batches = []
+
+    def process_batch(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def run():
+        batcher = MicroBatcher(process_batch, max_batch=4, max_wait_ms=50)
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+        finally:
+            await batcher.close()
+
+    assert asyncio.run(run()) == [i * 2 for i in range(10)]
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+    assert sorted(item for batch in batches for item in batch) == list(range(10))
+
+def test_requests_beyond_max_pending_get_503():
+    remembered = []
+
+    async def run():
+        release = asyncio.Event()
+
+        async def generate(question, chunks):
+            await release.wait()
+            return f"answer to {question}"
+
+        server = QueryServer(lambda questions: [(None, ["chunk"], question.upper()) for question in questions], generate,
+                             remember=lambda question, answer, key: remembered.append((question, answer, key)),
+                             max_wait_ms=1, max_pending=1)
+        server.llm_slots = asyncio.Semaphore(server.max_concurrent_llm)
+        server.batcher.start()
+        try:
+            first, second = RecordingWriter(), RecordingWriter()
+            admitted = asyncio.ensure_future(server.handle_ask(first, json.dumps({"question": "q1"}).encode()))
+            while server.pending == 0:
+                await asyncio.sleep(0)
+            await server.handle_ask(second, json.dumps({"question": "q2"}).encode())
+            release.set()
+            await admitted
+            return first, second, server.stats()
+        finally:
+            await server.batcher.close()
+
+    first, second, stats = asyncio.run(run())
+    assert second.status() == 503 and b"Retry-After: 1" in second.data
+    assert first.status() == 200 and first.json()["answer"] == "answer to q1"
+    assert remembered == [("q1", "answer to q1", "Q1")]  # The key prepared with the chunks comes back to remember
+    assert (stats["served"], stats["rejected"], stats["pending"]) == (1, 1, 0)
@@ -0,0 +1,97 @@
+# ==========================================
+# TEACHING ASSISTANT
+# Lessons added, edited and removed while the app runs: the watcher reports each change until it is applied,
+# and the vector store follows the lessons folder without re-embedding what did not change.
+# ==========================================
+import os
+import pytest
+
+for package in ("httpx", "langchain", "langchain_openai", "langchain_community"):
+    pytest.importorskip(package)
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+import teaching_assistant as ta
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic vectors, counting the texts embedded."""
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+def lesson(source, *texts):
+    return [Document(page_content=text, metadata={"source": source, "page": page}) for page, text in enumerate(texts)]
+
+def stored_texts(retriever):
+    return sorted(document.page_content for document in retriever.vectorstore.docstore._dict.values())
+
+ALGEBRA = ["Groups are sets with an associative operation, an identity and inverses.",
+           "A ring adds a second operation that distributes over the first one."]
+CALCULUS = ["The derivative measures how fast a function changes at a point."]
+
+def test_lessons_are_added_and_removed_incrementally():
+    retriever = ta.EmbeddingRetriever(api_key="unused")
+    retriever.embeddings = embeddings = CountingEmbeddings(size=16)
+    assert retriever.update_documents({"algebra.pdf": lesson("algebra.pdf", *ALGEBRA)}, []) is not None  # First index
+    assert stored_texts(retriever) == sorted(ALGEBRA)
+
+    assert retriever.update_documents({"calculus.pdf": lesson("calculus.pdf", *CALCULUS)}, []) is not None
+    assert stored_texts(retriever) == sorted(ALGEBRA + CALCULUS)
+    assert embeddings.embedded == 3  # The algebra chunks were not embedded again
+
+    edited = [ALGEBRA[0], "Fields are rings where every non-zero element has an inverse."]
+    assert retriever.update_documents({"algebra.pdf": lesson("algebra.pdf", *edited)}, []) is not None
+    assert stored_texts(retriever) == sorted(edited + CALCULUS)
+    assert embeddings.embedded == 4  # Only the new page
+
+    assert retriever.update_documents({}, ["algebra.pdf"]) is not None
+    assert stored_texts(retriever) == CALCULUS
+    assert list(retriever.document_ids) == ["calculus.pdf"]
+
+def test_watcher_reports_a_rolled_back_change_again(tmp_path):
+    watcher = ta.LessonWatcher(str(tmp_path))
+    (tmp_path / "old.pdf").write_bytes(b"old")
+    watcher.scan()
+    previous = dict(watcher.snapshot)
+    (tmp_path / "new.pdf").write_bytes(b"new")
+    os.remove(tmp_path / "old.pdf")
+    changed, removed = watcher.scan()
+    assert (changed, removed) == (["new.pdf"], ["old.pdf"])
+    assert watcher.scan() == ([], [])
+
+    watcher.rollback(changed + removed, previous)  # The update failed: the next poll retries it
+    assert watcher.scan() == (["new.pdf"], ["old.pdf"])
+
+def test_refusals_and_answers_to_old_lessons_are_not_cached(tmp_path, monkeypatch):
+    cache = ta.AnswerCache(str(tmp_path), DeterministicFakeEmbedding(size=16))
+    cache.set_corpus("lessons v1")
+    handler = ta.QueryHandler("unused", cache)
+    answers = iter([ta.NO_ANSWER, "A group is a set with an associative operation, an identity and inverses."])
+    monkeypatch.setattr(handler, "ask", lambda *args, **kwargs: next(answers))
+    assert handler.query_documents("What is a group?", None) == ta.NO_ANSWER
+    grounded = handler.query_documents("What is a group?", None)  # Asked again: the refusal was not cached
+    assert grounded.startswith("A group")
+    assert handler.query_documents("What is a group?", None) == grounded  # Served from the cache
+
+    def ask_during_update(*args, **kwargs):
+        cache.set_corpus("lessons v2")  # The lessons change while the answer is being generated
+        return "A ring has two operations."
+    monkeypatch.setattr(handler, "ask", ask_during_update)
+    assert handler.query_documents("What is a ring?", None) == "A ring has two operations."
+    assert cache.lookup("What is a ring?") is None
+
+FOOTER = "Introduction to algebra, course notes written by the teaching staff for the spring semester."
+
+def test_a_shared_chunk_cites_a_surviving_lesson_once_its_own_is_removed():
+    retriever = ta.EmbeddingRetriever(api_key="unused")
+    retriever.embeddings = DeterministicFakeEmbedding(size=16)
+    retriever.update_documents({"week1.pdf": lesson("week1.pdf", ALGEBRA[0], FOOTER)}, [])
+    retriever.update_documents({"week2.pdf": lesson("week2.pdf", CALCULUS[0], FOOTER)}, [])  # Same footer: one vector
+    (footer,) = [document for document in retriever.vectorstore.docstore._dict.values() if document.page_content == FOOTER]
+    assert (footer.metadata["source"], footer.metadata["duplicates"]) == ("week1.pdf", ["week2.pdf"])
+
+    retriever.update_documents({}, ["week1.pdf"])  # The vector stays for week2's copy of the footer
+    (footer,) = [document for document in retriever.vectorstore.docstore._dict.values() if document.page_content == FOOTER]
+    assert (footer.metadata["source"], footer.metadata["page"]) == ("week2.pdf", 1)
+    assert "duplicates" not in footer.metadata
@@ -0,0 +1,348 @@
+# ==========================================
+# TRACING
+# Spans around every pipeline stage (duration plus attributes: token counts, cache hits, chunk counts),
+# sent to pluggable exporters: a JSONL file and/or a Prometheus text endpoint.
+# Disabled (no exporter), every span is one shared no-op object, so instrumented code pays a single check.
+# Enable with RAG_TRACE="jsonl:traces.jsonl", "prometheus:9464" or both, comma-separated.
+# ==========================================
+import atexit
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRACE_ENV = "RAG_TRACE"
+PROMETHEUS_PORT = 9464
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # Seconds
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# ==========================================
+# SPANS
+# ==========================================
+class _NoopSpan:
+    """What every span is while tracing is off: accepts everything, records nothing, and is falsy
+    (so `if span:` skips attributes that cost something to compute)."""
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, name, value=1):
+        pass
+
+    def start(self, parent=None):
+        return self
+
+    def finish(self, error=None):
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+class Span:
+    """
+    One timed stage. Used as a context manager it becomes the parent of the spans opened inside it
+    (same thread or copied context); `start`/`finish` serve callbacks that cannot wrap the stage.
+    """
+    __slots__ = ("tracer", "name", "attributes", "trace_id", "span_id", "parent_id", "start_time", "duration",
+                 "error", "_start", "_token")
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = os.urandom(8).hex()
+        self.trace_id = self.parent_id = self.error = self._token = None
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, value=1):
+        """Increments a counter attribute (e.g. streamed tokens)."""
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def start(self, parent=None):
+        parent = parent or _current_span.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        return self
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.error = error if isinstance(error, str) else type(error).__name__
+        self.tracer.export(self)
+
+    def __enter__(self):
+        self.start()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        _current_span.reset(self._token)
+        self.finish(exc)
+        return False
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id, "name": self.name,
+                "start": round(self.start_time, 6), "duration_ms": round(self.duration * 1000, 3),
+                "error": self.error, **self.attributes}
+
+# ==========================================
+# TRACER
+# ==========================================
+class Tracer:
+    def __init__(self):
+        self.exporters = []
+
+    @property
+    def enabled(self):
+        return bool(self.exporters)
+
+    def span(self, name, **attributes):
+        """`with tracer.span("retrieve", queries=8) as span: ... span.set(hits=3)`"""
+        if not self.exporters:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def current(self):
+        """The innermost open span (no-op if none), to annotate it from code that did not open it."""
+        return _current_span.get() or NOOP_SPAN
+
+    def traced(self, name=None):
+        """Decorator: runs the function in a span named after it."""
+        def decorator(function):
+            span_name = name or function.__name__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.exporters:
+                    return function(*args, **kwargs)
+                with Span(self, span_name, {}):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def bind(self, function):
+        """
+        Carries the current span into another thread (e.g. a ThreadPoolExecutor task),
+        so the spans opened there keep their parent.
+        """
+        if not self.exporters:
+            return function
+        context = contextvars.copy_context()
+        return lambda *args, **kwargs: context.copy().run(function, *args, **kwargs)
+
+    def export(self, span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:  # Tracing must never break the pipeline
+                print(f"Trace exporter {type(exporter).__name__} failed: {e}")  # Debugging
+
+    def add_exporter(self, exporter):
+        if not self.exporters:
+            atexit.register(self.close)
+        self.exporters.append(exporter)
+
+    def configure(self, spec=None):
+        """
+        Adds the exporters described by `spec` (default: the RAG_TRACE environment variable), e.g.
+        "jsonl:traces.jsonl,prometheus:9464". Nothing (tracing off) if empty.
+        """
+        spec = os.environ.get(TRACE_ENV, "") if spec is None else spec
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            kind, _, value = item.partition(":")
+            if kind == "jsonl":
+                self.add_exporter(JsonlExporter(value or "traces.jsonl"))
+            elif kind == "prometheus":
+                host, _, port = value.rpartition(":")
+                self.add_exporter(PrometheusExporter(int(port or PROMETHEUS_PORT), host or "127.0.0.1"))
+            else:
+                raise ValueError(f"Unknown trace exporter '{kind}' (expected jsonl:PATH or prometheus:[HOST:]PORT)")
+        return self
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+
+tracer = Tracer()
+configure = tracer.configure
+
+# ==========================================
+# EXPORTERS
+# ==========================================
+class JsonlExporter:
+    """Appends one JSON line per finished span."""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8", buffering=1)  # Line-buffered: a crash loses no finished span
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self.lock:
+            self.file.write(line + "\n")
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class PrometheusExporter:
+    """
+    Aggregates spans per name (duration histogram, error count, sum of every numeric attribute)
+    and serves them in the Prometheus text format on http://host:port/metrics.
+    """
+    def __init__(self, port=PROMETHEUS_PORT, host="127.0.0.1", buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.stats = {}  # span name -> {"count", "errors", "sum", "buckets", "attributes"}
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # Scrapes are not worth a line each
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]  # The one picked by the OS if port was 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Prometheus metrics on http://{host}:{self.port}/metrics")  # Debugging
+
+    def export(self, span):
+        with self.lock:
+            stats = self.stats.get(span.name)
+            if stats is None:
+                stats = self.stats[span.name] = {"count": 0, "errors": 0, "sum": 0.0,
+                                                 "buckets": [0] * len(self.buckets), "attributes": {}}
+            stats["count"] += 1
+            stats["errors"] += span.error is not None
+            stats["sum"] += span.duration
+            for i, bound in enumerate(self.buckets):
+                if span.duration <= bound:
+                    stats["buckets"][i] += 1
+            for name, value in span.attributes.items():
+                if isinstance(value, (int, float)):  # bool included: a True cache_hit counts 1
+                    stats["attributes"][name] = stats["attributes"].get(name, 0) + value
+
+    def render(self):
+        lines = ["# HELP rag_span_duration_seconds Duration of each pipeline stage.",
+                 "# TYPE rag_span_duration_seconds histogram"]
+        with self.lock:
+            stats_by_name = sorted(self.stats.items())
+            for name, stats in stats_by_name:
+                span = _label(name)
+                for bound, count in zip(self.buckets, stats["buckets"]):
+                    lines.append(f'rag_span_duration_seconds_bucket{{span="{span}",le="{bound}"}} {count}')
+                lines.append(f'rag_span_duration_seconds_bucket{{span="{span}",le="+Inf"}} {stats["count"]}')
+                lines.append(f'rag_span_duration_seconds_sum{{span="{span}"}} {stats["sum"]:.6f}')
+                lines.append(f'rag_span_duration_seconds_count{{span="{span}"}} {stats["count"]}')
+            lines += ["# HELP rag_span_errors_total Stages that raised.", "# TYPE rag_span_errors_total counter"]
+            lines += [f'rag_span_errors_total{{span="{_label(name)}"}} {stats["errors"]}' for name, stats in stats_by_name]
+            lines += ["# HELP rag_span_attribute_total Sum of a numeric span attribute (tokens, chunks, cache hits...).",
+                      "# TYPE rag_span_attribute_total counter"]
+            lines += [f'rag_span_attribute_total{{span="{_label(name)}",attribute="{_label(attribute)}"}} {float(value):g}'
+                      for name, stats in stats_by_name for attribute, value in sorted(stats["attributes"].items())]
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# ==========================================
+# LANGCHAIN / LANGGRAPH CALLBACKS
+# ==========================================
+_handler_class = None
+
+def langchain_callbacks():
+    """
+    Callback handlers (for `config={"callbacks": ...}`) turning LangChain retriever and LLM runs into spans,
+    with their chunk counts and token usage. Empty while tracing is off.
+    """
+    global _handler_class
+    if not tracer.exporters:
+        return []
+    if _handler_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler  # Only the LangChain pipelines need it
+
+        class TracingCallbackHandler(BaseCallbackHandler):
+            def __init__(self):
+                self.spans = {}  # run id -> open span
+
+            def _start(self, name, run_id, parent_run_id, **attributes):
+                self.spans[run_id] = tracer.span(name, **attributes).start(self.spans.get(parent_run_id))
+
+            def _finish(self, run_id, error=None, **attributes):
+                span = self.spans.pop(run_id, None)
+                if span is not None:
+                    span.set(**attributes)
+                    span.finish(error)
+
+            def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+                # Named after the retriever class, so the parts of an ensemble are told apart
+                self._start("retrieve", run_id, parent_run_id, retriever=kwargs.get("name") or "", query_chars=len(query))
+
+            def on_retriever_end(self, documents, *, run_id, **kwargs):
+                self._finish(run_id, chunks=len(documents))
+
+            def on_retriever_error(self, error, *, run_id, **kwargs):
+                self._finish(run_id, error)
+
+            def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+                self._start("llm", run_id, parent_run_id, prompts=len(prompts), prompt_chars=sum(map(len, prompts)))
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+                self._start("llm", run_id, parent_run_id, prompts=len(messages))
+
+            def on_llm_new_token(self, token, *, run_id, **kwargs):
+                span = self.spans.get(run_id)
+                if span is not None:
+                    if "first_token_ms" not in span.attributes:
+                        span.set(first_token_ms=round((time.perf_counter() - span._start) * 1000, 1))
+                    span.add("streamed_tokens")
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                usage = (response.llm_output or {}).get("token_usage") or {}
+                prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+                if prompt_tokens is None:  # Chat models report usage on the message
+                    metadata = [getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                                for generations in response.generations for generation in generations]
+                    if any(metadata):
+                        prompt_tokens = sum(m.get("input_tokens", 0) for m in metadata)
+                        completion_tokens = sum(m.get("output_tokens", 0) for m in metadata)
+                tokens = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens} if prompt_tokens is not None else {}
+                self._finish(run_id, **tokens)
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._finish(run_id, error)
+
+        _handler_class = TracingCallbackHandler
+    return [_handler_class()]
@@ -0,0 +1,184 @@
+# ==========================================
+# WIKIPEDIA CORPUS LOADER
+# Fetches a list of pages concurrently through an on-disk HTTP cache (ETag / Last-Modified),
+# or reads them from a local dump, and keeps the vector store on disk so reruns
+# neither scrape nor embed again. Works offline from the cache or a dump.
+# ==========================================
+import hashlib
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import bs4
+from langchain_core.documents import Document
+from langchain_core.vectorstores import InMemoryVectorStore
+from tracing import tracer
+
+WIKI_BASE_URL = "https://en.wikipedia.org/wiki/"
+CACHE_DIR = "./wiki_cache"
+CACHE_MAX_AGE = 24 * 3600  # Seconds during which a cached page is used without asking the server
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 30
+USER_AGENT = "RAG-wikipedia-loader/1.0 (educational project)"  # Wikipedia rejects requests without one
+
+# ==========================================
+# HELPERS
+# ==========================================
+def page_url(page):
+    """Accepts a full URL or a page title ("Zinedine Zidane")."""
+    return page if page.startswith(("http://", "https://")) else WIKI_BASE_URL + page.strip().replace(" ", "_")
+
+def _atomic_write(path, data):
+    """Writes to a temporary file first so a crash never leaves a half-written file."""
+    with open(path + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(path + ".tmp", path)
+
+def html_to_document(html, url):
+    """Keeps the main content of the article only (the "bodyContent" element)."""
+    soup = bs4.BeautifulSoup(html, "html.parser", parse_only=bs4.SoupStrainer(id="bodyContent"))
+    title = bs4.BeautifulSoup(html, "html.parser", parse_only=bs4.SoupStrainer("title")).get_text().strip()
+    return Document(page_content=soup.get_text("\n", strip=True), metadata={"source": url, "title": title})
+
+# ==========================================
+# HTTP CACHE
+# ==========================================
+class PageCache:
+    """
+    One HTML file and one JSON header file per URL. Fresh entries are served as is; stale ones are
+    revalidated with If-None-Match / If-Modified-Since, so an unchanged page costs a 304 and no download.
+    """
+    def __init__(self, directory=CACHE_DIR, max_age=CACHE_MAX_AGE, offline=False):
+        self.directory = directory
+        self.max_age = max_age
+        self.offline = offline  # Never touch the network: cached pages only
+        self.hits = self.revalidated = self.downloaded = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".html"), os.path.join(self.directory, key + ".json")
+
+    def _load(self, url):
+        html_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            with open(html_path, "rb") as file:
+                return meta, file.read()
+        except (OSError, ValueError):
+            return None, None
+
+    def _store(self, url, html, headers):
+        html_path, meta_path = self._paths(url)
+        _atomic_write(html_path, html)
+        meta = {"url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified"),
+                "fetched_at": time.time()}
+        _atomic_write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def fetch(self, url):
+        """Returns the page HTML (bytes), or None if it is neither cached nor reachable."""
+        meta, html = self._load(url)
+        if html is not None and (self.offline or time.time() - meta["fetched_at"] < self.max_age):
+            self.hits += 1
+            return html
+        if self.offline:
+            print(f"Not cached, skipped (offline): {url}")  # Debugging
+            return None
+
+        request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+        if html is not None:
+            if meta.get("etag"):
+                request.add_header("If-None-Match", meta["etag"])
+            if meta.get("last_modified"):
+                request.add_header("If-Modified-Since", meta["last_modified"])
+        try:
+            with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+                body = response.read()
+                self._store(url, body, response.headers)
+                self.downloaded += 1
+                return body
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and html is not None:  # Not modified: the cached copy is fresh again
+                self._store(url, html, {"ETag": e.headers.get("ETag") or meta.get("etag"),
+                                        "Last-Modified": e.headers.get("Last-Modified") or meta.get("last_modified")})
+                self.revalidated += 1
+                return html
+            error = e
+        except (urllib.error.URLError, OSError) as e:
+            error = e
+        if html is not None:  # Server unreachable: a stale copy is better than nothing
+            print(f"Using stale cached copy of {url} ({error}).")  # Debugging
+            self.hits += 1
+            return html
+        print(f"Could not fetch {url}: {error}")  # Debugging
+        return None
+
+def fetch_pages(pages, cache, max_workers=FETCH_WORKERS):
+    """Fetches pages (titles or URLs) concurrently and returns one Document per page that could be loaded."""
+    urls = list(dict.fromkeys(page_url(page) for page in pages))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        bodies = list(executor.map(cache.fetch, urls))
+    print(f"Loaded {sum(body is not None for body in bodies)}/{len(urls)} pages "
+          f"({cache.hits} from cache, {cache.revalidated} revalidated, {cache.downloaded} downloaded).")  # Debugging
+    return [html_to_document(body, url) for url, body in zip(urls, bodies) if body is not None]
+
+def load_dump(path):
+    """
+    Reads pages from a local dump: a single saved .html page, or a .jsonl file with one
+    {"url" or "title", "html" or "text"} object per line.
+    """
+    if path.endswith((".html", ".htm")):
+        with open(path, "rb") as file:
+            return [html_to_document(file.read(), "file://" + os.path.abspath(path))]
+    docs = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            url = record.get("url") or page_url(record["title"])
+            if "html" in record:
+                docs.append(html_to_document(record["html"], url))
+            else:
+                docs.append(Document(page_content=record["text"], metadata={"source": url, "title": record.get("title", url)}))
+    print(f"Loaded {len(docs)} pages from {path}.")  # Debugging
+    return docs
+
+# ==========================================
+# PERSISTENT VECTOR STORE
+# ==========================================
+def chunk_id(doc):
+    """Content address of a chunk: the same text from the same page keeps the same id (and embedding)."""
+    return hashlib.sha256((doc.metadata.get("source", "") + "\0" + doc.page_content).encode("utf-8")).hexdigest()
+
+def sync_vector_store(splits, embeddings, store_path):
+    """
+    Loads the vector store saved at `store_path` and brings it in line with `splits`:
+    only chunks not stored yet are embedded, and chunks no longer in the corpus are removed.
+    """
+    if os.path.exists(store_path):
+        vector_store = InMemoryVectorStore.load(store_path, embeddings)
+    else:
+        vector_store = InMemoryVectorStore(embeddings)
+
+    wanted = {}
+    for doc in splits:
+        wanted.setdefault(chunk_id(doc), doc)
+    stale = [i for i in vector_store.store if i not in wanted]
+    new_ids = [i for i in wanted if i not in vector_store.store]
+
+    if stale:
+        vector_store.delete(stale)
+    if new_ids:
+        vector_store.add_documents([wanted[i] for i in new_ids], ids=new_ids)
+    if stale or new_ids or not os.path.exists(store_path):
+        vector_store.dump(store_path + ".tmp")
+        os.replace(store_path + ".tmp", store_path)
+
+    tracer.current().set(chunks_reused=len(wanted) - len(new_ids), chunks_embedded=len(new_ids), chunks_removed=len(stale))
+    print(f"Vector store: {len(wanted) - len(new_ids)} chunks reused, {len(new_ids)} embedded, "
+          f"{len(stale)} removed.")  # Debugging
+    return vector_store
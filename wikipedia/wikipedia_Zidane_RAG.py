@@ -1,25 +1,48 @@
 # ==========================================
 # RAG SYSTEM FOR WIKIPEDIA Q&A
-# Scrapes Wikipedia's "Zidane" page and allows users to ask questions.
+# Loads Wikipedia pages ("Zidane" by default) and allows users to ask questions.
 # ==========================================
 # SOURCES:
 # MAIN GUIDE: https://python.langchain.com/docs/tutorials/rag/
 # ==========================================
 
 import os
+import sys
+import argparse
 import getpass
-import bs4
+import time
 from typing_extensions import List, TypedDict
 
 # LangChain Imports
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_core.vectorstores import InMemoryVectorStore
-from langchain_community.document_loaders import WebBaseLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langgraph.graph import START, StateGraph
-from langchain import hub
+from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.documents import Document
 
+# Local Imports
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repository root, for the shared tracing.py
+from tracing import tracer, TRACE_ENV, langchain_callbacks # Per-stage spans (off unless RAG_TRACE or --trace names an exporter)
+from wiki_loader import PageCache, fetch_pages, load_dump, sync_vector_store, CACHE_DIR, CACHE_MAX_AGE
+
+# ==========================================
+# COMMAND LINE
+# ==========================================
+
+parser = argparse.ArgumentParser(description="Ask questions about Wikipedia pages.")
+parser.add_argument("--pages", nargs="+", default=["Zinedine_Zidane"], help="Page titles or URLs to load")
+parser.add_argument("--dump", help="Load pages from a local .html or .jsonl dump instead of Wikipedia")
+parser.add_argument("--offline", action="store_true", help="Never use the network: cached pages only")
+parser.add_argument("--refresh", action="store_true", help="Revalidate every cached page with the server")
+parser.add_argument("--trace", default=os.environ.get(TRACE_ENV, ""),
+                    help="Trace exporters, e.g. 'jsonl:traces.jsonl,prometheus:9464' (default: $RAG_TRACE, off if empty)")
+args = parser.parse_args()
+tracer.configure(args.trace)
+
+# Where the embedded chunks are kept between runs (fetched pages go to wiki_loader's CACHE_DIR)
+EMBEDDING_MODEL = "text-embedding-3-large"
+VECTOR_STORE_PATH = f"./wiki_store/{EMBEDDING_MODEL}.json"
+
 # ==========================================
 # SETTING UP OPENAI API KEY
 # ==========================================
@@ -35,23 +58,24 @@ if not os.environ.get("OPENAI_API_KEY"):
 llm = ChatOpenAI(model="gpt-4o-mini")
 
 # Load OpenAI embeddings for vector storage
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-
-# Initialize in-memory vector store
-vector_store = InMemoryVectorStore(embeddings)
+embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
 
 # ==========================================
-# SCRAPE WIKIPEDIA (ZIDANE PAGE)
+# LOAD WIKIPEDIA PAGES (CACHED)
 # ==========================================
 
-print("Scraping Wikipedia's Zidane page...")
-
-loader = WebBaseLoader(
-    web_paths=("https://en.wikipedia.org/wiki/Zinedine_Zidane",),
-    bs_kwargs=dict(parse_only=bs4.SoupStrainer(id="bodyContent"))  # We will extract the main content only
-)
+with tracer.span("load_pages") as span:
+    if args.dump:
+        docs = load_dump(args.dump)
+    else:
+        print(f"Loading {len(args.pages)} Wikipedia page(s)...")
+        cache = PageCache(CACHE_DIR, max_age=0 if args.refresh else CACHE_MAX_AGE, offline=args.offline)
+        docs = fetch_pages(args.pages, cache)  # Concurrent, unchanged pages come from the cache
+        span.set(cache_hits=cache.hits, revalidated=cache.revalidated, downloaded=cache.downloaded)
+    span.set(pages=len(docs))
 
-docs = loader.load()
+if not docs:
+    raise SystemExit("No page could be loaded (offline with an empty cache?).")
 
 # ==========================================
 # TEXT CHUNKING & INDEXING
@@ -60,18 +84,27 @@ docs = loader.load()
 print("Splitting text into chunks...")
 
 text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-all_splits = text_splitter.split_documents(docs)
+with tracer.span("split", pages=len(docs)) as span:
+    all_splits = text_splitter.split_documents(docs)
+    span.set(chunks=len(all_splits))
 
 print(f"Indexed {len(all_splits)} document chunks.")
 
-# Add chunks to vector store
-vector_store.add_documents(documents=all_splits)
+# Load the saved vector store, embedding only the chunks it does not have yet
+os.makedirs(os.path.dirname(VECTOR_STORE_PATH), exist_ok=True)
+with tracer.span("index", chunks=len(all_splits)):
+    vector_store = sync_vector_store(all_splits, embeddings, VECTOR_STORE_PATH)
 
 # ==========================================
 # PROMPT SETUP FOR Q&A
 # ==========================================
 
-prompt = hub.pull("rlm/rag-prompt")
+# The "rlm/rag-prompt" of the LangChain hub, kept here so no run (--offline included) has to download it
+RAG_PROMPT = ("You are an assistant for question-answering tasks. Use the following pieces of retrieved context "
+              "to answer the question. If you don't know the answer, just say that you don't know. "
+              "Use three sentences maximum and keep the answer concise.\n"
+              "Question: {question} \nContext: {context} \nAnswer:")
+prompt = ChatPromptTemplate.from_messages([("human", RAG_PROMPT)])
 
 # ==========================================
 # APPLICATION STATE
@@ -91,7 +124,9 @@ def retrieve(state: State):
     Retrieves relevant documents from the vector store based on the question.
     If the context does not contain the answer, simply respond: "I don't know based on the provided corpus."
     """
-    retrieved_docs = vector_store.similarity_search(state["question"])
+    with tracer.span("retrieve") as span:
+        retrieved_docs = vector_store.similarity_search(state["question"])
+        span.set(chunks=len(retrieved_docs))
     return {"context": retrieved_docs}
 
 # ==========================================
@@ -99,10 +134,15 @@ def retrieve(state: State):
 # ==========================================
 
 def generate(state: State):
-    """Generates an answer using the retrieved context."""
+    """
+    Generates an answer using the retrieved context.
+    When the graph runs with stream_mode="messages", LangGraph forwards the tokens of this call as they arrive.
+    """
     docs_content = "\n\n".join(doc.page_content for doc in state["context"])
     messages = prompt.invoke({"question": state["question"], "context": docs_content})
-    response = llm.invoke(messages)
+    # The LLM span (tokens, time to first token) comes from the callbacks of the graph run
+    with tracer.span("generate", chunks=len(state["context"]), context_chars=len(docs_content)):
+        response = llm.invoke(messages)
     return {"answer": response.content}
 
 # ==========================================
@@ -126,7 +166,20 @@ while True:
         print("Thanks for using us!")
         break
 
-    # Get response from the RAG system
-    response = graph.invoke({"question": question})
-
-    print(f"💡 Answer: {response['answer']}")
+    # Stream the answer from the RAG system token by token
+    print("💡 Answer: ", end="", flush=True)
+    start_time = time.perf_counter()
+    first_token_ms = None
+    # LangGraph runs the nodes in copies of this context: their spans are children of the question's span
+    with tracer.span("question") as span:
+        for message, metadata in graph.stream({"question": question}, stream_mode="messages",
+                                              config={"callbacks": langchain_callbacks()}):
+            if metadata.get("langgraph_node") == "generate" and message.content:
+                if first_token_ms is None:
+                    first_token_ms = (time.perf_counter() - start_time) * 1000
+                    span.set(first_token_ms=round(first_token_ms, 1))
+                print(message.content, end="", flush=True)
+    print()
+
+    if first_token_ms is not None:
+        print(f"(first token after {first_token_ms:.0f} ms, full answer in {(time.perf_counter() - start_time) * 1000:.0f} ms)")